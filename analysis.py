@@ -0,0 +1,243 @@
+# Crystal Butler
+# 2026/10/18
+# The label set analysis as an in-process API: score all pairs of labels, cluster them,
+# test for cluster coherence and weight the labels, with every option passed explicitly.
+#
+# Shelling out to the scripts reloads the embeddings every time. Instead, load the embeddings
+# once and analyze as many sets as needed:
+#
+#     import analysis
+#     analyzer = analysis.Analyzer.load('word_embeddings/vectors.txt')
+#     result = analyzer.analyze(['happy', 'glad', 'joyful', 'sad'])
+#     result['pct'], result['weights']
+#
+# pipeline.py is a command line wrapper around analyze_label_set() and write_results(), or for
+# label tables (see label_table.py), write_table_results().
+# Only numpy, scipy and the modules of this repo are imported; matplotlib is only imported
+# when a dendrogram is drawn, and pandas isn't needed at all.
+
+import os
+import numpy as np
+import embedding_store
+import similarity
+import clustering
+import label_weights
+import label_table
+import duplicates
+import large_sets
+import metrics
+
+# Constant, used to format output file names.
+SUFFIX = ".txt"
+# The results tables written for a label table, in place of files for each set, and their columns.
+TABLES = {'sets': clustering.STATS_COLUMNS, 'weights': label_weights.WEIGHTS_COLUMNS, 'oov': ['set_id', 'label']}
+
+
+def read_label_list(in_file):
+    """Read one label per line, skipping blank lines. Duplicate labels are kept."""
+    with open(in_file, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def analyze_label_set(W, vocab, ID, labels, dendro_cutoff=clustering.DENDRO_CUTOFF, unique=False, large_set=None):
+    """Score, cluster and weight one label set. All results are returned in a dictionary;
+    clustering results are None for sets with fewer than two labels in the vocabulary.
+    With unique, the set is scored and clustered from its distinct labels and their counts.
+    Sets with more than large_set labels in the vocabulary are clustered by large_sets.py."""
+    idx, oov_mask = similarity.label_indices(vocab, labels)
+    result = _new_result(ID, labels, oov_mask)
+    if large_set is not None and len(result['labels']) > large_set:
+        return analyze_large_labels(W, idx, result, dendro_cutoff)
+    if unique:
+        return analyze_unique_labels(W, idx, result, dendro_cutoff)
+    with metrics.stage('score'):
+        S = np.asarray(similarity.similarity_matrix(W, idx), dtype=np.float64)
+    return analyze_scores(result, S, dendro_cutoff)
+
+
+def analyze_model_sets(W, vocab, ID, labels, dendro_cutoff=clustering.DENDRO_CUTOFF):
+    """Analyze one label set with each model of an ensemble (see ensemble.py) separately, from
+    every model's similarity matrix computed in one batched pass. Returns a list of results,
+    one per model, as analyze_label_set() returns them."""
+    idx, oov_mask = similarity.label_indices(vocab, labels)
+    with metrics.stage('score'):
+        S_models = W.model_matrices(idx)
+    return [analyze_scores(_new_result(ID, labels, oov_mask), np.asarray(S, dtype=np.float64), dendro_cutoff)
+            for S in S_models]
+
+
+def _new_result(ID, labels, oov_mask):
+    return {
+        'ID': ID,
+        'labels': [label for label, oov in zip(labels, oov_mask) if not oov],
+        'oov': [label for label, oov in zip(labels, oov_mask) if oov],
+        'linkage': None,
+    }
+
+
+def analyze_scores(result, S, dendro_cutoff=clustering.DENDRO_CUTOFF):
+    """Finish analyze_label_set() from the similarity matrix S of the set's labels in the vocabulary."""
+    metrics.count('pairs_scored', len(S) * (len(S) - 1) // 2)
+    metrics.count('oov_labels', len(result['oov']))
+    with metrics.stage('weights'):
+        result['weights'] = label_weights.label_weights(result['labels'], S)
+    if len(result['labels']) < 2:
+        return result
+    result['linkage'], result['cophenetic'], result['membership'], result['pct'] = clustering.cluster_scores(
+        similarity.condensed_scores(S), dendro_cutoff)
+    metrics.count('sets_passed' if clustering.classify_pass_fail(result['pct']) == 'pass' else 'sets_failed')
+    return result
+
+
+def analyze_unique_labels(W, idx, result, dendro_cutoff=clustering.DENDRO_CUTOFF):
+    """Finish analyze_label_set() from the set's distinct labels and their counts."""
+    unique, inverse, counts = duplicates.unique_labels(result['labels'])
+    # Each distinct label's first position in the set.
+    unique_idx = np.asarray(idx)[np.unique(inverse, return_index=True)[1]]
+    with metrics.stage('score'):
+        S_u = np.asarray(similarity.similarity_matrix(W, unique_idx), dtype=np.float64)
+    metrics.count('pairs_scored', len(unique) * (len(unique) - 1) // 2)
+    metrics.count('oov_labels', len(result['oov']))
+    with metrics.stage('weights'):
+        result['weights'] = label_weights.label_weights_with_counts(unique, counts, S_u)
+    if len(result['labels']) < 2:
+        return result
+    distances_u, self_distances = duplicates.unique_distances(S_u, counts)
+    with metrics.stage('linkage'):
+        linkage_matrix, linkage_u = duplicates.unique_linkage(distances_u, self_distances, inverse, counts)
+    with metrics.stage('cophenet'):
+        cophenetic_coefficient = duplicates.weighted_cophenet(linkage_u, distances_u, self_distances, counts)
+    cluster_membership, pct = clustering.calculate_membership(linkage_matrix, dendro_cutoff)
+    result['linkage'] = linkage_matrix
+    result['cophenetic'] = cophenetic_coefficient
+    result['membership'] = cluster_membership
+    result['pct'] = pct
+    metrics.count('sets_passed' if clustering.classify_pass_fail(pct) == 'pass' else 'sets_failed')
+    return result
+
+
+def analyze_large_labels(W, idx, result, dendro_cutoff=clustering.DENDRO_CUTOFF):
+    """Finish analyze_label_set() from the set's distinct labels, without any pairwise arrays."""
+    if getattr(W, 'combine', 'mean') != 'mean':
+        raise ValueError("Large sets can only be clustered from an ensemble's mean scores.")
+    unique, inverse, counts = duplicates.unique_labels(result['labels'])
+    E = large_sets.label_vectors(W, np.asarray(idx)[np.unique(inverse, return_index=True)[1]])
+    metrics.count('pairs_scored', len(unique) * (len(unique) - 1) // 2)
+    metrics.count('oov_labels', len(result['oov']))
+    if len(unique) < 2:
+        # A single distinct label has no pairs to stream, so it's weighted from its own score.
+        with metrics.stage('weights'):
+            result['weights'] = label_weights.label_weights_with_counts(unique, counts, E @ E.T)
+    if len(result['labels']) < 2:
+        return result
+    with metrics.stage('linkage'):
+        linkage_matrix, cophenetic_coefficient, totals = large_sets.cluster_large_set(E, inverse, counts)
+    with metrics.stage('weights'):
+        result['weights'] = label_weights.label_weights_from_totals(unique, totals)
+    cluster_membership, pct = clustering.calculate_membership(linkage_matrix, dendro_cutoff)
+    result['linkage'] = linkage_matrix
+    result['cophenetic'] = cophenetic_coefficient
+    result['membership'] = cluster_membership
+    result['pct'] = pct
+    metrics.count('sets_passed' if clustering.classify_pass_fail(pct) == 'pass' else 'sets_failed')
+    return result
+
+
+def make_output_subdirs(output_dir, stats_only=False):
+    clustering.make_output_subdirs(output_dir, stats_only)
+    for subdir in ['Errors', 'Weights']:
+        if not os.path.exists(os.path.join(output_dir, subdir)):
+            os.makedirs(os.path.join(output_dir, subdir))
+
+
+def write_results(result, output_dir, dendro_cutoff=clustering.DENDRO_CUTOFF, stats_only=False):
+    """Write out a set's results under output_dir, in the layout make_output_subdirs() creates,
+    and return the list of files written."""
+    with metrics.stage('write'):
+        return _write_results(result, output_dir, dendro_cutoff, stats_only)
+
+
+def _write_results(result, output_dir, dendro_cutoff, stats_only):
+    ID = result['ID']
+    outputs = []
+    if result['oov']:
+        errors_file = os.path.join(output_dir, 'Errors', ID + ".errors" + SUFFIX)
+        with open(errors_file, 'w') as e:
+            for label in result['oov']:
+                e.write("{}\n".format(label))
+        outputs.append(errors_file)
+    weights_file = os.path.join(output_dir, 'Weights', ID + ".weights" + SUFFIX)
+    label_weights.write_weights(weights_file, result['weights'])
+    outputs.append(weights_file)
+    if result['linkage'] is None:
+        print(f"Set {ID} has fewer than two labels in the vocabulary, so it can't be clustered.")
+        return outputs
+    stats_printout = clustering.format_cluster_stats(result['cophenetic'], result['membership'], result['pct'])
+    dendro_file, stats_file = clustering.make_output_filenames(output_dir, result['pct'], ID)
+    with open(stats_file, 'w') as f_stat:
+        f_stat.write(stats_printout)
+    outputs.append(stats_file)
+    if stats_only:
+        linkage_file = clustering.make_linkage_filename(output_dir, ID)
+        clustering.save_linkage(linkage_file, result['linkage'], result['labels'], dendro_cutoff, result['pct'])
+        outputs.append(linkage_file)
+    else:
+        clustering.plot_dendrogram(result['linkage'], np.array(result['labels']), ID, dendro_cutoff, dendro_file)
+        outputs.append(dendro_file)
+    return outputs
+
+
+def open_tables(output_dir, fmt='csv', shard_rows=None):
+    """Open the results tables in output_dir, as label_table.TableWriters by table name."""
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    return {name: label_table.TableWriter(os.path.join(output_dir, name), columns, fmt, shard_rows)
+            for name, columns in TABLES.items()}
+
+
+def write_table_results(tables, result):
+    """Write out a set's results as rows of the results tables: one row in sets, whether or not
+    the set could be clustered, and a row in weights and oov for each of its labels."""
+    with metrics.stage('write'):
+        ID = result['ID']
+        tables['oov'].write_rows([ID, label] for label in result['oov'])
+        tables['weights'].write_rows(label_weights.weights_rows(ID, result['weights']))
+        if result.get('pct') is None:
+            print(f"Set {ID} has fewer than two labels in the vocabulary, so it can't be clustered.")
+        tables['sets'].write(clustering.stats_row(ID, len(result['labels']), len(result['oov']), result.get('cophenetic'),
+                                                  result.get('membership'), result.get('pct')))
+
+
+class Analyzer:
+    """Embeddings loaded once, for scoring, clustering and weighting any number of label sets."""
+
+    def __init__(self, W, vocab):
+        self.W = W
+        self.vocab = vocab
+
+    @classmethod
+    def load(cls, vectors_file, words=None, precision=None, workers=None):
+        """Load a text vectors file or an embedding store, as embedding_store.load_embeddings() does."""
+        return cls(*embedding_store.load_embeddings(vectors_file, words, workers, precision))
+
+    def __contains__(self, word):
+        return word in self.vocab
+
+    def score_pair(self, word1, word2):
+        """The cosine similarity of two words, or -100 if either isn't in the vocabulary."""
+        return similarity.pair_score(self.W, self.vocab, word1, word2)
+
+    def score_set(self, labels, unique=False):
+        """Score all pairs of labels in a set. Returns the labels in the vocabulary, a mask of the
+        labels that aren't, and the condensed scores, in the order create_all_pairs.py pairs them."""
+        return similarity.score_label_set(self.W, self.vocab, labels, unique)
+
+    def weights(self, labels, top_k=None):
+        """The set's (label, weight) pairs, from highest to lowest weight, as sum_label_weights.py ranks them."""
+        idx, oov_mask = similarity.label_indices(self.vocab, labels)
+        S = np.asarray(similarity.similarity_matrix(self.W, idx), dtype=np.float64)
+        return label_weights.label_weights([label for label, oov in zip(labels, oov_mask) if not oov], S, top_k)
+
+    def analyze(self, labels, ID='', dendro_cutoff=clustering.DENDRO_CUTOFF, unique=False, large_set=None):
+        """Score, cluster and weight a label set, as analyze_label_set() does."""
+        return analyze_label_set(self.W, self.vocab, ID, labels, dendro_cutoff, unique, large_set)
@@ -0,0 +1,258 @@
+# Crystal Butler
+# 2026/10/18
+# Time the pipeline stages on synthetic data, and compare the timings to a saved baseline.
+#
+# Synthetic word vectors and label set directories are generated offline, at one or more
+# scales, in work_dir. At each scale, every pipeline script is run on them in turn, as it
+# would be from the command line, and timed:
+#   -- embedding_store: converting the text vectors file to an embedding store
+#   -- create_all_pairs
+#   -- word_pair_distance, scoring one pair at a time, and with --batched
+#   -- cluster_synonymy_scores, with --stats_only
+#   -- sum_label_weights
+#   -- pipeline, with --stats_only, from the text vectors file and from the store
+# The library functions the scripts rely on are also timed in process: loading text vectors
+# and stores, scoring whole label sets, building linkage matrices and weighting labels.
+#
+# Each timing is the best of --repeat runs. Results are written as JSON to --output; pass
+# a previous results file as --baseline, and any timing that has slowed down by more than
+# --tolerance is reported as a regression, and the script exits with status 1.
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+
+# Named scales: vocabulary size, vector dimension, number of sets, labels per set.
+SCALES = {
+    'small': {'vocab_size': 20000, 'dim': 50, 'set_count': 50, 'set_size': 30},
+    'medium': {'vocab_size': 100000, 'dim': 100, 'set_count': 200, 'set_size': 60},
+    'large': {'vocab_size': 400000, 'dim': 300, 'set_count': 1000, 'set_size': 100},
+}
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_vectors(vectors_file, vocab_size, dim, seed):
+    """Write a text vectors file of random vectors, in the GloVe format read by word_pair_distance.py."""
+    rng = np.random.RandomState(seed)
+    with open(vectors_file, 'w') as o:
+        for start in range(0, vocab_size, 10000):
+            block = rng.standard_normal((min(10000, vocab_size - start), dim))
+            for i, row in enumerate(block):
+                o.write("w{} {}\n".format(start + i, " ".join("%.6f" % value for value in row)))
+
+
+def make_label_sets(wordlists_dir, set_count, set_size, vocab_size, duplicate_rate, oov_rate, seed):
+    """Write set_count label lists of set_size labels each. Labels are drawn from a small
+    per-set pool of vocabulary words, so that sets have some structure; a share of them
+    repeat an earlier label in the set, and a share aren't in the vocabulary at all."""
+    rng = np.random.RandomState(seed)
+    if not os.path.exists(wordlists_dir):
+        os.makedirs(wordlists_dir)
+    for set_number in range(set_count):
+        pool = rng.randint(0, vocab_size, size=max(2, set_size // 2))
+        labels = []
+        for _ in range(set_size):
+            draw = rng.random_sample()
+            if labels and draw < duplicate_rate:
+                labels.append(labels[rng.randint(len(labels))])
+            # A duplicate drawn with nothing to repeat yet falls through to a pool word, not an OOV label.
+            elif duplicate_rate <= draw < duplicate_rate + oov_rate:
+                labels.append("oov{}".format(rng.randint(1000000)))
+            else:
+                labels.append("w{}".format(rng.choice(pool)))
+        with open(os.path.join(wordlists_dir, "{:04d}_labels.txt".format(set_number)), 'w') as o:
+            for label in labels:
+                o.write("{}\n".format(label))
+
+
+def time_best(func, repeat):
+    """Return the shortest of repeat timings of func(), in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_script(name, *script_args):
+    """Run one of the pipeline scripts to completion, raising an error if it fails."""
+    subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, name)] + list(script_args), check=True,
+                   stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+
+
+def fresh(path):
+    """Remove a previous run's output directory, so that every run does the same work."""
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    return path
+
+
+def stage_timings(scale_dir, repeat, skip=()):
+    """Time each pipeline script on one scale's synthetic data, except those named in skip."""
+    vectors_file = os.path.join(scale_dir, 'vectors.txt')
+    store_dir = os.path.join(scale_dir, 'store')
+    wordlists_dir = os.path.join(scale_dir, 'lists')
+    pairs_dir = os.path.join(scale_dir, 'pairs')
+    scores_dir = os.path.join(scale_dir, 'scores')
+    stages = [
+        ('embedding_store', lambda: run_script('embedding_store.py', vectors_file, fresh(store_dir))),
+        ('create_all_pairs', lambda: run_script('create_all_pairs.py', wordlists_dir, fresh(pairs_dir))),
+        ('word_pair_distance', lambda: run_script('word_pair_distance.py', vectors_file, '--source_dir', pairs_dir,
+                                                  '--output_dir', fresh(os.path.join(scale_dir, 'scores_lines')))),
+        ('word_pair_distance_batched', lambda: run_script('word_pair_distance.py', vectors_file, '--source_dir', pairs_dir,
+                                                          '--output_dir', fresh(scores_dir), '--batched')),
+        ('cluster_synonymy_scores', lambda: run_script('cluster_synonymy_scores.py', os.path.join(scores_dir, 'Score_Lists'),
+                                                       os.path.join(scores_dir, 'Label_Lists'),
+                                                       fresh(os.path.join(scale_dir, 'clustering')), '--stats_only')),
+        ('sum_label_weights', lambda: run_script('sum_label_weights.py', os.path.join(scores_dir, 'Label_and_Score_Lists'),
+                                                 fresh(os.path.join(scale_dir, 'sums')))),
+        ('pipeline', lambda: run_script('pipeline.py', vectors_file, wordlists_dir,
+                                        fresh(os.path.join(scale_dir, 'pipeline')), '--stats_only')),
+        ('pipeline_store', lambda: run_script('pipeline.py', store_dir, wordlists_dir,
+                                              fresh(os.path.join(scale_dir, 'pipeline_store')), '--stats_only')),
+    ]
+    timings = {}
+    for name, func in stages:
+        if name in skip:
+            continue
+        timings[name] = time_best(func, repeat)
+        print(f"  {name}: {timings[name]:.3f}s")
+    return timings
+
+
+def kernel_timings(scale_dir, repeat, skip=()):
+    """Time the library functions behind the scripts, in process, except those named in skip."""
+    sys.path.insert(0, SCRIPT_DIR)
+    import embedding_store
+    import similarity
+    import clustering
+    import label_weights
+    vectors_file = os.path.join(scale_dir, 'vectors.txt')
+    store_dir = os.path.join(scale_dir, 'store')
+    wordlists_dir = os.path.join(scale_dir, 'lists')
+    if not embedding_store.is_store(store_dir):
+        embedding_store.convert_vectors(vectors_file, store_dir)
+    label_sets = []
+    for filename in sorted(os.listdir(wordlists_dir)):
+        with open(os.path.join(wordlists_dir, filename), 'r') as f:
+            label_sets.append([line.strip() for line in f if line.strip()])
+    W, vocab = embedding_store.load_embeddings(store_dir)
+    scored = [similarity.score_label_set(W, vocab, labels) for labels in label_sets]
+    distances = [clustering.scores_to_distances(scores.astype(np.float64)) for _, _, scores in scored]
+    matrices = [(in_labels, similarity.similarity_matrix(W, similarity.label_indices(vocab, in_labels)[0]))
+                for in_labels, _, _ in scored]
+    kernels = [
+        ('load_text_vectors', lambda: embedding_store.load_embeddings(vectors_file)),
+        ('load_store', lambda: embedding_store.load_embeddings(store_dir)),
+        ('score_label_sets', lambda: [similarity.score_label_set(W, vocab, labels) for labels in label_sets]),
+        ('build_linkage_matrices', lambda: [clustering.build_linkage_matrix(d) for d in distances if len(d)]),
+        ('label_weights', lambda: [label_weights.label_weights(labels, S) for labels, S in matrices]),
+    ]
+    timings = {}
+    for name, func in kernels:
+        if name in skip:
+            continue
+        timings[name] = time_best(func, repeat)
+        print(f"  {name}: {timings[name]:.3f}s")
+    return timings
+
+
+def machine_info():
+    return {'platform': platform.platform(), 'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+            'python': platform.python_version(), 'numpy': np.__version__}
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of timings that are more than tolerance slower than the baseline."""
+    regressions = []
+    for scale, scale_results in results['scales'].items():
+        base_scale = baseline.get('scales', {}).get(scale)
+        if base_scale is None:
+            continue
+        for name, seconds in scale_results['timings'].items():
+            base_seconds = base_scale['timings'].get(name)
+            if base_seconds is not None and seconds > base_seconds * (1 + tolerance):
+                regressions.append((scale, name, base_seconds, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', help='comma separated scales to run, from: ' + ', '.join(SCALES),
+                        default='small,medium', type=str)
+    parser.add_argument('--vocab_size', help='override the vocabulary size at every scale', default=None, type=int)
+    parser.add_argument('--dim', help='override the vector dimension at every scale', default=None, type=int)
+    parser.add_argument('--set_count', help='override the number of label sets at every scale', default=None, type=int)
+    parser.add_argument('--set_size', help='override the number of labels per set at every scale', default=None, type=int)
+    parser.add_argument('--duplicate_rate', help='the share of labels that repeat an earlier label in their set',
+                        default=0.2, type=float)
+    parser.add_argument('--oov_rate', help='the share of labels that are not in the vocabulary', default=0.02, type=float)
+    parser.add_argument('--seed', help='random seed for the synthetic data', default=0, type=int)
+    parser.add_argument('--repeat', help='the number of times each timing is repeated; the best is kept', default=1, type=int)
+    parser.add_argument('--skip', help='comma separated stages or functions not to time', default='', type=str)
+    parser.add_argument('--work_dir', help='a directory for synthetic data and outputs; by default, a temporary one \
+that is removed afterwards', default=None, type=str)
+    parser.add_argument('--output', help='a file to write the JSON results to', default=None, type=str)
+    parser.add_argument('--baseline', help='a JSON results file from an earlier run to compare against', default=None, type=str)
+    parser.add_argument('--tolerance', help='the fractional slowdown against the baseline reported as a regression',
+                        default=0.2, type=float)
+    args = parser.parse_args()
+    args.skip = set(name for name in args.skip.split(',') if name)
+
+    work_dir = args.work_dir if args.work_dir is not None else tempfile.mkdtemp(prefix='freeres-bench-')
+    results = {'machine': machine_info(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'scales': {}}
+    try:
+        for scale in args.scales.split(','):
+            params = dict(SCALES[scale])
+            for key in params:
+                if getattr(args, key) is not None:
+                    params[key] = getattr(args, key)
+            params.update({'duplicate_rate': args.duplicate_rate, 'oov_rate': args.oov_rate, 'seed': args.seed})
+            scale_dir = os.path.join(work_dir, scale)
+            # Synthetic data is reused from an earlier run in the same work_dir, if it was made with the same parameters.
+            params_file = os.path.join(scale_dir, 'params.json')
+            saved_params = None
+            if os.path.exists(params_file):
+                with open(params_file, 'r') as f:
+                    saved_params = json.load(f)
+            if saved_params != params:
+                print(f"Generating {scale} data: {params}")
+                fresh(scale_dir)
+                os.makedirs(scale_dir)
+                make_vectors(os.path.join(scale_dir, 'vectors.txt'), params['vocab_size'], params['dim'], args.seed)
+                make_label_sets(os.path.join(scale_dir, 'lists'), params['set_count'], params['set_size'],
+                                params['vocab_size'], args.duplicate_rate, args.oov_rate, args.seed)
+                with open(params_file, 'w') as o:
+                    json.dump(params, o)
+            print(f"Timing {scale}:")
+            timings = stage_timings(scale_dir, args.repeat, args.skip)
+            timings.update(kernel_timings(scale_dir, args.repeat, args.skip))
+            results['scales'][scale] = {'params': params, 'timings': timings}
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir)
+
+    if args.output is not None:
+        with open(args.output, 'w') as o:
+            json.dump(results, o, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for scale, name, base_seconds, seconds in regressions:
+            print(f"Regression at {scale} scale: {name} took {seconds:.3f}s, against {base_seconds:.3f}s in the baseline.")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
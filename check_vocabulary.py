@@ -5,42 +5,38 @@
 # This script assumes that files are formatted to be input into create_all_pairs.py.
 # It will take a single file of (ID, label) pairs, or multiple files with labels only.
 # Files must in a dedicated directory, source_dir.
+# The vocabulary is held as a set, so each label is checked in constant time. It's read from vocab_ref,
+# or from the vocab.txt of an embedding store given as vectors_file, without loading any vectors.
+# A vocabulary generated from a text vectors file can be saved with --save_vocab, and passed as
+# vocab_ref on later runs. With --workers, label files are checked in parallel.
+# The labels found in the vocabulary are written to vocab_out once, sorted and without duplicates.
+# With --metrics, the time spent and the words checked and out of vocabulary are recorded per run
+# and per list (see metrics.py).
 
 import os
 import argparse
-
-# Read in options.
-parser = argparse.ArgumentParser()
-parser.add_argument('source_dir', help="a directory containing lists of words to check", type=str)
-parser.add_argument('error_dir', help="a directory where vocabulary errors are written", type=str)
-parser.add_argument('vocab_out', help="a file where words successfully found in the reference vocabulary are saved", default=None, type=str)
-parser.add_argument('--vectors_file', help='a file of word-features vectors', default=None, type=str)
-parser.add_argument('--vocab_ref', help='a file of vocabulary words; if not given, one will be generated \
-from vectors_file', default=None, type=str)
-
-args = parser.parse_args()
+import functools
+import embedding_store
+import metrics
+import parallel
 
 # Constants, used to format output file names.
 ZERO_PAD = 4
 SUFFIX = ".txt"
 
 
-def make_vocab():
-    vals = []
-    vocab = []
-    if(args.vocab_ref is None):
-        with open(args.vectors_file, 'r') as f:
-            for line in f:
-                vals = line.rstrip().split(' ')
-                vocab.append(vals[0])
-            return vocab
+def make_vocab(vectors_file=None, vocab_ref=None, save_vocab=None):
+    """Return the vocabulary as a set of words, from vocab_ref if given, or else from vectors_file."""
+    if(vocab_ref is None):
+        vocab = frozenset(embedding_store.iter_words(vectors_file))
+        if save_vocab is not None:
+            with open(save_vocab, 'w') as o:
+                for word in sorted(vocab):
+                    o.write("{}\n".format(word))
+        return vocab
     else:
-        with open(args.vocab_ref, 'r') as f:
-            for line in f:
-                for line in f:
-                    vals = line.rstrip().split(' ')
-                    vocab.append(vals[0])
-                return vocab
+        with open(vocab_ref, 'r') as f:
+            return frozenset(line.rstrip().split(' ')[0] for line in f)
 
 
 def get_labels(file):
@@ -53,30 +49,79 @@ def get_labels(file):
         return labels
 
 
-# Check a label list against the vocabulary, and write any errors to error_dir.
-def check_vocab(ID, labels, vocab, err_file, write_file):
-    with open(err_file, 'w') as e, open(write_file, 'a') as w:
+# Check a label list against the vocabulary, write any errors to err_file, and return the labels found.
+def check_vocab(ID, labels, vocab, err_file):
+    found = []
+    with open(err_file, 'w') as e:
         for label in labels:
             if (label not in vocab):
                 e.write("{}\n".format(label))
             else:
-                w.write("{}\n".format(label))
+                found.append(label)
+    metrics.count('words_checked', len(labels))
+    metrics.count('oov_words', len(labels) - len(found))
+    return found
 
 
-if __name__ == "__main__":
-    s_dir = os.fsencode(args.source_dir)
+def check_file(filename, source_dir, error_dir):
+    ID = filename.split("_")[0]  # relies on file name beginning with ID_
+    ID = ID.zfill(ZERO_PAD)
+    in_file = os.path.join(source_dir, filename)
+    err_file = os.path.join(error_dir, ID + "_errors" + SUFFIX)
+    with metrics.stage('read'):
+        labels = get_labels(in_file)
+    with metrics.stage('check'):
+        return check_vocab(ID, labels, vocab, err_file)
+
+
+def init_worker(vectors_file, vocab_ref):
+    """Build the vocabulary in a worker process that didn't inherit it from the parent process."""
+    global vocab
+    if 'vocab' not in globals():
+        vocab = make_vocab(vectors_file, vocab_ref)
+
+
+def main():
+    # The vocabulary is a module global, so that forked workers share it.
+    global vocab
+    # Read in options.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source_dir', help="a directory containing lists of words to check", type=str)
+    parser.add_argument('error_dir', help="a directory where vocabulary errors are written", type=str)
+    parser.add_argument('vocab_out', help="a file where words successfully found in the reference vocabulary are saved",
+                        default=None, type=str)
+    parser.add_argument('--vectors_file', help='a file of word-features vectors, or an embedding store \
+created by embedding_store.py', default=None, type=str)
+    parser.add_argument('--vocab_ref', help='a file of vocabulary words; if not given, one will be generated \
+from vectors_file', default=None, type=str)
+    parser.add_argument('--save_vocab', help='a file where a vocabulary generated from vectors_file is saved, for reuse \
+as vocab_ref', default=None, type=str)
+    parser.add_argument('--workers', help='the number of processes used to check label files in parallel', default=1, type=int)
+    parser.add_argument('--metrics', help='a .json or .csv file where run metrics are written', default=None, type=str)
+    parser.add_argument('--profile', help='a file where cProfile stats for the run are written', default=None, type=str)
+    args = parser.parse_args()
+
+    metrics.start(args.metrics, args.profile)
     if ((args.vocab_ref is not None) or (args.vectors_file is not None)):
-        vocab = make_vocab()
+        with metrics.stage('load_vocab'):
+            vocab = make_vocab(args.vectors_file, args.vocab_ref, args.save_vocab)
     else:
         print("Sorry, I need either a vocabulary file or a vectors file. Exiting...")
         exit()
-    for file in os.listdir(s_dir):
-        filename = os.fsdecode(file)
-        if filename.startswith('.'):
-            continue
-        ID = filename.split("_")[0]  # relies on file name beginning with ID_
-        ID = ID.zfill(ZERO_PAD)
-        in_file = os.path.join(args.source_dir, filename)
-        err_file = os.path.join(args.error_dir, ID + "_errors" + SUFFIX)
-        labels = get_labels(in_file)
-        check_vocab(ID, labels, vocab, err_file, args.vocab_out)
+    filenames = [os.fsdecode(file) for file in sorted(os.listdir(os.fsencode(args.source_dir)))]
+    filenames = [filename for filename in filenames if not filename.startswith('.')]
+    found_words = set()
+    check = functools.partial(check_file, source_dir=args.source_dir, error_dir=args.error_dir)
+    for filename, found, error in parallel.map_sets(check, filenames, args.workers, init_worker,
+                                                    (args.vectors_file, args.vocab_ref)):
+        if error is not None:
+            print(f"Unable to check {filename}:\n{error}")
+        else:
+            found_words.update(found)
+    with metrics.stage('write'), open(args.vocab_out, 'w') as w:
+        for word in sorted(found_words):
+            w.write("{}\n".format(word))
+
+
+if __name__ == "__main__":
+    main()
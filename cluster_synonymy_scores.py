@@ -5,31 +5,53 @@
 # Output includes a dendrogram for each input label set, statistics
 # describing the set and a determination as to whether it passes or
 # fails the clustering test for set coherence.
+# With --stats_only, no dendrograms are drawn and matplotlib is never imported;
+# linkage matrices are saved instead, so that dendrograms for any chosen subset
+# of sets can be drawn later with render_dendrograms.py.
+# scores_dir may also be a binary score container written by word_pair_distance.py
+# with --output_format binary. Labels are then read from the container as well, so
+# labels_dir is ignored (pass "-").
+# With --incremental, a manifest of the sets already clustered is kept in clustering_dir
+# (see manifest.py), and sets whose scores and labels haven't changed since they were last
+# clustered with the same --dendro_cutoff and --stats_only are skipped.
+# With --sweep_cutoffs, no statistics or dendrograms are written. Instead, each set is clustered
+# once, and the number of clusters and the largest cluster percentage are found for every cutoff
+# in the grid, along with pass or fail for every threshold in --sweep_pass_pcts. The results are
+# written to clustering_dir as two tab separated tables: sweep_sets.txt, with one row per set and
+# cutoff, and sweep_pass_rates.txt, with the share of sets passing at each cutoff and threshold.
+# Grids are given as comma separated values, or as start:stop:step, including stop.
+# With --table_format, sets read from a binary score container are written as rows of a single
+# statistics table, clustering_dir/sets, in that format (see label_table.py), rather than as a
+# statistics file and dendrogram per set; --shard_rows splits the table into shards.
+# With --metrics, time spent reading, in linkage, fcluster and cophenet and drawing dendrograms,
+# and the sets passed and failed, are recorded per run and per set (see metrics.py).
 
 import os
 import sys
 import argparse
-import pandas as pd
+import functools
 import numpy as np
-import scipy.cluster.hierarchy as sch
-import matplotlib.pyplot as plt
+import parallel
+import score_store
+import label_table
+import manifest
+import metrics
+from clustering import PASS_PCT, PASS_DIR_PCT, DENDRO_CUTOFF, STATS_COLUMNS, stats_row, sweep_cluster_sizes, scores_to_distances, \
+    check_expected_distances_count, build_linkage_matrix, calculate_cluster_stats, format_cluster_stats, \
+    classify_pass_fail, make_output_subdirs, make_output_filenames, plot_dendrogram, make_linkage_filename, save_linkage
 
-parser = argparse.ArgumentParser()
-parser.add_argument('scores_dir', help='full path to a directory containing all pairs synonymy scores', type=str)
-parser.add_argument('labels_dir', help='full path to a directory containing labels for all pairs synonymy scores', type=str)
-parser.add_argument('clustering_dir', help='full path to a directory where clustering output will be written', type=str)
-parser.add_argument('--dendro_cutoff', help='the cutoff value for agglomerative hierarchical clustering', default=0.7275, type=float)
-args = parser.parse_args()
+# Binary score containers opened by get_score_reader(), by path.
+score_readers = {}
 
-def make_input_lists():
+def make_input_lists(scores_dir, labels_dir):
     scores_files = []
     labels_files = []
-    for entry in sorted(os.listdir(args.scores_dir)):
-        if os.path.isfile(os.path.join(args.scores_dir, entry)):
+    for entry in sorted(os.listdir(scores_dir)):
+        if os.path.isfile(os.path.join(scores_dir, entry)):
             if not entry.startswith('.'):
                 scores_files.append(entry)
-    for entry in sorted(os.listdir(args.labels_dir)):
-        if os.path.isfile(os.path.join(args.labels_dir, entry)):
+    for entry in sorted(os.listdir(labels_dir)):
+        if os.path.isfile(os.path.join(labels_dir, entry)):
             if not entry.startswith('.'):
                 labels_files.append(entry)
     if (len(scores_files) < 1 or len(labels_files) < 1):
@@ -44,164 +66,273 @@ def make_input_lists():
 def make_arrays(scores_path, labels_path):
     """Read scores and labels in from files. Convert them to ndarrays for clustering.
     Transform similarity (proximity) scores to distances."""
+    import pandas as pd
     pairs_scores = pd.read_csv(scores_path, header=None)
     labels = pd.read_csv(labels_path, header=None)
     scores_array = np.array(pairs_scores[0][:])
-    scores_norm = normalize_array(scores_array)
-    distances_array = 1 - scores_norm
+    distances_array = scores_to_distances(scores_array)
     labels_array = np.array(labels[0][:])
     assert len(pairs_scores[0]) == len(distances_array), "Scores dataframe and distances array should be the same length."
     assert len(labels[0]) == len(labels_array), "Labels dataframe and labels array should be the same length."
     return distances_array, labels_array
 
 
-def normalize_array(scores_array):
-    scores_norm = (scores_array - np.min(scores_array))/np.ptp(scores_array)
-    scores_norm = scores_norm.round(decimals=6)  # clean up floating point errors and reduce significant digits
-    return scores_norm
+def extract_dendro_name(labels_file, scores_file):
+    labels_name = os.path.basename(labels_file)
+    scores_name = os.path.basename(scores_file)
+    labels_prefix = labels_name.split('_')[0].split('.')[0]
+    scores_prefix = scores_name.split('_')[0].split('.')[0]
+    assert labels_prefix == scores_prefix, "Labels and scores should have the same file name prefix."
+    return labels_prefix
 
 
-def check_expected_distances_count(labels_array):
-    """The distances array should be a serialized upper triangular label x label matrix,
-       with entries below the diagonal omitted."""
-    expected_distances_count = int((len(labels_array) * (len(labels_array) - 1)) / 2)
-    return expected_distances_count
+def read_set(files):
+    """Read one label set from its scores and labels files."""
+    scores_file, labels_file = files
+    with metrics.stage('read'):
+        distances_array, labels_array = make_arrays(scores_file, labels_file)
+    # Title the dendrogram, using the labels file name.
+    dendro_name = extract_dendro_name(labels_file, scores_file)
+    return distances_array, labels_array, dendro_name, scores_file
 
 
-def build_linkage_matrix(distances_array):
-    """Create the linkage matrix Z (perform hierarchical/agglomerative clustering)."""
-    linkage_matrix = sch.linkage(distances_array, 'average')
-    # Fix distances that have become less than 0 due to floating point errors.
-    for i in range(len(linkage_matrix)):
-        if linkage_matrix[i][2] < 0:
-            linkage_matrix[i][2] = 0
-    return linkage_matrix
+def cluster_set(files, clustering_dir, dendro_cutoff=DENDRO_CUTOFF, stats_only=False):
+    """Cluster one label set from its scores and labels files."""
+    return cluster_arrays(*read_set(files), clustering_dir, dendro_cutoff, stats_only)
 
 
-def extract_dendro_name(labels_file, scores_file):
-    labels_name = os.path.basename(labels_file)
-    scores_name = os.path.basename(scores_file)
-    labels_prefix = labels_name.split('_')[0]
-    scores_prefix = scores_name.split('_')[0]
-    assert labels_prefix == scores_prefix, "Labels and scores should have the same file name prefix."
-    return labels_prefix
+def get_score_reader(scores_dir):
+    """Open a score container once per process; open archives aren't shared with forked workers."""
+    if scores_dir not in score_readers:
+        score_readers[scores_dir] = score_store.ScoreReader(scores_dir)
+    return score_readers[scores_dir]
+
+
+def read_stored_set(ID, scores_dir):
+    """Read one label set from a binary score container."""
+    with metrics.stage('read'):
+        labels_array, scores_array, _ = get_score_reader(scores_dir).read(ID)
+    distances_array = scores_to_distances(scores_array.astype(np.float64))
+    return distances_array, labels_array, ID, ID
+
+
+def cluster_stored_set(ID, scores_dir, clustering_dir, dendro_cutoff=DENDRO_CUTOFF, stats_only=False):
+    """Cluster one label set read from a binary score container."""
+    return cluster_arrays(*read_stored_set(ID, scores_dir), clustering_dir, dendro_cutoff, stats_only)
+
+
+def table_set_row(ID, scores_dir, dendro_cutoff=DENDRO_CUTOFF):
+    """Cluster one label set read from a binary score container, returning its row of the statistics table."""
+    with metrics.stage('read'):
+        labels_array, scores_array, oov = get_score_reader(scores_dir).read(ID)
+    if len(labels_array) < 2:
+        return stats_row(ID, len(labels_array), len(oov))
+    distances_array = scores_to_distances(scores_array.astype(np.float64))
+    linkage_matrix = build_linkage_matrix(distances_array)
+    cophenetic_coefficient, cluster_membership, pct = calculate_cluster_stats(linkage_matrix, distances_array, dendro_cutoff)
+    metrics.count('sets_passed' if classify_pass_fail(pct) == 'pass' else 'sets_failed')
+    return stats_row(ID, len(labels_array), len(oov), cophenetic_coefficient, cluster_membership, pct)
+
+
+def run_table(tasks, scores_dir, clustering_dir, dendro_cutoff=DENDRO_CUTOFF, table_format='csv', shard_rows=None,
+              workers=1):
+    """Cluster every set in a binary score container, and write out the statistics table."""
+    row_func = functools.partial(table_set_row, scores_dir=scores_dir, dendro_cutoff=dendro_cutoff)
+    with label_table.TableWriter(os.path.join(clustering_dir, 'sets'), STATS_COLUMNS, table_format,
+                                 shard_rows) as table:
+        for ID, row, error in parallel.map_sets(row_func, tasks, workers):
+            if error is not None:
+                print(f'Unable to cluster {ID}:\n{error}')
+            else:
+                table.write(row)
+
+
+def manifest_key(task):
+    """Sets are recorded in the manifest by container ID, or by scores file name."""
+    return task if isinstance(task, str) else os.path.basename(task[0])
+
 
+def cluster_arrays(distances_array, labels_array, dendro_name, source, clustering_dir, dendro_cutoff=DENDRO_CUTOFF,
+                   stats_only=False):
+    """Cluster one label set and save out its statistics and dendrogram.
+    Returns a message if the set's scores and labels don't match up, otherwise None,
+    along with the list of files written."""
+    expected_distances_count = check_expected_distances_count(labels_array)
+    if (expected_distances_count != len(distances_array)):
+        return f'The number of values in the {source} distances list is {len(distances_array)}, but it should be {expected_distances_count}.', []
 
-def calculate_cluster_stats(linkage_matrix, distances_array):
-    """Calculate clustering statistics for cophenetic coefficient correlation, 
-    the number of clusters, the count of labels per cluster and the 
-    percent membershp in the largest cluster."""
-    clusters = sch.fcluster(linkage_matrix, args.dendro_cutoff, criterion='distance')
-    cluster_enumeration = np.unique(clusters)
-    # Calculate the cophenetic correlation coefficient statistic: closer to 1 is better.
-    cophenetic_coefficient, _ = sch.cophenet(linkage_matrix, distances_array)
-    # Get membership counts for each cluster.
-    cluster_membership = {}
-    for value in cluster_enumeration:
-        member_count = np.count_nonzero(clusters == value)
-        cluster_membership[value] = member_count
-    # Calculate the percentage membership in the largest cluster.
-    c_max = max(cluster_membership.values())
-    c_sum = sum(cluster_membership.values())
-    pct = 100 * (c_max / c_sum)
-    return cophenetic_coefficient, cluster_membership, pct
-
-
-def make_output_subdirs():
-    if not os.path.exists(args.clustering_dir):
-        os.makedirs(args.clustering_dir)
-    if not os.path.exists(os.path.join(args.clustering_dir, 'Dendrograms/Pass')):
-        os.makedirs(os.path.join(args.clustering_dir, 'Dendrograms/Pass'))
-    if not os.path.exists(os.path.join(args.clustering_dir, 'Dendrograms/Fail')):
-        os.makedirs(os.path.join(args.clustering_dir, 'Dendrograms/Fail'))
-    if not os.path.exists(os.path.join(args.clustering_dir, 'Statistics/Pass')):
-        os.makedirs(os.path.join(args.clustering_dir, 'Statistics/Pass'))
-    if not os.path.exists(os.path.join(args.clustering_dir, 'Statistics/Fail')):
-        os.makedirs(os.path.join(args.clustering_dir, 'Statistics/Fail'))
-
-
-def format_cluster_stats(cophenetic_coefficient, cluster_membership, pct):
-    """Pretty print layout for clustering statistics; can be appended to the dendrogram or saved out as a file."""
-    stats_printout = '---------------------------------------------------------------------------------\n'
-    stats_printout += 'Agglomerative Hierarchical Clustering Statistics\n---------------------------------------------------------------------------------\n'
-    stats_printout += ('Cophenectic correlation coefficient: ' + str(cophenetic_coefficient) + '\n')
-    stats_printout += ('Cluster: Count\n')
-    for key in cluster_membership.keys():
-        stats_printout += (str(key) + ': ' + str(cluster_membership[key]) + '\n')
-    cluster_max_membership = max(cluster_membership.items(), key=lambda x : x[1])
-    stats_printout += ('Cluster ' + str(cluster_max_membership[0]) + ' with ' + str(cluster_max_membership[1]) + ' members has ' + str(pct) + '% of the membership.\n')
-    pass_fail = classify_pass_fail(pct)
-    stats_printout += ('Cluster coherence test: ' + pass_fail)
-    return stats_printout
-
-
-def classify_pass_fail(pct):
-    """The clustering coherence test is based on membership percentage in the largest cluster."""
-    pass_fail = 'pass' if pct >= 75 else 'fail'
-    return pass_fail
-
-
-def make_output_filenames(pct, dendro_name):
-    """Write statistics and dendrograms to Pass or Fail directories based on the clustering coherence test."""
-    if pct >= 66:
-        dendro_file = os.path.join(args.clustering_dir, 'Dendrograms/Pass/' + dendro_name + '.png')
-        stats_file = os.path.join(args.clustering_dir, 'Statistics/Pass/' + dendro_name + '.txt')
+    linkage_matrix = build_linkage_matrix(distances_array)
+    assert (linkage_matrix.shape[0] + 1) == (len(labels_array)), "The linkage matrix and labels array have mismatched lengths."
+    cophenetic_coefficient, cluster_membership, pct = calculate_cluster_stats(linkage_matrix, distances_array, dendro_cutoff)
+    stats_printout = format_cluster_stats(cophenetic_coefficient, cluster_membership, pct)
+    metrics.count('sets_passed' if classify_pass_fail(pct) == 'pass' else 'sets_failed')
+
+    # Save out the statistics and plot.
+    dendro_file, stats_file = make_output_filenames(clustering_dir, pct, dendro_name)
+    with open(stats_file, 'w') as f_stat:
+        f_stat.write(stats_printout)
+    if stats_only:
+        linkage_file = make_linkage_filename(clustering_dir, dendro_name)
+        save_linkage(linkage_file, linkage_matrix, labels_array, dendro_cutoff, pct)
+        return None, [stats_file, linkage_file]
+    plot_dendrogram(linkage_matrix, labels_array, dendro_name, dendro_cutoff, dendro_file)
+    return None, [stats_file, dendro_file]
+
+
+def parse_grid(grid):
+    """Parse a grid of values given as "a,b,c" or as "start:stop:step", including stop."""
+    if ':' in grid:
+        start, stop, step = (float(value) for value in grid.split(':'))
+        return np.round(np.arange(start, stop + step / 2, step), 10)
+    return np.array([float(value) for value in grid.split(',')])
+
+
+# Columns of sweep_sets.txt, before a pass column for each threshold.
+SWEEP_COLUMNS = ['set', 'cutoff', 'labels', 'clusters', 'largest_cluster', 'pct']
+
+
+def sweep_set(task, cutoffs, scores_dir=None):
+    """Cluster one label set, and find its cluster sizes for every cutoff in the sweep grid.
+    Returns a message if the set's scores and labels don't match up, otherwise None,
+    along with the set's name, label count, cluster counts and largest cluster sizes."""
+    distances_array, labels_array, dendro_name, source = (read_stored_set(task, scores_dir) if isinstance(task, str)
+                                                          else read_set(task))
+    expected_distances_count = check_expected_distances_count(labels_array)
+    if (expected_distances_count != len(distances_array)):
+        return f'The number of values in the {source} distances list is {len(distances_array)}, but it should be {expected_distances_count}.', None
+    linkage_matrix = build_linkage_matrix(distances_array)
+    cluster_counts, largest = sweep_cluster_sizes(linkage_matrix, cutoffs)
+    return None, (dendro_name, len(labels_array), cluster_counts, largest)
+
+
+def run_sweep(tasks, cutoffs, pass_pcts, clustering_dir, scores_dir=None, workers=1):
+    """Sweep all sets over the cutoff and pass threshold grids, and write out the results tables.
+    Tasks are set IDs in the binary score container scores_dir, or (scores file, labels file) pairs."""
+    import pandas as pd
+    rows = []
+    sweep_func = functools.partial(sweep_set, cutoffs=cutoffs, scores_dir=scores_dir)
+    for task, result, error in parallel.map_sets(sweep_func, tasks, workers):
+        if error is not None:
+            print(f'Unable to cluster {task}:\n{error}')
+            continue
+        message, swept = result
+        if message is not None:
+            print(message)
+            continue
+        dendro_name, labels_count, cluster_counts, largest = swept
+        rows.append(pd.DataFrame({'set': dendro_name, 'cutoff': cutoffs, 'labels': labels_count,
+                                  'clusters': cluster_counts, 'largest_cluster': largest,
+                                  'pct': 100 * (largest / labels_count)}))
+    if rows:
+        sets = pd.concat(rows, ignore_index=True)
     else:
-        dendro_file = os.path.join(args.clustering_dir, 'Dendrograms/Fail/' + dendro_name + '.png')
-        stats_file = os.path.join(args.clustering_dir, 'Statistics/Fail/' + dendro_name + '.txt')
-    return dendro_file, stats_file
+        print("No sets could be swept, so the sweep tables are empty.")
+        sets = pd.DataFrame(columns=SWEEP_COLUMNS)
+    for pass_pct in pass_pcts:
+        sets[f'pass_{pass_pct:g}'] = sets['pct'] >= pass_pct
+    sets.to_csv(os.path.join(clustering_dir, 'sweep_sets.txt'), sep='\t', index=False)
+    # Pass rates for every cutoff and threshold, from a sets x cutoffs matrix of percentages.
+    pct = sets['pct'].values.astype(np.float64).reshape(len(rows), len(cutoffs))
+    passed = (pct[:, :, np.newaxis] >= pass_pcts).sum(axis=0)
+    with np.errstate(invalid='ignore'):
+        # With no sets, pass rates are NaN.
+        pass_rate = passed.ravel() / len(rows)
+    rates = pd.DataFrame({'cutoff': np.repeat(cutoffs, len(pass_pcts)), 'pass_pct': np.tile(pass_pcts, len(cutoffs)),
+                          'sets': len(rows), 'passed': passed.ravel(), 'pass_rate': pass_rate})
+    rates.to_csv(os.path.join(clustering_dir, 'sweep_pass_rates.txt'), sep='\t', index=False)
+    print(f"Swept {len(rows)} sets over {len(cutoffs)} cutoffs and {len(pass_pcts)} pass thresholds.")
 
 
-if __name__ == '__main__':
-    make_output_subdirs()
-    if (os.path.isdir(args.scores_dir) and os.path.isdir(args.labels_dir) and os.path.isdir(args.clustering_dir)):
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scores_dir', help='full path to a directory containing all pairs synonymy scores, \
+or to a binary score container', type=str)
+    parser.add_argument('labels_dir', help='full path to a directory containing labels for all pairs synonymy scores', type=str)
+    parser.add_argument('clustering_dir', help='full path to a directory where clustering output will be written', type=str)
+    parser.add_argument('--dendro_cutoff', help='the cutoff value for agglomerative hierarchical clustering',
+                        default=DENDRO_CUTOFF, type=float)
+    parser.add_argument('--stats_only', help='save statistics and linkage matrices, but skip drawing dendrograms',
+                        action='store_true')
+    parser.add_argument('--workers', help='the number of processes used to cluster label sets in parallel', default=1, type=int)
+    parser.add_argument('--incremental', help='skip sets that are unchanged since they were last clustered into \
+clustering_dir', action='store_true')
+    parser.add_argument('--sweep_cutoffs', help='a grid of cutoff values to evaluate, instead of clustering at dendro_cutoff',
+                        default=None, type=str)
+    parser.add_argument('--sweep_pass_pcts', help='a grid of largest cluster percentages needed to pass, for \
+--sweep_cutoffs', default=f'{PASS_DIR_PCT},{PASS_PCT}', type=str)
+    parser.add_argument('--table_format', help='write the statistics of sets in a binary score container as a single \
+table in this format', default=None, choices=label_table.FORMATS)
+    parser.add_argument('--shard_rows', help='split the statistics table into shards of this many rows', default=None, type=int)
+    parser.add_argument('--metrics', help='a .json or .csv file where run metrics are written', default=None, type=str)
+    parser.add_argument('--profile', help='a file where cProfile stats for the run are written', default=None, type=str)
+    args = parser.parse_args()
+
+    metrics.start(args.metrics, args.profile)
+    if args.table_format is not None and not score_store.is_score_store(args.scores_dir):
+        parser.error("--table_format needs scores_dir to be a binary score container.")
+    if args.table_format is not None and args.incremental:
+        parser.error("--incremental can't be used with --table_format, since the statistics table is rewritten.")
+    if args.sweep_cutoffs is not None or args.table_format is not None:
+        if not os.path.exists(args.clustering_dir):
+            os.makedirs(args.clustering_dir)
+    else:
+        make_output_subdirs(args.clustering_dir, args.stats_only)
+    if score_store.is_score_store(args.scores_dir):
+        """We are reading word pair synonymy scores and their associated labels from a binary container."""
+        with score_store.ScoreReader(args.scores_dir) as reader:
+            tasks = reader.ids()
+            # Container sets are checked using the CRCs stored in the archive, without reading them.
+            input_hashes = {ID: reader.checksum(ID) for ID in tasks} if args.incremental else {}
+        cluster_func = functools.partial(cluster_stored_set, scores_dir=args.scores_dir,
+                                         clustering_dir=args.clustering_dir, dendro_cutoff=args.dendro_cutoff,
+                                         stats_only=args.stats_only)
+    elif (os.path.isdir(args.scores_dir) and os.path.isdir(args.labels_dir) and os.path.isdir(args.clustering_dir)):
         """We are reading from one or more files containing word pair synonymy scores
         and their associated labels, clustering the distances between scores,
         generating a dendrogram and some statistics from the clustering, and writing
         that output to a file."""
-        scores_files, labels_files = make_input_lists()
-        for i in range(len(scores_files)):
-            scores_file = os.path.join(args.scores_dir, scores_files[i])
-            labels_file = os.path.join(args.labels_dir, labels_files[i])
-            distances_array, labels_array = make_arrays(scores_file, labels_file)
-            expected_distances_count = check_expected_distances_count(labels_array)
-            if (expected_distances_count != len(distances_array)):
-                print(f'The number of values in the {scores_file} distances list is {len(distances_array)}, but it should be {expected_distances_count}.')
+        scores_files, labels_files = make_input_lists(args.scores_dir, args.labels_dir)
+        tasks = [(os.path.join(args.scores_dir, scores_files[i]), os.path.join(args.labels_dir, labels_files[i]))
+                 for i in range(len(scores_files))]
+        input_hashes = {task: manifest.hash_files(task) for task in tasks} if args.incremental else {}
+        cluster_func = functools.partial(cluster_set, clustering_dir=args.clustering_dir,
+                                         dendro_cutoff=args.dendro_cutoff, stats_only=args.stats_only)
+    else:
+        print("Be sure to include options for scores, labels and output directories when calling this module.")
+        sys.exit()
+
+    if args.sweep_cutoffs is not None:
+        run_sweep(tasks, parse_grid(args.sweep_cutoffs), parse_grid(args.sweep_pass_pcts), args.clustering_dir,
+                  args.scores_dir, args.workers)
+        return
+    if args.table_format is not None:
+        run_table(tasks, args.scores_dir, args.clustering_dir, args.dendro_cutoff, args.table_format, args.shard_rows,
+                  args.workers)
+        return
+
+    run_manifest = None
+    if args.incremental:
+        run_manifest = manifest.Manifest(args.clustering_dir, "cluster_synonymy_scores")
+        run_manifest.set_params({'dendro_cutoff': args.dendro_cutoff, 'stats_only': args.stats_only})
+        remaining = [task for task in tasks if not run_manifest.is_current(manifest_key(task), input_hashes[task])]
+        print(f"{len(tasks) - len(remaining)} of {len(tasks)} sets are unchanged, and will be skipped.")
+        tasks = remaining
+
+    # Sets are clustered independently, so they can be spread across worker processes.
+    for task, result, error in parallel.map_sets(cluster_func, tasks, args.workers):
+        if error is not None:
+            print(f'Unable to cluster {task}:\n{error}')
+            continue
+        message, outputs = result
+        if message is not None:
+            print(message)
+            if args.workers <= 1:
                 input("Press Enter to continue...")
-                continue
-            
-            linkage_matrix = build_linkage_matrix(distances_array)
-            assert (linkage_matrix.shape[0] + 1) == (len(labels_array)), "The linkage matrix and labels array have mismatched lengths."
-            cophenetic_coefficient, cluster_membership, pct = calculate_cluster_stats(linkage_matrix, distances_array)
-            stats_printout = format_cluster_stats(cophenetic_coefficient, cluster_membership, pct)
-
-            # Title the dendrogram, using the labels file name.
-            dendro_name = extract_dendro_name(labels_file, scores_file)
-            # Set up the plot.
-            fig, ax = plt.subplots(figsize=(14, 8.5))  #(width, height) in inches
-            title = "Image: " + dendro_name
-            plt.title(title, fontsize=18)
-            plt.rc('ytick',labelsize=14)
-            y_label = 'Cophenetic Coefficient (Cutoff: ' + str(args.dendro_cutoff) + ')'
-            plt.ylabel(y_label, fontsize=16)
-            plt.axhline(y=args.dendro_cutoff, color="grey", linestyle="--")
-            # plt.figtext(0.02, 0.12, stats_printout, horizontalalignment='left', verticalalignment='center', fontsize=14)
-            plt.subplots_adjust(bottom=0.22, top=0.95, right=0.98, left=0.06)
-            # Create the dendrogram, with a cutoff specified during module invocation.
-            dendro = sch.dendrogram(linkage_matrix, labels=labels_array, color_threshold=args.dendro_cutoff, \
-                leaf_font_size=14, leaf_rotation=70, count_sort='ascending', ax=ax)
-            ax.set_ylim(0, 1)
-
-            # Save out the plot and statistics.
-            dendro_file, stats_file = make_output_filenames(pct, dendro_name)
-            with open(stats_file, 'w') as f_stat:
-                f_stat.write(stats_printout)
-            try:
-                plt.savefig(dendro_file, format='png')
-            except:
-                print(f'Unable to save {dendro_file}!')
-            # plt.show()  # uncomment to display the plot before continuing
-            plt.close()
+        elif run_manifest is not None:
+            run_manifest.record(manifest_key(task), input_hashes[task], outputs)
+    if run_manifest is not None:
+        run_manifest.close()
 
-    else:
-        print("Be sure to include options for scores, labels and output directories when calling this module.")
\ No newline at end of file
+
+if __name__ == '__main__':
+    main()
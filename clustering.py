@@ -0,0 +1,197 @@
+# Crystal Butler
+# 2020/06/15
+# Hierarchical agglomerative clustering of label sets from their synonymy scores,
+# with the statistics used by the cluster coherence test.
+# These functions are shared by cluster_synonymy_scores.py and pipeline.py.
+
+import os
+import numpy as np
+import scipy.cluster.hierarchy as sch
+import metrics
+
+# Percentage membership in the largest cluster needed to pass the cluster coherence test.
+PASS_PCT = 75
+# Percentage membership needed for output to be filed under the Pass directories.
+PASS_DIR_PCT = 66
+# The default cutoff value for agglomerative hierarchical clustering.
+DENDRO_CUTOFF = 0.7275
+
+
+def normalize_array(scores_array):
+    scores_norm = (scores_array - np.min(scores_array))/np.ptp(scores_array)
+    scores_norm = scores_norm.round(decimals=6)  # clean up floating point errors and reduce significant digits
+    return scores_norm
+
+
+def scores_to_distances(scores_array):
+    """Transform similarity (proximity) scores to distances."""
+    return 1 - normalize_array(scores_array)
+
+
+def check_expected_distances_count(labels_array):
+    """The distances array should be a serialized upper triangular label x label matrix,
+       with entries below the diagonal omitted."""
+    expected_distances_count = int((len(labels_array) * (len(labels_array) - 1)) / 2)
+    return expected_distances_count
+
+
+def build_linkage_matrix(distances_array):
+    """Create the linkage matrix Z (perform hierarchical/agglomerative clustering)."""
+    with metrics.stage('linkage'):
+        linkage_matrix = sch.linkage(distances_array, 'average')
+    # Fix distances that have become less than 0 due to floating point errors.
+    for i in range(len(linkage_matrix)):
+        if linkage_matrix[i][2] < 0:
+            linkage_matrix[i][2] = 0
+    return linkage_matrix
+
+
+def calculate_cluster_stats(linkage_matrix, distances_array, dendro_cutoff):
+    """Calculate clustering statistics for cophenetic coefficient correlation,
+    the number of clusters, the count of labels per cluster and the
+    percent membershp in the largest cluster."""
+    # Calculate the cophenetic correlation coefficient statistic: closer to 1 is better.
+    with metrics.stage('cophenet'):
+        cophenetic_coefficient, _ = sch.cophenet(linkage_matrix, distances_array)
+    cluster_membership, pct = calculate_membership(linkage_matrix, dendro_cutoff)
+    return cophenetic_coefficient, cluster_membership, pct
+
+
+def cluster_scores(scores_array, dendro_cutoff=DENDRO_CUTOFF):
+    """Cluster a set from its condensed similarity scores. Returns the linkage matrix, cophenetic
+    correlation coefficient, count of labels per cluster and percent membership in the largest cluster."""
+    distances_array = scores_to_distances(scores_array)
+    linkage_matrix = build_linkage_matrix(distances_array)
+    cophenetic_coefficient, cluster_membership, pct = calculate_cluster_stats(linkage_matrix, distances_array,
+                                                                              dendro_cutoff)
+    return linkage_matrix, cophenetic_coefficient, cluster_membership, pct
+
+
+def calculate_membership(linkage_matrix, dendro_cutoff):
+    """Count the labels per cluster at the cutoff, and the percent membership in the largest cluster."""
+    with metrics.stage('fcluster'):
+        clusters = sch.fcluster(linkage_matrix, dendro_cutoff, criterion='distance')
+    cluster_enumeration = np.unique(clusters)
+    # Get membership counts for each cluster.
+    cluster_membership = {}
+    for value in cluster_enumeration:
+        member_count = np.count_nonzero(clusters == value)
+        cluster_membership[value] = member_count
+    # Calculate the percentage membership in the largest cluster.
+    c_max = max(cluster_membership.values())
+    c_sum = sum(cluster_membership.values())
+    pct = 100 * (c_max / c_sum)
+    return cluster_membership, pct
+
+
+def sweep_cluster_sizes(linkage_matrix, cutoffs):
+    """For each of an array of cutoffs, return the number of flat clusters and the size of the
+    largest one, as fcluster(linkage_matrix, cutoff, criterion='distance') would find them.
+    Average linkage merge heights never decrease, so cutting the tree at a cutoff keeps exactly
+    the merges up to and including that height, and the largest cluster is the biggest formed
+    by any of them; no clustering is repeated."""
+    merges = np.searchsorted(linkage_matrix[:, 2], cutoffs, side='right')
+    largest = np.concatenate([[1], np.maximum.accumulate(linkage_matrix[:, 3])]).astype(int)
+    return len(linkage_matrix) + 1 - merges, largest[merges]
+
+
+def format_cluster_stats(cophenetic_coefficient, cluster_membership, pct):
+    """Pretty print layout for clustering statistics; can be appended to the dendrogram or saved out as a file."""
+    stats_printout = '---------------------------------------------------------------------------------\n'
+    stats_printout += 'Agglomerative Hierarchical Clustering Statistics\n---------------------------------------------------------------------------------\n'
+    stats_printout += ('Cophenectic correlation coefficient: ' + str(cophenetic_coefficient) + '\n')
+    stats_printout += ('Cluster: Count\n')
+    for key in cluster_membership.keys():
+        stats_printout += (str(key) + ': ' + str(cluster_membership[key]) + '\n')
+    cluster_max_membership = max(cluster_membership.items(), key=lambda x : x[1])
+    stats_printout += ('Cluster ' + str(cluster_max_membership[0]) + ' with ' + str(cluster_max_membership[1]) + ' members has ' + str(pct) + '% of the membership.\n')
+    pass_fail = classify_pass_fail(pct)
+    stats_printout += ('Cluster coherence test: ' + pass_fail)
+    return stats_printout
+
+
+# Columns of the per-set statistics table written in place of statistics files.
+STATS_COLUMNS = ['set_id', 'labels', 'oov_labels', 'cophenetic', 'clusters', 'largest_cluster', 'pct', 'pass_fail',
+                 'filed_as']
+
+
+def stats_row(set_id, labels_count, oov_count, cophenetic_coefficient=None, cluster_membership=None, pct=None):
+    """One row of the statistics table, in STATS_COLUMNS order. Sets that couldn't be clustered
+    have empty statistics."""
+    if pct is None:
+        return [set_id, labels_count, oov_count, None, None, None, None, None, None]
+    return [set_id, labels_count, oov_count, cophenetic_coefficient, len(cluster_membership),
+            max(cluster_membership.values()), pct, classify_pass_fail(pct),
+            'Pass' if pct >= PASS_DIR_PCT else 'Fail']
+
+
+def classify_pass_fail(pct):
+    """The clustering coherence test is based on membership percentage in the largest cluster."""
+    pass_fail = 'pass' if pct >= PASS_PCT else 'fail'
+    return pass_fail
+
+
+def make_output_subdirs(clustering_dir, stats_only=False):
+    subdirs = ['Statistics/Pass', 'Statistics/Fail']
+    subdirs += ['Linkage'] if stats_only else ['Dendrograms/Pass', 'Dendrograms/Fail']
+    for subdir in subdirs:
+        if not os.path.exists(os.path.join(clustering_dir, subdir)):
+            os.makedirs(os.path.join(clustering_dir, subdir))
+
+
+def make_linkage_filename(clustering_dir, dendro_name):
+    return os.path.join(clustering_dir, 'Linkage', dendro_name + '.npz')
+
+
+def save_linkage(linkage_file, linkage_matrix, labels_array, dendro_cutoff, pct):
+    """Save everything needed to draw a set's dendrogram later, without reclustering."""
+    with metrics.stage('save_linkage'):
+        np.savez(linkage_file, linkage=linkage_matrix, labels=np.asarray(labels_array, dtype=str),
+                 dendro_cutoff=dendro_cutoff, pct=pct)
+
+
+def load_linkage(linkage_file):
+    """Return the linkage matrix, labels, cutoff and largest cluster percentage saved by save_linkage()."""
+    with np.load(linkage_file) as saved:
+        return saved['linkage'], saved['labels'], float(saved['dendro_cutoff']), float(saved['pct'])
+
+
+def make_output_filenames(clustering_dir, pct, dendro_name):
+    """Write statistics and dendrograms to Pass or Fail directories based on the clustering coherence test."""
+    if pct >= PASS_DIR_PCT:
+        dendro_file = os.path.join(clustering_dir, 'Dendrograms/Pass/' + dendro_name + '.png')
+        stats_file = os.path.join(clustering_dir, 'Statistics/Pass/' + dendro_name + '.txt')
+    else:
+        dendro_file = os.path.join(clustering_dir, 'Dendrograms/Fail/' + dendro_name + '.png')
+        stats_file = os.path.join(clustering_dir, 'Statistics/Fail/' + dendro_name + '.txt')
+    return dendro_file, stats_file
+
+
+def plot_dendrogram(linkage_matrix, labels_array, dendro_name, dendro_cutoff, dendro_file):
+    """Draw the dendrogram for one label set and save it as a PNG.
+    matplotlib is only imported when a dendrogram is actually drawn."""
+    with metrics.stage('render'):
+        _plot_dendrogram(linkage_matrix, labels_array, dendro_name, dendro_cutoff, dendro_file)
+
+
+def _plot_dendrogram(linkage_matrix, labels_array, dendro_name, dendro_cutoff, dendro_file):
+    import matplotlib.pyplot as plt
+    # Set up the plot.
+    fig, ax = plt.subplots(figsize=(14, 8.5))  #(width, height) in inches
+    title = "Image: " + dendro_name
+    plt.title(title, fontsize=18)
+    plt.rc('ytick',labelsize=14)
+    y_label = 'Cophenetic Coefficient (Cutoff: ' + str(dendro_cutoff) + ')'
+    plt.ylabel(y_label, fontsize=16)
+    plt.axhline(y=dendro_cutoff, color="grey", linestyle="--")
+    plt.subplots_adjust(bottom=0.22, top=0.95, right=0.98, left=0.06)
+    # Create the dendrogram, with a cutoff specified during module invocation.
+    sch.dendrogram(linkage_matrix, labels=labels_array, color_threshold=dendro_cutoff, \
+        leaf_font_size=14, leaf_rotation=70, count_sort='ascending', ax=ax)
+    ax.set_ylim(0, 1)
+    try:
+        plt.savefig(dendro_file, format='png')
+    except:
+        print(f'Unable to save {dendro_file}!')
+    # plt.show()  # uncomment to display the plot before continuing
+    plt.close()
@@ -9,45 +9,73 @@
 # duplicate labels, and will pair them as with any other label. This design allows for accurate weighting of
 # labels in word_pair_distance.py, which calculates synonymy scores for all pairs as a precursor to
 # the weighting and clustering steps in cluster_synonymy_scores.py.
+# With --incremental, a manifest of the label lists already paired is kept in wordpairs_dir (see manifest.py),
+# and lists that haven't changed since they were last paired are skipped.
+# With --metrics, the time spent and pairs written are recorded per run and per list (see metrics.py).
 
 import os
 import argparse
-
-# Read in options.
-parser = argparse.ArgumentParser()
-parser.add_argument('wordlists_dir', help='directory where individual word lists by ID are stored', type=str)
-parser.add_argument('wordpairs_dir', help='directory in which to store word pair lists after processing wordlists_dir',
-                    type=str)
-args = parser.parse_args()
+import similarity
+import manifest
+import metrics
 
 # Constants, used to format output file names.
 ZERO_PAD = 4
 SUFFIX = ".txt"
 
 
-def make_output_subdirs():
-    if not os.path.exists(args.wordpairs_dir):
-        os.makedirs(args.wordpairs_dir)
+def make_output_subdirs(wordpairs_dir):
+    if not os.path.exists(wordpairs_dir):
+        os.makedirs(wordpairs_dir)
 
 
 # Create files of all pairs of labels per ID from a directory of label lists, with one space-separated pair per line.
-def generate_all_pairs():
-    read_directory = os.fsencode(args.wordlists_dir)
+def generate_all_pairs(wordlists_dir, wordpairs_dir, run_manifest=None):
+    read_directory = os.fsencode(wordlists_dir)
     for file in os.listdir(read_directory):
         filename = os.fsdecode(file)
         if filename.startswith('.'):
             continue
         out_name = filename.split(".")[0]
-        in_file = os.path.join(args.wordlists_dir, filename)
-        out_file = os.path.join(args.wordpairs_dir, out_name + ".pairs" + SUFFIX)
-        with open(in_file, 'r') as f:
-            label_list = [line.rstrip('\n') for line in f]
-            with open(out_file, 'w') as o:
-                for i in range(len(label_list)):
-                    for j in range(i + 1, (len(label_list))):
-                        o.write("{} {}\n".format(label_list[i], label_list[j]))
+        in_file = os.path.join(wordlists_dir, filename)
+        out_file = os.path.join(wordpairs_dir, out_name + ".pairs" + SUFFIX)
+        if run_manifest is not None:
+            input_hash = manifest.hash_files([in_file])
+            if run_manifest.is_current(filename, input_hash):
+                continue
+        with metrics.track_set(filename), metrics.stage('pairs'):
+            with open(in_file, 'r') as f:
+                label_list = [line.rstrip('\n') for line in f]
+                with open(out_file, 'w') as o:
+                    for label1, label2 in similarity.all_pairs(label_list):
+                        o.write("{} {}\n".format(label1, label2))
+            metrics.count('pairs_written', len(label_list) * (len(label_list) - 1) // 2)
+        if run_manifest is not None:
+            run_manifest.record(filename, input_hash, [out_file])
+
+
+def main():
+    # Read in options.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('wordlists_dir', help='directory where individual word lists by ID are stored', type=str)
+    parser.add_argument('wordpairs_dir', help='directory in which to store word pair lists after processing \
+wordlists_dir', type=str)
+    parser.add_argument('--incremental', help='skip label lists that are unchanged since they were last paired into \
+wordpairs_dir', action='store_true')
+    parser.add_argument('--metrics', help='a .json or .csv file where run metrics are written', default=None, type=str)
+    parser.add_argument('--profile', help='a file where cProfile stats for the run are written', default=None, type=str)
+    args = parser.parse_args()
+
+    metrics.start(args.metrics, args.profile)
+    make_output_subdirs(args.wordpairs_dir)
+    if args.incremental:
+        run_manifest = manifest.Manifest(args.wordpairs_dir, "create_all_pairs")
+        run_manifest.set_params({})
+        generate_all_pairs(args.wordlists_dir, args.wordpairs_dir, run_manifest)
+        run_manifest.close()
+    else:
+        generate_all_pairs(args.wordlists_dir, args.wordpairs_dir)
 
 
 if __name__ == "__main__":
-    make_output_subdirs()
-    generate_all_pairs()
+    main()
@@ -0,0 +1,136 @@
+# Crystal Butler
+# 2026/10/18
+# Clustering of label sets with duplicate labels, from their distinct labels and multiplicities.
+#
+# Free response label sets repeat the same words many times, and create_all_pairs.py keeps
+# every duplicate, so that each response counts towards the clustering and the weights. But
+# duplicate labels are identical rows of the similarity matrix. Here, a set is reduced to its
+# u distinct labels, each with a count, and only the u x u similarity matrix is computed.
+# The counts are carried through average linkage clustering and the cophenetic correlation,
+# so the results are the same as for the fully expanded n x n computation:
+#   -- Distances are normalized over the same multiset of pair scores as scores_to_distances()
+#      sees for the expanded set: every pair of distinct labels, counted once per pair of
+#      responses, and the self similarity of every label given more than once.
+#   -- Duplicates of a label are identical, so average linkage joins them before anything else,
+#      at their own (normalized self similarity) distance, which is 0 unless some other pair of
+#      labels is more similar. The distinct labels are then clustered as clusters of their
+#      duplicates, with the average linkage update weighted by cluster size in responses.
+#   -- The linkage matrix is expanded back to one leaf per response, so fcluster, dendrograms
+#      and saved linkage matrices work exactly as before.
+
+import numpy as np
+import scipy.cluster.hierarchy as sch
+
+
+def unique_labels(labels):
+    """Return the distinct labels, in order of first appearance, the index of each label's
+    distinct label and the number of times each distinct label appears."""
+    first = {}
+    inverse = np.empty(len(labels), dtype=np.intp)
+    for i, label in enumerate(labels):
+        inverse[i] = first.setdefault(label, len(first))
+    unique = list(first)
+    counts = np.bincount(inverse, minlength=len(unique))
+    return unique, inverse, counts
+
+
+def unique_distances(S_u, counts):
+    """Transform the distinct labels' similarity matrix to distances, as scores_to_distances() does
+    for the expanded set. Returns the condensed distances between distinct labels, and the distance
+    between duplicates of each distinct label (only meaningful for labels with a count above 1)."""
+    S_u = np.asarray(S_u, dtype=np.float64)
+    pair_scores = S_u[np.triu_indices(len(S_u), 1)]
+    self_scores = np.diag(S_u)
+    # The expanded set's scores, without repeats, which don't change the minimum or range.
+    scores = np.concatenate([pair_scores, self_scores[counts > 1]])
+    low, spread = np.min(scores), np.ptp(scores)
+
+    def to_distances(values):
+        return 1 - ((values - low) / spread).round(decimals=6)
+
+    return to_distances(pair_scores), to_distances(self_scores)
+
+
+def weighted_average_linkage(distances_u, counts):
+    """Average linkage clustering of the distinct labels, each standing for count identical responses.
+    Returns a linkage matrix over the distinct labels, in order of merge height; its last column
+    counts distinct labels, so it's a valid scipy linkage matrix for the distinct labels alone."""
+    u = len(counts)
+    D = np.full((u, u), np.inf)
+    rows, cols = np.triu_indices(u, 1)
+    D[rows, cols] = distances_u
+    D[cols, rows] = distances_u
+    size = counts.astype(np.float64)
+    leaves = np.ones(u)
+    ids = np.arange(u)
+    linkage_matrix = np.empty((max(u - 1, 0), 4))
+    for step in range(u - 1):
+        i, j = divmod(int(np.argmin(D)), u)
+        if i > j:
+            i, j = j, i
+        linkage_matrix[step] = [min(ids[i], ids[j]), max(ids[i], ids[j]), D[i, j], leaves[i] + leaves[j]]
+        # The Lance-Williams update for average linkage, with clusters weighted by their responses.
+        merged = (size[i] * D[i] + size[j] * D[j]) / (size[i] + size[j])
+        D[i, :] = merged
+        D[:, i] = merged
+        D[i, i] = np.inf
+        D[j, :] = np.inf
+        D[:, j] = np.inf
+        size[i] += size[j]
+        leaves[i] += leaves[j]
+        ids[i] = u + step
+    return linkage_matrix
+
+
+def expand_linkage(linkage_u, inverse, counts, self_distances):
+    """Expand a linkage matrix over distinct labels to one over all n responses, in their original
+    order. The duplicates of each label are joined first, at their self distance."""
+    n = len(inverse)
+    positions = [[] for _ in counts]
+    for i, label in enumerate(inverse):
+        positions[label].append(i)
+    rows = []
+    node = list(range(len(counts)))
+    for label, label_positions in enumerate(positions):
+        current, size = label_positions[0], 1
+        for position in label_positions[1:]:
+            size += 1
+            rows.append([min(current, position), max(current, position), self_distances[label], size])
+            current = n + len(rows) - 1
+        node[label] = current
+    first_internal = n + len(rows)
+    u = len(counts)
+    sizes = {label: counts[label] for label in range(u)}
+    for step, (left, right, height, _) in enumerate(linkage_u):
+        left, right = int(left), int(right)
+        expanded_left = node[left] if left < u else first_internal + left - u
+        expanded_right = node[right] if right < u else first_internal + right - u
+        sizes[u + step] = sizes[left] + sizes[right]
+        rows.append([min(expanded_left, expanded_right), max(expanded_left, expanded_right), height, sizes[u + step]])
+    return np.array(rows, dtype=np.float64).reshape(-1, 4)
+
+
+def unique_linkage(distances_u, self_distances, inverse, counts):
+    """Cluster a set from its distinct labels. Returns the linkage matrix over all responses,
+    and the linkage matrix over the distinct labels."""
+    if not (np.all(np.isfinite(distances_u)) and np.all(np.isfinite(self_distances[counts > 1]))):
+        raise ValueError("The condensed distance matrix must contain only finite values.")
+    linkage_u = weighted_average_linkage(distances_u, counts)
+    linkage_u[linkage_u[:, 2] < 0, 2] = 0  # as in build_linkage_matrix()
+    self_distances = np.maximum(self_distances, 0)
+    return expand_linkage(linkage_u, inverse, counts, self_distances), linkage_u
+
+
+def weighted_cophenet(linkage_u, distances_u, self_distances, counts):
+    """The cophenetic correlation coefficient of the expanded set, computed over pairs of distinct
+    labels weighted by their number of response pairs. Duplicates of a label are joined at their
+    self distance, so their cophenetic distance is the same as their distance."""
+    cophenetic_u = sch.cophenet(linkage_u) if len(counts) > 1 else np.empty(0)
+    rows, cols = np.triu_indices(len(counts), 1)
+    repeated = counts > 1
+    weights = np.concatenate([counts[rows] * counts[cols], counts[repeated] * (counts[repeated] - 1) / 2])
+    distances = np.concatenate([distances_u, self_distances[repeated]])
+    cophenetic = np.concatenate([cophenetic_u, self_distances[repeated]])
+    z = distances - np.average(distances, weights=weights)
+    zc = cophenetic - np.average(cophenetic, weights=weights)
+    return np.sum(weights * z * zc) / np.sqrt(np.sum(weights * z ** 2) * np.sum(weights * zc ** 2))
@@ -0,0 +1,398 @@
+# Crystal Butler
+# 2026/10/18
+# Load word-feature vectors for the scoring and vocabulary scripts, either from a text
+# vectors file or from a binary embedding store converted from one.
+#
+# A store is a directory holding two files:
+#   -- vectors.npy: the word vectors, normalized to unit length and saved as float32
+#   -- vocab.txt: the vocabulary words, one per line, in the same order as the vector rows
+# Stores can also be saved at a reduced precision, with --precision:
+#   -- float16: half the size of float32
+#   -- int8: a quarter of the size; each row is quantized to integers from -127 to 127, and
+#      scales.npy holds the float32 scale of each row (see QuantizedVectors)
+# Text vectors files can be loaded at any of these precisions too, or at float64, the default.
+# However they're stored, products of vectors are accumulated in float64, and scores are
+# kept as float32, or float64 for float64 vectors (see similarity.score_dtype()).
+# precision_report.py measures how much scores and clustering results change at each precision.
+# Stores are opened with memory mapping, so loading takes a fraction of a second and
+# the pages holding the vectors are shared between concurrently running scripts.
+#
+# To convert a vectors file once, before running the pipeline:
+#   python embedding_store.py <vectors_file> <store_dir>
+# The store directory can then be given anywhere a vectors_file is expected.
+#
+# Text vectors files are split into chunks of whole lines, which are parsed in parallel by
+# worker processes, each writing its rows straight into one preallocated array shared with
+# the main process. When only some words are needed, such as the labels in a set of pairs
+# files, the loaders take a list of words, and only those rows are parsed and kept, so memory
+# use is proportional to the words actually used.
+
+import os
+import mmap
+import argparse
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Constants, used to name the files inside a store directory.
+VECTORS_NAME = "vectors.npy"
+VOCAB_NAME = "vocab.txt"
+SCALES_NAME = "scales.npy"
+# The precisions vectors can be stored and loaded at.
+PRECISIONS = ['float64', 'float32', 'float16', 'int8']
+# The most bytes of a text vectors file parsed by a worker at once.
+CHUNK_BYTES = 32 << 20
+# Rows converted between precisions at once.
+CONVERT_ROWS = 65536
+
+# The array parsed rows are written to, set before worker processes are forked.
+_parse_target = None
+
+
+class QuantizedVectors:
+    """Normalized vectors stored as int8 codes, with a float32 scale for each row. Indexing rows
+    returns them as float32 vectors, so that a QuantizedVectors can be used like an array of
+    vectors by the scoring code; assigning rows quantizes them."""
+
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, codes, scales):
+        self.codes = codes
+        self.scales = scales
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, rows):
+        return self.codes[rows].astype(np.float32) * self.scales[rows][..., None]
+
+    def __setitem__(self, rows, vectors):
+        vectors = np.broadcast_to(np.asarray(vectors, dtype=np.float64), self.codes[rows].shape)
+        # Each row is scaled so that its largest value is 127; empty rows stay NaN.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scales = np.max(np.abs(vectors), axis=-1) / 127 if vectors.shape[-1] else np.zeros(vectors.shape[:-1])
+            codes = np.rint(vectors / scales[..., None])
+        codes[~np.isfinite(codes)] = 0
+        self.codes[rows] = codes.astype(np.int8)
+        self.scales[rows] = scales
+
+    def flush(self):
+        for part in [self.codes, self.scales]:
+            if isinstance(part, np.memmap):
+                part.flush()
+
+
+def allocate(shape, precision, shared=False):
+    """An empty matrix of vectors at the given precision. With shared, it's allocated in
+    memory shared with worker processes forked afterwards."""
+    def empty(shape, dtype):
+        if not shared:
+            return np.empty(shape, dtype=dtype)
+        buffer = mmap.mmap(-1, max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+        return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+    if precision == 'int8':
+        return QuantizedVectors(empty(shape, np.int8), empty(shape[:1], np.float32))
+    return empty(shape, precision)
+
+
+def to_precision(W, precision):
+    """Return the vectors W at the given precision, converting them a block at a time if need be."""
+    quantized = isinstance(W, QuantizedVectors)
+    if precision is None or (quantized and precision == 'int8') or (not quantized and W.dtype == precision):
+        return W
+    out = allocate(W.shape, precision)
+    for start in range(0, len(W), CONVERT_ROWS):
+        out[start:start + CONVERT_ROWS] = W[start:start + CONVERT_ROWS]
+    return out
+
+
+def take_rows(W, rows):
+    """Gather the given rows of W into memory, keeping their precision."""
+    if isinstance(W, QuantizedVectors):
+        return QuantizedVectors(np.asarray(W.codes[rows]).reshape(len(rows), W.shape[1]),
+                                np.asarray(W.scales[rows]).reshape(len(rows)))
+    return np.asarray(W[rows]).reshape(len(rows), W.shape[1])
+
+
+def is_store(path):
+    """A store is a directory containing a vectors file and a vocabulary file."""
+    return (os.path.isdir(path) and os.path.isfile(os.path.join(path, VECTORS_NAME))
+            and os.path.isfile(os.path.join(path, VOCAB_NAME)))
+
+
+def chunk_bounds(vectors_file, chunk_bytes):
+    """Split a text vectors file into byte ranges of whole lines. Returns a list of
+    (start, end, first row) tuples, and the number of rows in the file."""
+    size = os.path.getsize(vectors_file)
+    bounds = []
+    rows = 0
+    with open(vectors_file, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(start + chunk_bytes)
+            f.readline()
+            end = min(f.tell(), size)
+            f.seek(start)
+            chunk = f.read(end - start)
+            bounds.append((start, end, rows))
+            rows += chunk.count(b'\n') + (not chunk.endswith(b'\n'))
+            start = end
+    return bounds, rows
+
+
+def read_chunk(vectors_file, start, end):
+    with open(vectors_file, 'rb') as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def count_dim(vectors_file):
+    """The vector dimension of a text vectors file, from its first line."""
+    with open(vectors_file, 'rb') as f:
+        return len(f.readline().rstrip().split(b' ')) - 1
+
+
+def parse_lines(chunk, wanted=None):
+    """Parse a chunk of whole lines of a text vectors file into a list of words and a float64 array
+    of their normalized vectors. With wanted, a set of words, other lines are skipped unparsed."""
+    lines = chunk.split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+    words = []
+    values = []
+    for line in lines:
+        word, _, rest = line.rstrip().partition(b' ')
+        word = word.decode('utf-8', errors='ignore')
+        if wanted is None or word in wanted:
+            words.append(word)
+            values.append(rest)
+    if not words:
+        return words, np.empty((0, 0))
+    W = np.array(b' '.join(values).split(), dtype=np.float64)
+    if W.size % len(words):
+        raise ValueError("Every line of a vectors file needs a word followed by the same number of values.")
+    W = W.reshape(len(words), -1)
+    # As in word_pair_distance.generate(), the <unk> vector is left as zeros.
+    W[[i for i, word in enumerate(words) if word == '<unk>']] = 0
+    # Normalize each word vector to unit length; zero vectors normalize to NaN.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        W /= np.sqrt(np.sum(W ** 2, 1))[:, None]
+    return words, W
+
+
+def _parse_chunk_into(vectors_file, start, end, row):
+    words, W = parse_lines(read_chunk(vectors_file, start, end))
+    _parse_target[row:row + len(words)] = W
+    return words
+
+
+def _parse_chunk_filtered(vectors_file, start, end, wanted):
+    return parse_lines(read_chunk(vectors_file, start, end), wanted)
+
+
+def _worker_count(workers):
+    if workers is None:
+        return os.cpu_count() or 1
+    return max(workers, 1)
+
+
+def _pool(workers, tasks):
+    """A pool of forked worker processes, or None where the work should be done in this process:
+    for a single task or worker, where processes can't be forked, or inside a daemonic worker
+    process, which can't start processes of its own."""
+    workers = min(_worker_count(workers), tasks)
+    if (workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods()
+            or multiprocessing.current_process().daemon):
+        return None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+
+
+def _chunk_size(vectors_file, workers, chunk_bytes):
+    """Chunks small enough that every worker gets at least one."""
+    return max(1, min(chunk_bytes, -(-os.path.getsize(vectors_file) // _worker_count(workers))))
+
+
+def parse_text_vectors(vectors_file, out=None, precision='float64', workers=None, chunk_bytes=CHUNK_BYTES):
+    """Parse every line of a text vectors file into normalized vectors, written into out if it's
+    given, or else into a new matrix at precision. Returns the words, in row order, and the matrix.
+    Chunks are parsed by forked worker processes that write straight into the matrix, so a new
+    matrix is allocated in memory shared with them."""
+    global _parse_target
+    bounds, rows = chunk_bounds(vectors_file, _chunk_size(vectors_file, workers, chunk_bytes))
+    pool = _pool(workers, len(bounds))
+    if out is None:
+        out = allocate((rows, count_dim(vectors_file)), precision, shared=pool is not None)
+    _parse_target = out
+    try:
+        if pool is None:
+            words = [word for bound in bounds for word in _parse_chunk_into(vectors_file, *bound)]
+        else:
+            with pool:
+                futures = [pool.submit(_parse_chunk_into, vectors_file, *bound) for bound in bounds]
+                words = [word for future in futures for word in future.result()]
+    finally:
+        _parse_target = None
+    return words, out
+
+
+def parse_text_words(vectors_file, words, workers=None, chunk_bytes=CHUNK_BYTES):
+    """Parse only the lines of a text vectors file for the given words. Returns the words found,
+    in file order, and a float64 array of their normalized vectors."""
+    wanted = set(words)
+    bounds, _ = chunk_bounds(vectors_file, _chunk_size(vectors_file, workers, chunk_bytes))
+    pool = _pool(workers, len(bounds))
+    if pool is None:
+        parsed = [_parse_chunk_filtered(vectors_file, start, end, wanted) for start, end, _ in bounds]
+    else:
+        with pool:
+            futures = [pool.submit(_parse_chunk_filtered, vectors_file, start, end, wanted) for start, end, _ in bounds]
+            parsed = [future.result() for future in futures]
+    found = [word for chunk_words, _ in parsed for word in chunk_words]
+    if not found:
+        return found, np.empty((0, count_dim(vectors_file)))
+    return found, np.concatenate([W for chunk_words, W in parsed if chunk_words])
+
+
+def convert_vectors(vectors_file, store_dir, workers=None, precision='float32'):
+    """Write the normalized vectors from vectors_file into a new store at store_dir.
+    Rows are parsed straight into a memory mapped output file, so memory use stays
+    small regardless of the size of the vectors file."""
+    _, vocab_size = chunk_bounds(vectors_file, CHUNK_BYTES)
+    vector_dim = count_dim(vectors_file)
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+    scales_file = os.path.join(store_dir, SCALES_NAME)
+    W = np.lib.format.open_memmap(os.path.join(store_dir, VECTORS_NAME), mode='w+',
+                                  dtype=np.int8 if precision == 'int8' else precision, shape=(vocab_size, vector_dim))
+    if precision == 'int8':
+        W = QuantizedVectors(W, np.lib.format.open_memmap(scales_file, mode='w+', dtype=np.float32, shape=(vocab_size,)))
+    elif os.path.exists(scales_file):
+        os.remove(scales_file)
+    words, _ = parse_text_vectors(vectors_file, out=W, workers=workers)
+    # Stores have always kept the <unk> vector as zeros.
+    unk = [i for i, word in enumerate(words) if word == '<unk>']
+    W[unk] = np.zeros((len(unk), vector_dim))
+    with open(os.path.join(store_dir, VOCAB_NAME), 'w', encoding="utf-8") as o:
+        for word in words:
+            o.write("{}\n".format(word))
+    W.flush()
+    del W
+    return vocab_size, vector_dim
+
+
+def read_vocab(store_dir):
+    """Return the store vocabulary as a list of words, in row order."""
+    with open(os.path.join(store_dir, VOCAB_NAME), 'r', encoding="utf-8") as f:
+        return [line.rstrip('\n') for line in f]
+
+
+def load_store(store_dir, mmap=True, words=None):
+    """Open a store, returning the normalized vectors and a word:row index dictionary,
+    in the same form as word_pair_distance.generate(). With words, only their rows are
+    gathered from the store, and the index is over the words found. The vectors of an
+    int8 store are returned as a QuantizedVectors."""
+    mmap_mode = 'r' if mmap or words is not None else None
+    W_norm = np.load(os.path.join(store_dir, VECTORS_NAME), mmap_mode=mmap_mode)
+    if os.path.isfile(os.path.join(store_dir, SCALES_NAME)):
+        W_norm = QuantizedVectors(W_norm, np.load(os.path.join(store_dir, SCALES_NAME), mmap_mode=mmap_mode))
+    store_words = read_vocab(store_dir)
+    if words is not None:
+        wanted = set(words)
+        rows = [idx for idx, word in enumerate(store_words) if word in wanted]
+        store_words = [store_words[idx] for idx in rows]
+        W_norm = take_rows(W_norm, rows)
+    vocab = {w: idx for idx, w in enumerate(store_words)}
+    return W_norm, vocab
+
+
+def load_text_vectors(vectors_file, words=None, workers=None, precision='float64'):
+    """Parse a text vectors file into a normalized matrix and a word:row index dictionary.
+    This is the parsing done by word_pair_distance.generate() for text vectors files.
+    With words, only their lines are parsed, and the index is over the words found."""
+    if words is None:
+        found, W_norm = parse_text_vectors(vectors_file, precision=precision, workers=workers)
+    else:
+        found, W_norm = parse_text_words(vectors_file, words, workers)
+        W_norm = to_precision(W_norm, precision)
+    # Create word:numbered index dictionary from the "found" list, to be used for vector lookups.
+    vocab = {w: idx for idx, w in enumerate(found)}
+    # A word on more than one line has the vector from its last line; rows for its earlier lines are left empty.
+    W_norm[[idx for idx, w in enumerate(found) if vocab[w] != idx]] = np.nan
+    return W_norm, vocab
+
+
+def load_embeddings(vectors_file, words=None, workers=None, precision=None):
+    """Load normalized vectors and a word:row index from either a store or a text vectors file.
+    With words, only the vectors for those words are loaded; see load_store() and load_text_vectors().
+    workers is the number of processes used to parse a text vectors file, by default one per CPU.
+    With precision, the vectors are converted to it; otherwise stores keep their own precision,
+    and text vectors are float64."""
+    if is_store(vectors_file):
+        W_norm, vocab = load_store(vectors_file, words=words)
+        return to_precision(W_norm, precision), vocab
+    return load_text_vectors(vectors_file, words, workers, precision or 'float64')
+
+
+def vectors_dtype(vectors_file, precision=None):
+    """The dtype of the vector rows that load_embeddings() would return, without loading them."""
+    if precision is None and is_store(vectors_file):
+        if os.path.isfile(os.path.join(vectors_file, SCALES_NAME)):
+            return QuantizedVectors.dtype
+        return np.load(os.path.join(vectors_file, VECTORS_NAME), mmap_mode='r').dtype
+    return QuantizedVectors.dtype if precision == 'int8' else np.dtype(precision or np.float64)
+
+
+def fingerprint_paths(vectors_file):
+    """The files fingerprint() hashes: a text vectors file, or a store's vectors, vocabulary and any scales."""
+    if is_store(vectors_file):
+        return [os.path.join(vectors_file, name) for name in [VECTORS_NAME, VOCAB_NAME, SCALES_NAME]
+                if os.path.isfile(os.path.join(vectors_file, name))]
+    return [vectors_file]
+
+
+def fingerprint(vectors_file):
+    """Return a content hash of a text vectors file, or of a store's vectors and vocabulary."""
+    h = hashlib.sha1()
+    for path in fingerprint_paths(vectors_file):
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+
+def iter_words(vectors_file):
+    """Yield the vocabulary word from each row of a text vectors file or a store."""
+    if is_store(vectors_file):
+        for word in read_vocab(vectors_file):
+            yield word
+    else:
+        with open(vectors_file, 'r', encoding="utf-8", errors='ignore') as f:
+            for line in f:
+                yield line.rstrip().split(' ')[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('vectors_file', help='a text file of word-features vectors to convert', type=str)
+    parser.add_argument('store_dir', help='a directory where the binary embedding store will be written', type=str)
+    parser.add_argument('--workers', help='the number of processes used to parse the vectors file; one per CPU \
+if not given', default=None, type=int)
+    parser.add_argument('--precision', help='the precision the vectors are stored at', default='float32',
+                        choices=PRECISIONS[1:])
+    args = parser.parse_args()
+
+    vocab_size, vector_dim = convert_vectors(args.vectors_file, args.store_dir, args.workers, args.precision)
+    print(f"Wrote {vocab_size} vectors of dimension {vector_dim} to {args.store_dir}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# Crystal Butler
+# 2026/10/18
+# Score label sets with several word embedding models at once, and combine their scores.
+#
+# Each vectors file or store is loaded as usual (see embedding_store.py), and the models are
+# aligned to a shared vocabulary index: the words every model has, in the first model's order.
+# Row i of the index points at the word's row in each model, so memory mapped stores stay
+# mapped, while models parsed into memory keep only the rows for shared words.
+# An EnsembleVectors can be passed wherever the scoring code takes one matrix of vectors W:
+#   -- similarity_matrix() and similarity_block() gather each model's vectors, zero padded to
+#      the widest model, and compute every model's scores with one batched matrix multiply,
+#      before combining them by their mean or maximum (see COMBINE)
+#   -- indexing it gives each word's vectors from every model, concatenated and scaled by
+#      1 / sqrt(models): these are unit vectors whose dot products are the mean of the models'
+#      cosine similarities, which is what large_sets.py needs
+# model_matrices() keeps each model's scores separate, for results per model.
+
+import os
+import numpy as np
+import embedding_store
+import similarity
+
+# Ways of combining the models' scores for each pair.
+COMBINE = ['mean', 'max']
+
+
+class EnsembleVectors:
+    """Several models' vectors, aligned to a shared vocabulary index by rows, a models x words
+    array of each model's row for every shared word."""
+
+    def __init__(self, models, rows, names, combine='mean'):
+        if combine not in COMBINE:
+            raise ValueError(f"{combine} isn't a way of combining scores; use one of {', '.join(COMBINE)}.")
+        self.models = models
+        self.rows = rows
+        self.names = names
+        self.combine = combine
+        self.dims = [W.shape[1] for W in models]
+        self.dtype = np.dtype(np.result_type(*[similarity.score_dtype(W.dtype) for W in models]))
+
+    @property
+    def shape(self):
+        return self.rows.shape[1], sum(self.dims)
+
+    def __len__(self):
+        return self.rows.shape[1]
+
+    def __getitem__(self, idx):
+        idx = np.asarray(idx)
+        scale = 1 / np.sqrt(len(self.models))
+        return np.concatenate([np.asarray(W[rows[idx]], dtype=np.float64) * scale
+                               for W, rows in zip(self.models, self.rows)], axis=-1)
+
+    def stacked_vectors(self, idx):
+        """Every model's vectors for the shared rows idx, as a models x len(idx) x widest array."""
+        E = np.zeros((len(self.models), len(idx), max(self.dims)))
+        for m, (W, rows) in enumerate(zip(self.models, self.rows)):
+            E[m, :, :self.dims[m]] = W[rows[np.asarray(idx, dtype=np.intp)]]
+        return E
+
+    def model_similarities(self, rows, cols):
+        """Each model's cosine similarities between shared rows and columns, as a models x rows x
+        columns array from one batched matrix multiply, accumulated in float64."""
+        E1 = self.stacked_vectors(rows)
+        E2 = E1 if cols is rows else self.stacked_vectors(cols)
+        return np.matmul(E1, E2.transpose(0, 2, 1))
+
+    def model_matrices(self, idx):
+        """Each model's similarity matrix for the shared rows idx, from one batched matrix multiply,
+        rounded as similarity.similarity_matrix() rounds that model's scores."""
+        return [S.astype(similarity.score_dtype(W.dtype), copy=False)
+                for S, W in zip(self.model_similarities(idx, idx), self.models)]
+
+    def combine_scores(self, S_models):
+        S = S_models.mean(axis=0) if self.combine == 'mean' else S_models.max(axis=0)
+        return S.astype(self.dtype, copy=False)
+
+    def similarity_block(self, rows, cols):
+        return self.combine_scores(self.model_similarities(rows, cols))
+
+    def similarity_matrix(self, idx):
+        return self.similarity_block(idx, idx)
+
+
+def model_name(vectors_file):
+    """A model's name for its results: the vectors file or store name, without extensions."""
+    return os.path.basename(os.path.normpath(vectors_file)).split(".")[0]
+
+
+def model_names(vectors_files):
+    """Each model's name, numbered if any names are the same."""
+    names = [model_name(vectors_file) for vectors_file in vectors_files]
+    if len(set(names)) < len(names):
+        names = ["{}_{}".format(m, name) for m, name in enumerate(names)]
+    return names
+
+
+def load_ensemble(vectors_files, words=None, workers=None, precision=None, combine='mean'):
+    """Load several vectors files or stores, as embedding_store.load_embeddings() does, and align
+    them to the words they share. Returns an EnsembleVectors and the shared word:row index."""
+    models, vocabs = [], []
+    for vectors_file in vectors_files:
+        W, vocab = embedding_store.load_embeddings(vectors_file, words, workers, precision)
+        models.append(W)
+        vocabs.append(vocab)
+    shared = [word for word in sorted(vocabs[0], key=vocabs[0].get) if all(word in vocab for vocab in vocabs[1:])]
+    rows = np.array([[vocab[word] for word in shared] for vocab in vocabs], dtype=np.intp).reshape(len(models), -1)
+    for m, W in enumerate(models):
+        if not isinstance(getattr(W, 'codes', W), np.memmap) and len(shared) < len(W):
+            # Drop the rows of words the other models don't have.
+            models[m] = embedding_store.take_rows(W, rows[m])
+            rows[m] = np.arange(len(shared))
+    return EnsembleVectors(models, rows, model_names(vectors_files), combine), {word: i for i, word in enumerate(shared)}
+
+
+def fingerprint(vectors_files, fingerprint_file=embedding_store.fingerprint):
+    """A fingerprint of every model in an ensemble, in order."""
+    return ':'.join(fingerprint_file(vectors_file) for vectors_file in vectors_files)
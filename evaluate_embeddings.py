@@ -0,0 +1,163 @@
+# Crystal Butler
+# 2026/10/18
+# Compare word embeddings by how well their similarity scores agree with the human synonymy
+# ratings in synonyms_dataset/synonymy_scores.csv.
+#
+# Every word pair in the benchmark is scored against each vectors file (or embedding store)
+# given. Only the vectors for the benchmark vocabulary are loaded (see embedding_store.load_embeddings()),
+# and models are evaluated in parallel with --workers, so that dozens of candidate embeddings can
+# be screened in one run. Pairs with a word missing from a model's vocabulary are left out of that
+# model's statistics, and counted.
+#
+# For each model, agreement with HUMAN RATER SCORES NORMALIZED is measured by:
+#   -- Spearman's rank correlation
+#   -- Pearson's correlation
+#   -- Krippendorff's alpha, for interval data, treating the model and the averaged human ratings as
+#      two raters; model scores are rescaled to the range 0 to 1 first, like the human ratings
+# each with a bootstrap confidence interval from resampling the word pairs. Every model is
+# resampled with the same seed, so models covering the same pairs see the same resamples.
+# Results are printed, one row per model, and written to --output as a tab separated table.
+
+import os
+import argparse
+import functools
+import numpy as np
+from scipy.stats import rankdata
+import embedding_store
+import similarity
+import parallel
+import metrics
+
+# Column names in the benchmark file.
+WORD_COLUMNS = ['Input.Word1', 'Input.Word2']
+HUMAN_COLUMN = 'HUMAN RATER SCORES NORMALIZED'
+
+
+def read_benchmark(scores_file):
+    """Return the benchmark's two word lists and the normalized human ratings."""
+    import pandas as pd
+    # The file starts with a byte order mark.
+    table = pd.read_csv(scores_file, encoding='utf-8-sig')
+    words1, words2 = (table[column].astype(str).str.strip().tolist() for column in WORD_COLUMNS)
+    return words1, words2, table[HUMAN_COLUMN].to_numpy(dtype=np.float64)
+
+
+def score_pairs(vectors_file, words1, words2, workers=1):
+    """Score each word pair against one model, with NaN for pairs with a word out of its vocabulary.
+    Scores are the same as similarity.pair_score() gives for the pair. workers is the number of
+    models being evaluated at once."""
+    with metrics.stage('load_embeddings'):
+        # When models are evaluated in parallel, each is parsed by a single process.
+        W, vocab = embedding_store.load_embeddings(vectors_file, words1 + words2, 1 if workers > 1 else None)
+    found = np.array([w1 in vocab and w2 in vocab for w1, w2 in zip(words1, words2)], dtype=bool)
+    rows1 = [vocab[w] for w, ok in zip(words1, found) if ok]
+    rows2 = [vocab[w] for w, ok in zip(words2, found) if ok]
+    with metrics.stage('score'):
+        scores = np.full(len(words1), np.nan)
+        scores[found] = np.einsum('ij,ij->i', W[rows1].astype(np.float64), W[rows2].astype(np.float64)).astype(
+            similarity.score_dtype(W.dtype))
+    return scores
+
+
+def rescale(scores):
+    """Rescale scores to the range 0 to 1."""
+    return (scores - np.min(scores)) / np.ptp(scores)
+
+
+def pearson_rows(X, Y):
+    """Pearson's correlation between each row of X and the same row of Y."""
+    Xc = X - X.mean(axis=1, keepdims=True)
+    Yc = Y - Y.mean(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sum(Xc * Yc, axis=1) / np.sqrt(np.sum(Xc ** 2, axis=1) * np.sum(Yc ** 2, axis=1))
+
+
+def spearman_rows(X, Y):
+    """Spearman's rank correlation between each row of X and the same row of Y, with tied values given their average rank."""
+    return pearson_rows(rankdata(X, axis=1), rankdata(Y, axis=1))
+
+
+def alpha_rows(X, Y):
+    """Krippendorff's alpha for interval data, between two raters scoring every unit, for each row of X and Y.
+    With no missing ratings, the observed disagreement is the mean squared difference within units, and the
+    expected disagreement is the mean squared difference between all pairs of ratings."""
+    observed = np.mean((X - Y) ** 2, axis=1)
+    V = np.concatenate([X, Y], axis=1)
+    expected = 2 * np.sum((V - V.mean(axis=1, keepdims=True)) ** 2, axis=1) / (V.shape[1] - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1 - observed / expected
+
+
+STATISTICS = [('spearman', spearman_rows), ('pearson', pearson_rows), ('alpha', alpha_rows)]
+
+
+def agreement(model_scores, human_scores, bootstrap, confidence, seed):
+    """Return each statistic and its bootstrap confidence interval, over the pairs the model scored.
+    All resamples are drawn at once, and each statistic is computed for all of them together."""
+    scored = np.isfinite(model_scores)
+    x, y = rescale(model_scores[scored]), human_scores[scored]
+    result = {'pairs': int(scored.sum()), 'oov_pairs': int((~scored).sum())}
+    resamples = np.random.default_rng(seed).integers(0, len(x), size=(bootstrap, len(x)))
+    tail = (100 - confidence) / 2
+    for name, statistic in STATISTICS:
+        result[name] = float(statistic(x[None, :], y[None, :])[0])
+        if bootstrap > 0:
+            low, high = np.nanpercentile(statistic(x[resamples], y[resamples]), [tail, 100 - tail])
+            result[name + '_low'], result[name + '_high'] = float(low), float(high)
+    return result
+
+
+def init_worker(scores_file):
+    """Read the benchmark in a worker process that didn't inherit it from the parent process."""
+    global words1, words2, human_scores
+    if 'human_scores' not in globals():
+        words1, words2, human_scores = read_benchmark(scores_file)
+
+
+def evaluate_model(vectors_file, bootstrap=1000, confidence=95, seed=0, workers=1):
+    model_scores = score_pairs(vectors_file, words1, words2, workers)
+    if np.count_nonzero(np.isfinite(model_scores)) < 3:
+        raise ValueError("Fewer than three benchmark pairs are in this model's vocabulary.")
+    with metrics.stage('statistics'):
+        return agreement(model_scores, human_scores, bootstrap, confidence, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('vectors_files', help='one or more files of word-features vectors, or embedding store directories',
+                        nargs='+', type=str)
+    parser.add_argument('--scores_file', help='the human synonymy ratings to compare against',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'synonyms_dataset',
+                                             'synonymy_scores.csv'), type=str)
+    parser.add_argument('--bootstrap', help='the number of bootstrap resamples for confidence intervals', default=1000, type=int)
+    parser.add_argument('--confidence', help='the confidence interval width, in percent', default=95, type=float)
+    parser.add_argument('--seed', help='the random seed for bootstrap resampling', default=0, type=int)
+    parser.add_argument('--workers', help='the number of processes used to evaluate models in parallel', default=1, type=int)
+    parser.add_argument('--output', help='a tab separated file where the results table is written', default=None, type=str)
+    parser.add_argument('--metrics', help='a .json or .csv file where run metrics are written', default=None, type=str)
+    parser.add_argument('--profile', help='a file where cProfile stats for the run are written', default=None, type=str)
+    args = parser.parse_args()
+
+    metrics.start(args.metrics, args.profile)
+    init_worker(args.scores_file)
+    evaluate = functools.partial(evaluate_model, bootstrap=args.bootstrap, confidence=args.confidence, seed=args.seed,
+                                 workers=args.workers)
+    rows = []
+    for vectors_file, result, error in parallel.map_sets(evaluate, args.vectors_files, args.workers, init_worker,
+                                                         (args.scores_file,)):
+        if error is not None:
+            print(f"Unable to evaluate {vectors_file}:\n{error}")
+            continue
+        row = {'model': vectors_file}
+        row.update(result)
+        rows.append(row)
+    import pandas as pd
+    results = pd.DataFrame(rows)
+    if rows:
+        print(results.to_string(index=False))
+    if args.output is not None:
+        results.to_csv(args.output, sep='\t', index=False)
+
+
+if __name__ == "__main__":
+    main()
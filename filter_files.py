@@ -7,63 +7,183 @@
 # files in the Dendrograms/Pass directory as a filter. The label and image files
 # must have the same prefix as the dendrogram files for the script to work.
 # Matching files are copied to the specified directory.
+#
+# The matched files are never modified, so rather than copying them they can be hard linked,
+# symbolically linked, or reflinked (a copy-on-write clone, on filesystems that support it) into
+# the output directory with --mode. Real copies, and reflinks, are made by a pool of --workers
+# threads. Files already in the output directory from an earlier run are left in place.
+# Afterwards, the names in filter_dir with no matching file in in_dir, and the files in
+# in_dir with no matching name in filter_dir, are reported, and written to --report if given.
+# With --metrics, the time spent and the files placed, copied, skipped and failed are recorded (see metrics.py).
 
 import os
+import sys
 import argparse
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+# The Linux ioctl that clones one file's extents into another.
+FICLONE = 0x40049409
+
+
+def make_output_subdirs(in_dir, out_dir):
+    if not os.path.exists(in_dir):
+        os.makedirs(in_dir)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+
+def match_name(filename):
+    """The part of a file name before its first dot, which is shared by a set's files."""
+    return filename.split(".")[0]
+
+
+def list_files(directory):
+    """Return the names of the files in a directory, skipping hidden files."""
+    with os.scandir(directory) as entries:
+        return sorted(entry.name for entry in entries if not entry.name.startswith('.'))
+
+
+def create_filter_set(filter_dir):
+    filter_set = {match_name(filename) for filename in list_files(filter_dir)}
+    print(f"Found {len(filter_set)} file names to check.")
+    return filter_set
+
+
+def reflink(src, dst):
+    """Clone src to dst, sharing its data blocks until either is modified. Raises OSError
+    where the filesystem or operating system doesn't support it."""
+    import fcntl
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    shutil.copystat(src, dst)
+
+
+def is_placed(src, dst, mode):
+    """Return True if dst is already src, or an unchanged copy of it."""
+    if not os.path.lexists(dst):
+        return False
+    if mode == 'symlink':
+        return os.path.islink(dst) and os.readlink(dst) == src
+    if os.path.islink(dst):
+        return False
+    if os.path.samefile(src, dst):
+        return True
+    if mode == 'hardlink':
+        return False
+    src_stat, dst_stat = os.stat(src), os.stat(dst)
+    return src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
 
-# Read in options.
-parser = argparse.ArgumentParser()
-parser.add_argument('filter_dir', help='directory of files to be matched', type=str)
-parser.add_argument('in_dir', help='directory of files to filter against filter_dir', type=str)
-parser.add_argument('out_dir', help='directory that matching files are copied to', type=str)
-args = parser.parse_args()
-
-
-def make_output_subdirs():
-    if not os.path.exists(args.in_dir):
-        os.makedirs(args.in_dir)
-    if not os.path.exists(args.out_dir):
-        os.makedirs(args.out_dir)
-
-
-def create_filter_list():
-    filter_list = []
-    read_directory = os.fsencode(args.filter_dir)
-    for file in os.listdir(read_directory):
-        filename = os.fsdecode(file)
-        if filename.startswith('.'):
-            continue
-        filter_name = filename.split(".")[0]
+
+def place_file(src, dst, mode):
+    """Put src at dst with the given mode, replacing anything else there.
+    Return 'placed', 'copied' if a reflink fell back to a copy, or 'skipped' if dst was already in place."""
+    if is_placed(src, dst, mode):
+        return 'skipped'
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == 'hardlink':
+        os.link(src, dst)
+    elif mode == 'symlink':
+        os.symlink(src, dst)
+    elif mode == 'reflink':
         try:
-            filter_list.append(filter_name)
-        except:
-            print(f"Unable to append {filter_name} to filter list!")
-    print(f"Found {len(filter_list)} file names to check.")
-    return filter_list
-
-
-def filter_files(filter_list, in_dir, out_dir):
-    copy_list = []
-    read_directory = os.fsencode(in_dir)
-    for file in os.listdir(read_directory):
-        filename = os.fsdecode(file)
-        if filename.startswith('.'):
-            continue
-        check_name = filename.split(".")[0]
-        if (check_name in filter_list):
-            try:
-                copy_list.append(filename)
-                copy_file = os.path.join(in_dir, filename)
-                shutil.copy2(copy_file, out_dir)
-            except:
-                print(f"Failed to copy {filename}.")
-    print(f"Matched {len(copy_list)} files.")
-    assert len(copy_list) == len(filter_list)
+            reflink(src, dst)
+        except (OSError, ImportError):
+            if os.path.lexists(dst):
+                os.remove(dst)
+            shutil.copy2(src, dst)
+            return 'copied'
+    else:
+        shutil.copy2(src, dst)
+    return 'placed'
 
 
-if __name__ == "__main__":
-    make_output_subdirs()
-    filter_list = create_filter_list()
-    filter_files(filter_list, args.in_dir, args.out_dir)
+def filter_files(filter_set, in_dir, out_dir, mode='copy', workers=1):
+    """Place every file in in_dir whose name matches one in filter_set into out_dir.
+    Return the matched file names, the names in filter_set no file matched, the files that matched no name,
+    and the matched files that couldn't be placed."""
+    matched, unmatched_files = [], []
+    for filename in list_files(in_dir):
+        (matched if match_name(filename) in filter_set else unmatched_files).append(filename)
+    unmatched_names = sorted(filter_set - {match_name(filename) for filename in matched})
+
+    # Symbolic links are made absolute, so that they resolve from out_dir.
+    in_dir = os.path.abspath(in_dir) if mode == 'symlink' else in_dir
+
+    def place(filename):
+        try:
+            return place_file(os.path.join(in_dir, filename), os.path.join(out_dir, filename), mode), None
+        except OSError as e:
+            return None, e
+
+    # Links are made almost instantly, so threads only help when data is copied.
+    if mode in ('copy', 'reflink') and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outcomes = list(pool.map(place, matched))
+    else:
+        outcomes = [place(filename) for filename in matched]
+    failed = []
+    for filename, (outcome, error) in zip(matched, outcomes):
+        if error is not None:
+            print(f"Failed to {mode} {filename}: {error}")
+            failed.append(filename)
+    placed = [outcome for outcome, _ in outcomes]
+    metrics.count('files_matched', len(matched))
+    # Reflinks that fell back to a copy count as copied.
+    metrics.count('files_copied' if mode == 'copy' else 'files_linked', placed.count('placed'))
+    metrics.count('files_copied', placed.count('copied'))
+    metrics.count('files_skipped', placed.count('skipped'))
+    metrics.count('files_failed', len(failed))
+    print(f"Matched {len(matched)} files: {placed.count('placed') + placed.count('copied')} placed in {out_dir}, "
+          f"{placed.count('skipped')} already there, {len(failed)} failed.")
+    if placed.count('copied'):
+        print(f"{placed.count('copied')} files were copied because reflinks aren't supported.")
+    return matched, unmatched_names, unmatched_files, failed
+
 
+def write_report(report_file, unmatched_names, unmatched_files, failed):
+    with open(report_file, 'w') as o:
+        for heading, names in [('Names in filter_dir with no matching file', unmatched_names),
+                               ('Files in in_dir with no matching name', unmatched_files),
+                               ('Files that failed', failed)]:
+            o.write(f"# {heading}: {len(names)}\n")
+            for name in names:
+                o.write(f"{name}\n")
+
+
+def main():
+    # Read in options.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filter_dir', help='directory of files to be matched', type=str)
+    parser.add_argument('in_dir', help='directory of files to filter against filter_dir', type=str)
+    parser.add_argument('out_dir', help='directory that matching files are copied to', type=str)
+    parser.add_argument('--mode', help='how matching files are placed in out_dir: copy, hardlink, symlink, or reflink '
+                        '(falling back to a copy where the filesystem can\'t clone files)',
+                        choices=['copy', 'hardlink', 'symlink', 'reflink'], default='copy', type=str)
+    parser.add_argument('--workers', help='the number of threads used to copy files', default=8, type=int)
+    parser.add_argument('--report', help='a file where the unmatched names on both sides are written', default=None, type=str)
+    parser.add_argument('--metrics', help='a .json or .csv file where run metrics are written', default=None, type=str)
+    parser.add_argument('--profile', help='a file where cProfile stats for the run are written', default=None, type=str)
+    args = parser.parse_args()
+
+    metrics.start(args.metrics, args.profile)
+    make_output_subdirs(args.in_dir, args.out_dir)
+    with metrics.stage('list'):
+        filter_set = create_filter_set(args.filter_dir)
+    with metrics.stage(args.mode):
+        matched, unmatched_names, unmatched_files, failed = filter_files(filter_set, args.in_dir, args.out_dir,
+                                                                         args.mode, args.workers)
+    print(f"{len(unmatched_names)} names in {args.filter_dir} have no matching file in {args.in_dir}.")
+    for name in unmatched_names[:10]:
+        print(f"  {name}")
+    print(f"{len(unmatched_files)} files in {args.in_dir} have no matching name in {args.filter_dir}.")
+    if args.report is not None:
+        write_report(args.report, unmatched_names, unmatched_files, failed)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
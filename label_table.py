@@ -0,0 +1,225 @@
+# Crystal Butler
+# 2026/10/18
+# Long format label tables, as an alternative to one label list file per stimulus.
+#
+# A label table has one row per response, with a set_id column and a label column, as a CSV,
+# tab separated or JSON lines file, optionally gzipped (.csv, .tsv, .jsonl, .csv.gz, ...).
+# CSV and tab separated tables need a header row naming the columns; other columns are ignored.
+# A table can also be split into shards: a directory of table files, read in file name order
+# as if they were one table.
+#
+# Tables are read one row at a time, and grouped into sets without holding the whole table:
+#   -- if each set's rows are all together, as when the table is sorted by set_id, sets are
+#      yielded as soon as their last row is read, so only one set is in memory at a time
+#   -- otherwise, with grouped=False, rows are first spread across temporary bucket files by a
+#      hash of their set_id, and each bucket is grouped in turn, so only one bucket is in memory
+# Labels keep the order of their rows within a set.
+#
+# Results are written the same way, as a few tables with one row per set (or per label), which
+# can be split into shards of a fixed number of rows.
+
+import os
+import csv
+import gzip
+import json
+import zlib
+import tempfile
+import numpy as np
+
+# Column names read from label tables.
+SET_COLUMN = 'set_id'
+LABEL_COLUMN = 'label'
+FORMATS = ['csv', 'tsv', 'jsonl', 'csv.gz', 'tsv.gz', 'jsonl.gz']
+SHARD_NAME = "part-{:05d}.{}"
+
+
+class UngroupedSetsError(ValueError):
+    """A set's rows aren't all together in a table read with grouped=True. It's only found when the
+    set's rows start again, so the sets before it have already been yielded."""
+
+
+def table_format(path):
+    """Return the format of a table file from its name, or None if it isn't one."""
+    for fmt in sorted(FORMATS, key=len, reverse=True):
+        if path.endswith('.' + fmt):
+            return fmt
+    return None
+
+
+def is_label_table(path):
+    """A label table is a table file, or a directory holding table file shards."""
+    if os.path.isfile(path):
+        return table_format(path) is not None
+    if os.path.isdir(path):
+        return any(table_format(entry) is not None for entry in os.listdir(path) if not entry.startswith('.'))
+    return False
+
+
+def shard_paths(path):
+    if os.path.isfile(path):
+        return [path]
+    return [os.path.join(path, entry) for entry in sorted(os.listdir(path))
+            if not entry.startswith('.') and table_format(entry) is not None]
+
+
+def _open(path, mode='r'):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def _read_shard(path, columns):
+    fmt = table_format(path)
+    with _open(path) as f:
+        if fmt.startswith('jsonl'):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield tuple(str(record[column]) for column in columns)
+            return
+        reader = csv.reader(f, delimiter='\t' if fmt.startswith('tsv') else ',')
+        header = next(reader, [])
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise ValueError(f"{path} has no {', '.join(missing)} column in its header row.")
+        positions = [header.index(column) for column in columns]
+        for row in reader:
+            if row:
+                yield tuple(row[i] for i in positions)
+
+
+def iter_rows(path, columns=(SET_COLUMN, LABEL_COLUMN)):
+    """Yield the given columns of every row of a table or its shards, as tuples of strings.
+    Rows with a blank label are skipped, and labels are stripped, as in label list files."""
+    for shard in shard_paths(path):
+        for row in _read_shard(shard, columns):
+            row = row[:-1] + (row[-1].strip(),)
+            if row[-1]:
+                yield row
+
+
+def table_words(path):
+    """Return the set of labels in a label table."""
+    return {label for _, label in iter_rows(path)}
+
+
+def iter_sets(path, grouped=True, buckets=64, temp_dir=None):
+    """Yield (set_id, labels) for every set in a label table. With grouped, each set's rows must
+    all be together, or UngroupedSetsError is raised; otherwise, rows are grouped through temporary files first."""
+    if not grouped:
+        yield from _iter_bucketed_sets(path, buckets, temp_dir)
+        return
+    current, labels, seen = None, [], set()
+    for set_id, label in iter_rows(path):
+        if set_id != current:
+            if current is not None:
+                yield current, labels
+            if set_id in seen:
+                raise UngroupedSetsError(f"The rows for set {set_id} in {path} aren't all together; sort the table "
+                                         f"by {SET_COLUMN}, or read it ungrouped (--ungrouped).")
+            seen.add(set_id)
+            current, labels = set_id, []
+        labels.append(label)
+    if current is not None:
+        yield current, labels
+
+
+def _iter_bucketed_sets(path, buckets, temp_dir):
+    with tempfile.TemporaryDirectory(dir=temp_dir) as bucket_dir:
+        bucket_paths = [os.path.join(bucket_dir, "{:05d}.tsv".format(i)) for i in range(buckets)]
+        files = [open(bucket_path, 'w', encoding='utf-8') for bucket_path in bucket_paths]
+        try:
+            for set_id, label in iter_rows(path):
+                files[zlib.crc32(set_id.encode('utf-8')) % buckets].write("{}\t{}\n".format(set_id, label))
+        finally:
+            for f in files:
+                f.close()
+        for bucket_path in bucket_paths:
+            sets = {}
+            with open(bucket_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    set_id, label = line.rstrip('\n').split('\t', 1)
+                    sets.setdefault(set_id, []).append(label)
+            yield from sets.items()
+
+
+def batches(items, size):
+    """Yield lists of up to size items at a time."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _plain(value):
+    """Convert NumPy scalars to Python values, and None to an empty field."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return '' if value is None else value
+
+
+class TableWriter:
+    """Write rows to a results table: path plus the format's suffix, or if shard_rows is given,
+    a directory at path of shards with up to shard_rows rows each."""
+
+    def __init__(self, path, columns, fmt='csv', shard_rows=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"{fmt} isn't a table format; use one of {', '.join(FORMATS)}.")
+        self.path = path
+        self.columns = list(columns)
+        self.fmt = fmt
+        self.shard_rows = shard_rows
+        self.paths = []
+        self.rows = 0
+        self.f = None
+        self.writer = None
+        if shard_rows is not None:
+            if not os.path.exists(path):
+                os.makedirs(path)
+            # Remove the shards of an earlier, longer table.
+            for entry in os.listdir(path):
+                if entry.startswith('part-') and entry.endswith('.' + fmt):
+                    os.remove(os.path.join(path, entry))
+
+    def _next_file(self):
+        if self.f is not None:
+            self.f.close()
+        if self.shard_rows is None:
+            path = self.path + '.' + self.fmt
+        else:
+            path = os.path.join(self.path, SHARD_NAME.format(len(self.paths), self.fmt))
+        self.paths.append(path)
+        self.f = _open(path, 'w')
+        if not self.fmt.startswith('jsonl'):
+            self.writer = csv.writer(self.f, delimiter='\t' if self.fmt.startswith('tsv') else ',', lineterminator='\n')
+            self.writer.writerow(self.columns)
+
+    def write(self, row):
+        if self.f is None or (self.shard_rows is not None and self.rows % self.shard_rows == 0):
+            self._next_file()
+        row = [_plain(value) for value in row]
+        if self.writer is None:
+            self.f.write(json.dumps(dict(zip(self.columns, row))) + "\n")
+        else:
+            self.writer.writerow(row)
+        self.rows += 1
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def close(self):
+        """Close the table. A table with no rows is still written, with just its header."""
+        if self.f is None:
+            self._next_file()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
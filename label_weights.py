@@ -0,0 +1,81 @@
+# Crystal Butler
+# 2026/10/18
+# Cumulative relatedness weights for the labels in a set, computed from the set's
+# similarity matrix rather than from files of scored label pairs.
+# A label's weight is the sum of its similarity scores with every other label in the set.
+# Duplicate labels are kept as separate rows of the matrix, then their totals are summed,
+# which gives the same weights as sum_label_weights.py.
+# Labels are ranked from highest to lowest weight; the top k labels are the set's
+# most representative ones.
+
+import numpy as np
+
+
+def weight_totals(labels, S):
+    """Return the set's distinct labels, in sorted order, and an array of their total weights,
+    given its labels and its square label x label similarity matrix."""
+    S = np.asarray(S, dtype=np.float64)
+    return group_totals(labels, S.sum(axis=1) - np.diag(S))
+
+
+def group_totals(labels, totals):
+    """Return the set's distinct labels, in sorted order, and an array of their total weights,
+    given its labels and the total weight of each one."""
+    unique, inverse = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+    return unique, np.bincount(inverse, weights=totals, minlength=len(unique))
+
+
+def rank_labels(totals, top_k=None):
+    """Return the indices of the top_k highest totals (or of all of them), from highest to lowest.
+    Ties keep their original order, so sorted labels stay alphabetical, as in sum_label_weights.py."""
+    if top_k is not None and top_k <= 0:
+        return np.array([], dtype=np.intp)
+    if top_k is not None and top_k < len(totals):
+        # Only the labels tied with or above the k-th highest weight need sorting.
+        kth = np.partition(totals, len(totals) - top_k)[len(totals) - top_k]
+        candidates = np.flatnonzero(totals >= kth)
+        return candidates[np.argsort(-totals[candidates], kind='stable')][:top_k]
+    return np.argsort(-totals, kind='stable')
+
+
+def label_weights(labels, S, top_k=None):
+    """Return (label, weight) pairs sorted from highest to lowest weight, given a set's
+    labels and its square label x label similarity matrix. With top_k, only the top_k
+    highest weighted labels are returned."""
+    unique, totals = weight_totals(labels, S)
+    return [[str(unique[i]), float(totals[i])] for i in rank_labels(totals, top_k)]
+
+
+def label_weights_from_totals(labels, totals, top_k=None):
+    """Return (label, weight) pairs as label_weights() does, given a set's labels and each one's
+    sum of similarity scores with every other label, kept up to date as labels are added."""
+    unique, totals = group_totals(labels, totals)
+    return [[str(unique[i]), float(totals[i])] for i in rank_labels(totals, top_k)]
+
+
+def label_weights_with_counts(unique, counts, S_u, top_k=None):
+    """Return (label, weight) pairs as label_weights() does for the expanded set, given its distinct
+    labels, how many times each appears and the distinct labels' similarity matrix. Each copy of
+    a label is similar to every copy of every label, apart from itself."""
+    S_u = np.asarray(S_u, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.float64)
+    totals = counts * (S_u @ counts - np.diag(S_u))
+    # Ties keep alphabetical label order, as in label_weights().
+    order = np.argsort(np.asarray(unique, dtype=str), kind='stable')
+    return [[str(unique[order[i]]), float(totals[order[i]])] for i in rank_labels(totals[order], top_k)]
+
+
+# Columns of the weights table written in place of .weights.txt files.
+WEIGHTS_COLUMNS = ['set_id', 'rank', 'label', 'weight']
+
+
+def weights_rows(set_id, w_arr):
+    """Rows of the weights table for one set's (label, weight) pairs, ranked from 1."""
+    return [[set_id, rank, label, weight] for rank, (label, weight) in enumerate(w_arr, 1)]
+
+
+def write_weights(out_file, w_arr):
+    """Write (label, weight) pairs in the .weights.txt layout used by sum_label_weights.py."""
+    with open(out_file, 'w') as o:
+        for w in w_arr:
+            o.write("{}\t{}\n".format(w[0].ljust(20), str(w[1]).ljust(20)))
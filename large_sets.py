@@ -0,0 +1,178 @@
+# Crystal Butler
+# 2026/10/18
+# Clustering of very large label sets in memory that grows with the number of labels, rather
+# than with its square.
+#
+# Clustering a set through scipy needs the condensed distances between every pair of labels,
+# several float64 copies of them and the cophenetic distances as well, so pooled sets of tens
+# of thousands of labels run out of memory. Here, as in duplicates.py, a set is reduced to its
+# u distinct labels with their counts, and then:
+#   -- Pair scores are computed a block of rows at a time as float32, from the label vectors,
+#      and only reduced to their minimum, maximum and response-weighted sums, which give the
+#      distance normalization of scores_to_distances() and the distance variance.
+#   -- Scores are cosine similarities of unit vectors, and distances an affine function of
+#      scores, so the average distance between two clusters is found from the dot product of
+#      the sums of their labels' vectors. Average linkage is run as a nearest neighbour chain
+#      over these sums, which keeps one vector per cluster instead of a distance matrix.
+#   -- Each merge joins clusters at their average distance, which is the cophenetic distance
+#      of every pair of responses it joins, so the cophenetic correlation is accumulated from
+#      the merges alone.
+# The linkage matrix is expanded back to one leaf per response, as in duplicates.py, so pass or
+# fail, dendrograms and saved linkage matrices work as before. Results agree with the full
+# computation up to floating point rounding, and the rounding of distances to six decimals.
+
+import numpy as np
+import duplicates
+
+# The most scores computed at a time, as a block of rows of the distinct labels' similarity matrix.
+CHUNK_SCORES = 2 ** 22
+
+
+def label_vectors(W, idx):
+    """Gather the vectors for rows idx of W as float64, so that products are accumulated in float64."""
+    return np.asarray(W[idx], dtype=np.float64)
+
+
+def score_moments(E, counts, chunk_scores=CHUNK_SCORES):
+    """Read every pair score of the distinct labels with vectors E once, a block of rows at a time,
+    as float32. Returns a dictionary of the lowest and highest score, the number of pairs of responses,
+    the sums of their scores and squared scores, and each label's score with itself. As in
+    duplicates.unique_distances(), self scores only count for labels given more than once."""
+    u = len(counts)
+    counts = np.asarray(counts, dtype=np.float64)
+    repeated = counts > 1
+    self_scores = np.einsum('ij,ij->i', E, E).astype(np.float32)
+    dup_weights = counts[repeated] * (counts[repeated] - 1) / 2
+    dup_scores = self_scores[repeated].astype(np.float64)
+    moments = {
+        'low': np.min(dup_scores, initial=np.inf), 'high': np.max(dup_scores, initial=-np.inf),
+        'pairs': np.sum(dup_weights), 'sum': np.sum(dup_weights * dup_scores),
+        'sum_squares': np.sum(dup_weights * dup_scores ** 2), 'self_scores': self_scores,
+    }
+    step = max(1, chunk_scores // max(u, 1))
+    for start in range(0, u, step):
+        stop = min(start + step, u)
+        block = (E[start:stop] @ E[start:].T).astype(np.float32)
+        # Only pairs above the diagonal: the block's own triangle, then every later label.
+        rows, cols = np.triu_indices(stop - start, 1)
+        scores = [(block[rows, cols], counts[start + rows] * counts[start + cols])]
+        if stop < u:
+            rest = block[:, stop - start:]
+            scores.append((rest, np.outer(counts[start:stop], counts[stop:])))
+        for values, weights in scores:
+            if values.size == 0:
+                continue
+            values = values.astype(np.float64)
+            moments['low'] = min(moments['low'], np.min(values))
+            moments['high'] = max(moments['high'], np.max(values))
+            moments['pairs'] += np.sum(weights)
+            moments['sum'] += np.sum(weights * values)
+            moments['sum_squares'] += np.sum(weights * values ** 2)
+    return moments
+
+
+def weight_totals(E, counts, self_scores):
+    """The total weight of each distinct label in the expanded set, as label_weights_with_counts()
+    finds it, from the sum of the label vectors rather than the similarity matrix."""
+    counts = np.asarray(counts, dtype=np.float64)
+    return counts * (E @ (E.T @ counts) - self_scores)
+
+
+def centroid_average_linkage(E, counts, low, spread):
+    """Average linkage clustering of the distinct labels with vectors E, each standing for count
+    identical responses, by nearest neighbour chain. Returns a linkage matrix over the distinct
+    labels, as duplicates.weighted_average_linkage() does, and for each merge, the average distance
+    between the clusters it joins and the number of pairs of responses it joins."""
+    u = len(counts)
+    sums = E * np.asarray(counts, dtype=np.float64)[:, np.newaxis]
+    size = np.asarray(counts, dtype=np.float64).copy()
+    alive = np.ones(u, dtype=bool)
+    node = np.arange(u)
+    node_leaves = [1] * u
+    node_height = [0.0] * u
+    merges = []
+    chain = []
+    while len(merges) < u - 1:
+        if not chain:
+            chain.append(int(np.argmax(alive)))
+        a = chain[-1]
+        similarity = (sums @ sums[a]) / (size * size[a])
+        similarity[~alive] = -np.inf
+        similarity[a] = -np.inf
+        b = int(np.argmax(similarity))
+        # Prefer the previous link on ties, so that the chain always ends in a mutual nearest pair.
+        if len(chain) > 1 and similarity[chain[-2]] >= similarity[b]:
+            b = chain[-2]
+        if len(chain) < 2 or b != chain[-2]:
+            chain.append(b)
+            continue
+        chain = chain[:-2]
+        distance = 1 - (similarity[b] - low) / spread
+        # Heights never fall below a child's, even by floating point error, so the merges sort into a tree.
+        height = max(distance, node_height[node[a]], node_height[node[b]])
+        merges.append((node[a], node[b], height, distance, size[a] * size[b]))
+        node_leaves.append(node_leaves[node[a]] + node_leaves[node[b]])
+        node_height.append(height)
+        sums[a] += sums[b]
+        size[a] += size[b]
+        node[a] = u + len(merges) - 1
+        alive[b] = False
+        if alive.sum() <= len(alive) // 2:
+            # Drop merged rows, so the chain's searches shrink as clusters merge.
+            keep = np.flatnonzero(alive)
+            position = np.full(len(alive), -1)
+            position[keep] = np.arange(len(keep))
+            sums, size, node, alive = sums[keep], size[keep], node[keep], alive[keep]
+            chain = [int(position[link]) for link in chain]
+    # Merges are found out of order; sort them by height, and renumber clusters as scipy does.
+    order = sorted(range(len(merges)), key=lambda k: merges[k][2])
+    renumber = list(range(u)) + [0] * len(merges)
+    linkage_u = np.empty((len(merges), 4))
+    distances = np.empty(len(merges))
+    pair_counts = np.empty(len(merges))
+    for step, k in enumerate(order):
+        left, right, height, distance, pairs = merges[k]
+        left, right = renumber[left], renumber[right]
+        renumber[u + k] = u + step
+        linkage_u[step] = [min(left, right), max(left, right), height, node_leaves[u + k]]
+        distances[step] = distance
+        pair_counts[step] = pairs
+    return linkage_u, distances, pair_counts
+
+
+def streaming_cophenet(linkage_u, distances, pair_counts, moments, self_distances, counts):
+    """The cophenetic correlation coefficient of the expanded set, from the merges of
+    centroid_average_linkage() and the score moments, without any pairwise arrays.
+    Duplicates of a label are joined at their self distance, as in duplicates.weighted_cophenet()."""
+    spread = moments['high'] - moments['low']
+    repeated = counts > 1
+    dup_pairs = counts[repeated] * (counts[repeated] - 1) / 2.0
+    dup_distances = self_distances[repeated]
+    total = moments['pairs']
+    # Distances are 1 - (score - low) / spread, so their variance is the scores' over spread squared.
+    distance_sum = total * (1 + moments['low'] / spread) - moments['sum'] / spread
+    distance_ss = (moments['sum_squares'] - moments['sum'] ** 2 / total) / spread ** 2
+    heights = linkage_u[:, 2]
+    cophenetic_sum = np.sum(pair_counts * heights) + np.sum(dup_pairs * dup_distances)
+    cophenetic_ss = (np.sum(pair_counts * heights ** 2) + np.sum(dup_pairs * dup_distances ** 2)
+                     - cophenetic_sum ** 2 / total)
+    cross = np.sum(pair_counts * heights * distances) + np.sum(dup_pairs * dup_distances ** 2)
+    cross_ss = cross - distance_sum * cophenetic_sum / total
+    return cross_ss / np.sqrt(distance_ss * cophenetic_ss)
+
+
+def cluster_large_set(E, inverse, counts, chunk_scores=CHUNK_SCORES):
+    """Cluster a set from its distinct labels' vectors E. Returns the linkage matrix over all
+    responses, the cophenetic correlation coefficient and the distinct labels' total weights."""
+    counts = np.asarray(counts)
+    moments = score_moments(E, counts, chunk_scores)
+    low, spread = moments['low'], moments['high'] - moments['low']
+    if not (np.isfinite(low) and np.isfinite(spread) and spread > 0):
+        raise ValueError("The condensed distance matrix must contain only finite values.")
+    self_distances = np.maximum(1 - (moments['self_scores'].astype(np.float64) - low) / spread, 0)
+    totals = weight_totals(E, counts, moments['self_scores'])
+    linkage_u, distances, pair_counts = centroid_average_linkage(E, counts, low, spread)
+    linkage_u[linkage_u[:, 2] < 0, 2] = 0  # as in build_linkage_matrix()
+    cophenetic_coefficient = streaming_cophenet(linkage_u, distances, pair_counts, moments, self_distances, counts)
+    linkage_matrix = duplicates.expand_linkage(linkage_u, inverse, counts, self_distances)
+    return linkage_matrix, cophenetic_coefficient, totals
@@ -6,43 +6,61 @@
 # The script will ignore all strings not comprised of lowercase English
 # alphabet characters. To output all strings regardless of composition,
 # change the main function to use the "make_vocab" function.
+# The vocabulary of an embedding store created by embedding_store.py can be
+# written out the same way, by passing the store directory as vectors_file.
+# With --metrics, the time spent and the words read and written are recorded (see metrics.py).
 
 import argparse
 import re
-
-# Read in options.
-parser = argparse.ArgumentParser()
-parser.add_argument('vectors_file', help="a file of word-feature vectors", type=str)
-parser.add_argument('output_file', help="a file path for writing the vocabulary", type=str)
-args = parser.parse_args()
+import embedding_store
+import metrics
 
 # Constant, used to format output file name.
 SUFFIX = ".txt"
 
 
-def make_vocab():
+def make_vocab(vectors_file, output_file):
     """Write out the first string from each line of the input file, regardless of composition."""
-    vals = []
-    with open(args.vectors_file, 'r') as f, open(args.output_file, 'w') as o:
-        for line in f:
-            vals = line.rstrip().split(' ')
-            o.write("{}\n".format(vals[0]))
-        return 0
+    written = 0
+    with open(output_file, 'w') as o:
+        for word in embedding_store.iter_words(vectors_file):
+            o.write("{}\n".format(word))
+            written += 1
+    metrics.count('words_read', written)
+    metrics.count('words_written', written)
+    return 0
 
 
-def make_vocab_lower_alphas():
+def make_vocab_lower_alphas(vectors_file, output_file):
     """Check the first string from each line of the input file, and if it contains 
     only lowercase English alphabet characters, write it out."""
-    vals = []
-    with open(args.vectors_file, 'r') as f, open(args.output_file, 'w') as o:
-        for line in f:
-            vals = line.rstrip().split(' ')
-            if re.search(r'[^a-z]', vals[0]):
+    read = written = 0
+    with open(output_file, 'w') as o:
+        for word in embedding_store.iter_words(vectors_file):
+            read += 1
+            if re.search(r'[^a-z]', word):
                 continue
             else:
-                o.write("{}\n".format(vals[0]))
-        return 0
+                o.write("{}\n".format(word))
+                written += 1
+    metrics.count('words_read', read)
+    metrics.count('words_written', written)
+    return 0
+
+
+def main():
+    # Read in options.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('vectors_file', help="a file of word-feature vectors, or an embedding store directory", type=str)
+    parser.add_argument('output_file', help="a file path for writing the vocabulary", type=str)
+    parser.add_argument('--metrics', help="a .json or .csv file where run metrics are written", default=None, type=str)
+    parser.add_argument('--profile', help="a file where cProfile stats for the run are written", default=None, type=str)
+    args = parser.parse_args()
+
+    metrics.start(args.metrics, args.profile)
+    with metrics.stage('vocab'):
+        vocab = make_vocab_lower_alphas(args.vectors_file, args.output_file)
 
 
 if __name__ == "__main__":
-    vocab = make_vocab_lower_alphas()
+    main()
@@ -0,0 +1,103 @@
+# Crystal Butler
+# 2026/10/18
+# Manifests for incremental reruns of the pipeline stages.
+#
+# A stage run with --incremental keeps a manifest in its output directory, recording
+# for every label set a hash of its input, a hash of the stage parameters that affect
+# its output (such as --dendro_cutoff, or the fingerprint of the embeddings), and the
+# output files it wrote. On the next run, any set whose input, parameters and outputs
+# are unchanged is skipped. Sets are recorded as soon as they're finished, so a run that
+# stops partway through picks up where it left off.
+#
+# The manifest is a JSON lines file that is only ever appended to; when a set is
+# recorded more than once, the last record wins.
+
+import os
+import json
+import hashlib
+import embedding_store
+
+MANIFEST_NAME = ".manifest-{}.jsonl"
+
+
+def hash_files(paths):
+    """Return a content hash of one or more files, in the given order."""
+    h = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+
+def hash_params(params):
+    """Return a hash of a dictionary of JSON serializable stage parameters."""
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class Manifest:
+    """The record of label sets completed by one stage in one output directory."""
+
+    def __init__(self, output_dir, stage):
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.path = os.path.join(output_dir, MANIFEST_NAME.format(stage))
+        self.sets = {}
+        self.vectors = {}
+        self.params_hash = None
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a partly written line, from a run that was killed
+                    if 'set' in record:
+                        self.sets[record['set']] = record
+                    elif 'vectors' in record:
+                        self.vectors[record['vectors']] = record
+        self.f = open(self.path, 'a')
+
+    def set_params(self, params):
+        """Set the stage parameters for this run; sets recorded with other parameters will be rerun."""
+        self.params_hash = hash_params(params)
+
+    def fingerprint(self, vectors_file):
+        """Return embedding_store.fingerprint(vectors_file), rehashing only if the file has changed
+        since the last time this manifest saw it."""
+        path = os.path.abspath(vectors_file)
+        # Every file in the hash is checked, so a store with a rebuilt vocabulary is rehashed too.
+        stat = [[os.path.getsize(stat_path), os.path.getmtime(stat_path)]
+                for stat_path in embedding_store.fingerprint_paths(path)]
+        record = self.vectors.get(path)
+        if record is not None and record['stat'] == stat:
+            return record['fingerprint']
+        record = {'vectors': path, 'stat': stat, 'fingerprint': embedding_store.fingerprint(vectors_file)}
+        self._append(record)
+        self.vectors[path] = record
+        return record['fingerprint']
+
+    def is_current(self, key, input_hash):
+        """Whether a set was completed with the same input and parameters, and its outputs still exist."""
+        record = self.sets.get(key)
+        return (record is not None and record['input'] == input_hash and record['params'] == self.params_hash
+                and all(os.path.exists(path) for path in record['outputs']))
+
+    def record(self, key, input_hash, outputs):
+        """Record a completed set. Outputs recorded for the set by an earlier run, but not written
+        this time (for example, statistics that moved from Pass to Fail), are removed."""
+        previous = self.sets.get(key)
+        if previous is not None:
+            for path in set(previous['outputs']) - set(outputs):
+                if os.path.exists(path):
+                    os.remove(path)
+        record = {'set': key, 'input': input_hash, 'params': self.params_hash, 'outputs': list(outputs)}
+        self._append(record)
+        self.sets[key] = record
+
+    def _append(self, record):
+        self.f.write(json.dumps(record) + "\n")
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
@@ -0,0 +1,224 @@
+# Crystal Butler
+# 2026/10/18
+# Lightweight instrumentation shared by the pipeline scripts.
+#
+# Scripts call start() with the --metrics and --profile paths given on their command line.
+# While metrics are on, the scripts record:
+#   -- stages, such as parsing embeddings, scoring, linkage or drawing dendrograms: the number
+#      of calls, total wall time, and bytes read and written
+#   -- sets: the wall time of each label set, and any counts recorded while processing it
+#   -- counts, such as pairs scored, out of vocabulary pairs and sets passed or failed
+#   -- the peak resident memory of the main process and of any worker processes, where the
+#      operating system reports it (it's left empty on Windows)
+# When the script exits, they're written to the metrics file, as JSON if its name ends in .json
+# and otherwise as CSV, with one (kind, name, metric, value) row per figure. With --profile,
+# the main process is run under cProfile, and the stats are dumped to that file.
+#
+# When metrics are off, stage() returns a shared do-nothing context manager and count()
+# returns at once, so instrumented code costs next to nothing.
+# Sets processed by worker processes (see parallel.py) are recorded in the worker, and the
+# figures are sent back to the main process along with each set's results.
+
+import os
+import csv
+import json
+import time
+import sys
+import atexit
+from contextlib import contextmanager
+
+# The active recorder, or None when metrics are off.
+_recorder = None
+
+
+class _NullContext:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+def _io_bytes():
+    """Return the bytes read and written by this process so far, where the operating system reports them."""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            fields = dict(line.split(':') for line in f)
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def _peak_rss_mb(children=False):
+    """Return the peak resident memory of this process, or of its finished child processes, in MB,
+    or None where the operating system doesn't report it."""
+    try:
+        import resource
+    except ImportError:
+        # The resource module is Unix only.
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS.
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def _max_peak(*peaks):
+    """The highest of several peak memory figures, ignoring those that aren't available."""
+    return max((peak for peak in peaks if peak is not None), default=None)
+
+
+class Recorder:
+    """Accumulates stage, set and count metrics for one process."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.stages = {}
+        self.sets = []
+        self.counts = {}
+        self.set_counts = None
+        self.worker_peak_rss_mb = None
+        self.start_time = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        read_start, written_start = _io_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            read_end, written_end = _io_bytes()
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'bytes_read': 0, 'bytes_written': 0})
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+            stage['bytes_read'] += read_end - read_start
+            stage['bytes_written'] += written_end - written_start
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + n
+        if self.set_counts is not None:
+            self.set_counts[name] = self.set_counts.get(name, 0) + n
+
+    @contextmanager
+    def track_set(self, set_name):
+        self.set_counts = {}
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            row = {'set': set_name, 'seconds': time.perf_counter() - start}
+            row.update(self.set_counts)
+            self.sets.append(row)
+            self.set_counts = None
+
+    def drain(self):
+        """Return this process's figures so far and start over; used to send them back from a worker."""
+        drained = {'stages': self.stages, 'sets': self.sets, 'counts': self.counts, 'peak_rss_mb': _peak_rss_mb()}
+        self.stages, self.sets, self.counts = {}, [], {}
+        return drained
+
+    def merge(self, drained):
+        """Add figures drained from a worker process."""
+        for name, figures in drained['stages'].items():
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'bytes_read': 0, 'bytes_written': 0})
+            for key, value in figures.items():
+                stage[key] += value
+        self.sets.extend(drained['sets'])
+        for name, n in drained['counts'].items():
+            self.counts[name] = self.counts.get(name, 0) + n
+        self.worker_peak_rss_mb = _max_peak(self.worker_peak_rss_mb, drained['peak_rss_mb'])
+
+    def summary(self):
+        process = {'wall_seconds': time.perf_counter() - self.start_time, 'peak_rss_mb': _peak_rss_mb(),
+                   'worker_peak_rss_mb': _max_peak(self.worker_peak_rss_mb, _peak_rss_mb(children=True))}
+        process['bytes_read'], process['bytes_written'] = _io_bytes()
+        return {'process': process, 'stages': self.stages, 'counts': self.counts, 'sets': self.sets}
+
+    def write(self, metrics_file):
+        summary = self.summary()
+        if metrics_file.endswith('.json'):
+            with open(metrics_file, 'w') as o:
+                json.dump(summary, o, indent=2)
+            return
+        with open(metrics_file, 'w', newline='') as o:
+            writer = csv.writer(o)
+            writer.writerow(['kind', 'name', 'metric', 'value'])
+            for metric, value in summary['process'].items():
+                writer.writerow(['process', '', metric, value])
+            for name, figures in summary['stages'].items():
+                for metric, value in figures.items():
+                    writer.writerow(['stage', name, metric, value])
+            for name, value in summary['counts'].items():
+                writer.writerow(['count', name, 'count', value])
+            for row in summary['sets']:
+                for metric, value in row.items():
+                    if metric != 'set':
+                        writer.writerow(['set', row['set'], metric, value])
+
+
+def start(metrics_file=None, profile_file=None):
+    """Turn metrics on if metrics_file is given, and profiling if profile_file is given.
+    Both are written out when the script exits."""
+    global _recorder
+    pid = os.getpid()
+    if metrics_file is not None:
+        _recorder = Recorder()
+        # Forked worker processes don't run exit handlers, but check the process anyway.
+        atexit.register(lambda: os.getpid() == pid and _recorder.write(metrics_file))
+    if profile_file is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def dump():
+            if os.getpid() == pid:
+                profiler.disable()
+                profiler.dump_stats(profile_file)
+        atexit.register(dump)
+
+
+def _active():
+    """Return the recorder for this process, or None when metrics are off."""
+    global _recorder
+    if _recorder is not None and _recorder.pid != os.getpid():
+        # A forked worker starts with a copy of the main process's figures; start over,
+        # so that they aren't sent back and counted twice.
+        _recorder = Recorder()
+    return _recorder
+
+
+def enabled():
+    return _recorder is not None
+
+
+def stage(name):
+    """Time a stage of work: with metrics.stage('linkage'): ..."""
+    if _recorder is None:
+        return _NULL_CONTEXT
+    return _active().stage(name)
+
+
+def count(name, n=1):
+    """Add n to a named count, for the whole run and for the set being processed."""
+    if _recorder is not None:
+        _active().count(name, n)
+
+
+def track_set(set_name):
+    """Time the processing of one label set, and collect the counts recorded during it."""
+    if _recorder is None:
+        return _NULL_CONTEXT
+    return _active().track_set(str(set_name))
+
+
+def drain():
+    return None if _recorder is None else _active().drain()
+
+
+def merge(drained):
+    if _recorder is not None and drained is not None:
+        _active().merge(drained)
@@ -0,0 +1,283 @@
+# Crystal Butler
+# 2026/10/18
+# Nearest neighbours over the embedding vocabulary, for listing a label's closest synonyms,
+# and spelling suggestions for labels that aren't in the vocabulary.
+#
+# Neighbours are found by blocked matrix multiplication: the query vectors are multiplied
+# against the normalized vectors a block of rows at a time, and only the running top k of
+# each query is kept, so memory use stays small however large the vocabulary is, and a whole
+# directory of labels costs one pass over the vectors rather than one per label. Scores are
+# recomputed for the neighbours returned, as similarity.pair_score() computes them.
+#
+# Spelling suggestions come from a character trigram index over the vocabulary. Candidates
+# sharing the most trigrams with a label are reranked by edit similarity; ties go to the word
+# nearer the top of the vectors file, which for GloVe style vectors is the more frequent word.
+#
+# An index directory holds:
+#   -- ngrams.npz: the trigram index, built once for a vocabulary and reused while it's unchanged
+#   -- neighbors.npz: the neighbours already found for each word, reused while the vectors are unchanged
+#
+# To list the nearest neighbours of every label in a directory of label lists, with suggestions
+# for those not in the vocabulary:
+#   python neighbors.py <vectors_file> <index_dir> --labels_dir <wordlists_dir> --output neighbors.txt
+
+import os
+import difflib
+import hashlib
+import argparse
+import numpy as np
+import embedding_store
+import similarity
+
+# Constants, used to name the files inside an index directory.
+NGRAMS_NAME = "ngrams.npz"
+NEIGHBORS_NAME = "neighbors.npz"
+# Vocabulary rows and query vectors multiplied at once; a block of scores takes
+# QUERY_BLOCK x BLOCK_SIZE values.
+BLOCK_SIZE = 32768
+QUERY_BLOCK = 512
+# Trigram candidates reranked by edit similarity, per suggestion wanted.
+RERANK_FACTOR = 8
+
+
+def nearest_neighbors(W, rows, k, block_size=BLOCK_SIZE, query_block=QUERY_BLOCK):
+    """Return the row indices and scores of the k nearest neighbours of each of the given rows of W,
+    from most to least similar, excluding the row itself. Rows without a vector are never returned."""
+    rows = np.asarray(rows, dtype=np.intp)
+    k = max(min(k, len(W) - 1), 0)
+    best_idx = np.empty((len(rows), k), dtype=np.intp)
+    if k == 0:
+        return best_idx, neighbor_scores(W, rows, best_idx)
+    for q_start in range(0, len(rows), query_block):
+        q_rows = rows[q_start:q_start + query_block]
+        # Reduced precision vectors are ranked in float32.
+        rank_dtype = np.promote_types(W.dtype, np.float32)
+        Q = np.nan_to_num(np.asarray(W[q_rows], dtype=rank_dtype))
+        top_idx = np.empty((len(q_rows), 0), dtype=np.intp)
+        top_scores = np.empty((len(q_rows), 0), dtype=Q.dtype)
+        for start in range(0, len(W), block_size):
+            block = Q @ np.asarray(W[start:start + block_size], dtype=rank_dtype).T
+            block_rows = np.arange(start, start + block.shape[1])
+            block[np.isnan(block)] = -np.inf
+            block[q_rows[:, None] == block_rows] = -np.inf
+            # Keep each query's top k from the block, then merge them with its top k so far.
+            idx = np.broadcast_to(block_rows, block.shape)
+            if block.shape[1] > k:
+                idx = np.argpartition(-block, k - 1, axis=1)[:, :k]
+                block = np.take_along_axis(block, idx, axis=1)
+                idx = idx + start
+            idx = np.concatenate([top_idx, idx], axis=1)
+            scores = np.concatenate([top_scores, block], axis=1)
+            if scores.shape[1] > k:
+                keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                idx = np.take_along_axis(idx, keep, axis=1)
+                scores = np.take_along_axis(scores, keep, axis=1)
+            top_idx, top_scores = idx, scores
+        # Most similar first; equal scores in row order.
+        order = np.lexsort((top_idx, -top_scores), axis=1)
+        best_idx[q_start:q_start + len(q_rows)] = np.take_along_axis(top_idx, order, axis=1)
+    return best_idx, neighbor_scores(W, rows, best_idx)
+
+
+def neighbor_scores(W, rows, neighbor_idx):
+    """Cosine similarities of each row with its neighbours, accumulated in float64 and rounded to
+    similarity.score_dtype(), so that each is the same as similarity.pair_score() gives for the pair."""
+    if neighbor_idx.size == 0:
+        return np.empty(neighbor_idx.shape, dtype=similarity.score_dtype(W.dtype))
+    Q = np.asarray(W[rows], dtype=np.float64)
+    N = np.asarray(W[neighbor_idx.ravel()], dtype=np.float64).reshape(neighbor_idx.shape + (-1,))
+    return np.einsum('qd,qkd->qk', Q, N).astype(similarity.score_dtype(W.dtype))
+
+
+def word_ngrams(word, n=3):
+    """The distinct character n-grams of a word, lowercased and padded at both ends."""
+    padded = '<' + word.lower() + '>'
+    return list({padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))})
+
+
+def vocab_hash(words):
+    h = hashlib.sha1()
+    for word in words:
+        h.update(word.encode('utf-8') + b'\n')
+    return h.hexdigest()
+
+
+class NgramIndex:
+    """A trigram index over the vocabulary, for finding the words spelled most like a label."""
+
+    def __init__(self, words, grams, offsets, postings, sizes, valid):
+        self.words = words
+        self.grams = grams
+        self.offsets = offsets
+        self.postings = postings
+        self.sizes = sizes
+        self.valid = valid
+
+    @classmethod
+    def build(cls, words, W):
+        word_grams = [word_ngrams(word) for word in words]
+        sizes = np.array([len(word_gram) for word_gram in word_grams], dtype=np.int32)
+        grams, inverse = np.unique(np.array([gram for word_gram in word_grams for gram in word_gram], dtype=str),
+                                   return_inverse=True)
+        # Postings list the words containing each trigram, in row order.
+        postings = np.repeat(np.arange(len(words), dtype=np.int32), sizes)[np.argsort(inverse, kind='stable')]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(inverse, minlength=len(grams)))])
+        # Only suggest words that have a vector; <unk> and all zero vectors normalize to NaN.
+        valid = np.concatenate([np.isfinite(np.asarray(W[start:start + BLOCK_SIZE])).all(axis=1)
+                                for start in range(0, len(W), BLOCK_SIZE)]) if len(W) else np.zeros(0, dtype=bool)
+        return cls(list(words), grams, offsets, postings, sizes, valid)
+
+    def save(self, ngrams_file):
+        np.savez(ngrams_file, grams=self.grams, offsets=self.offsets, postings=self.postings,
+                 sizes=self.sizes, valid=self.valid, vocab_hash=vocab_hash(self.words))
+
+    @classmethod
+    def load(cls, ngrams_file, words):
+        """Load a saved index, or return None if it was built for a different vocabulary."""
+        with np.load(ngrams_file) as saved:
+            if str(saved['vocab_hash']) != vocab_hash(words):
+                return None
+            return cls(list(words), saved['grams'], saved['offsets'], saved['postings'], saved['sizes'], saved['valid'])
+
+    def suggest(self, label, n=5):
+        """Return up to n (word, similarity) pairs for the vocabulary words spelled most like label,
+        with similarity from 0 to 1."""
+        query = word_ngrams(label)
+        found = np.searchsorted(self.grams, query)
+        hits = [self.postings[self.offsets[i]:self.offsets[i + 1]]
+                for i, gram in zip(found, query) if i < len(self.grams) and self.grams[i] == gram]
+        if not hits or n <= 0:
+            return []
+        candidates, shared = np.unique(np.concatenate(hits), return_counts=True)
+        keep = self.valid[candidates]
+        candidates, shared = candidates[keep], shared[keep]
+        dice = 2 * shared / (len(query) + self.sizes[candidates])
+        # Candidates come out of np.unique in row order, so the stable sort keeps ties in row order.
+        candidates = candidates[np.argsort(-dice, kind='stable')[:n * RERANK_FACTOR]]
+        matcher = difflib.SequenceMatcher(b=label.lower(), autojunk=False)
+        ratios = []
+        for i in candidates:
+            matcher.set_seq1(self.words[i].lower())
+            ratios.append(matcher.ratio())
+        order = np.argsort(-np.array(ratios), kind='stable')[:n]
+        return [(self.words[candidates[i]], ratios[i]) for i in order]
+
+
+def open_ngram_index(index_dir, words, W):
+    """Load the trigram index saved in index_dir, building and saving it first if it's missing
+    or was built for a different vocabulary. With no index_dir, it's built in memory."""
+    ngrams_file = None if index_dir is None else os.path.join(index_dir, NGRAMS_NAME)
+    if ngrams_file is not None and os.path.isfile(ngrams_file):
+        index = NgramIndex.load(ngrams_file, words)
+        if index is not None:
+            return index
+    index = NgramIndex.build(words, W)
+    if ngrams_file is not None:
+        if not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+        index.save(ngrams_file)
+    return index
+
+
+class NeighborTable:
+    """The k nearest neighbours already found for vocabulary words, saved in an index directory."""
+
+    def __init__(self, index_dir, vectors_hash, k):
+        self.neighbors_file = None if index_dir is None else os.path.join(index_dir, NEIGHBORS_NAME)
+        self.vectors_hash = vectors_hash
+        self.k = k
+        self.table = {}
+        self.changed = False
+        if self.neighbors_file is not None and os.path.isfile(self.neighbors_file):
+            with np.load(self.neighbors_file) as saved:
+                # Saved neighbours are reused if the vectors are unchanged and enough were kept.
+                if str(saved['vectors_hash']) == vectors_hash and int(saved['k']) >= k:
+                    self.k = int(saved['k'])
+                    self.table = {int(row): (idx, scores) for row, idx, scores
+                                  in zip(saved['rows'], saved['indices'], saved['scores'])}
+
+    def lookup(self, W, rows):
+        """Return the neighbours of each row, as (indices, scores) pairs, finding any not already saved."""
+        missing = sorted({int(row) for row in rows} - set(self.table))
+        if missing:
+            indices, scores = nearest_neighbors(W, missing, self.k)
+            self.table.update({row: (idx, sc) for row, idx, sc in zip(missing, indices, scores)})
+            self.changed = True
+        return [self.table[int(row)] for row in rows]
+
+    def save(self):
+        if self.neighbors_file is None or not self.changed or not self.table:
+            return
+        if not os.path.exists(os.path.dirname(self.neighbors_file) or '.'):
+            os.makedirs(os.path.dirname(self.neighbors_file))
+        rows = sorted(self.table)
+        np.savez(self.neighbors_file, rows=np.array(rows), indices=np.stack([self.table[row][0] for row in rows]),
+                 scores=np.stack([self.table[row][1] for row in rows]), k=self.k, vectors_hash=self.vectors_hash)
+        self.changed = False
+
+
+def read_label_dir(labels_dir):
+    """Return the distinct labels in a directory of label lists, in order of first appearance."""
+    labels = {}
+    for entry in sorted(os.listdir(labels_dir)):
+        path = os.path.join(labels_dir, entry)
+        if os.path.isfile(path) and not entry.startswith('.'):
+            with open(path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        labels.setdefault(line.strip(), None)
+    return list(labels)
+
+
+def write_neighbors(o, label, kind, found):
+    for rank, (word, score) in enumerate(found, 1):
+        o.write("{}\t{}\t{}\t{}\t{}\n".format(label, kind, rank, word, score))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('vectors_file', help='a file of word-features vectors, or an embedding store directory', type=str)
+    parser.add_argument('index_dir', help='a directory where the neighbour and spelling indexes are kept', type=str)
+    parser.add_argument('--labels_dir', help='a directory of label lists to look up', default=None, type=str)
+    parser.add_argument('--words', help='words to look up', nargs='*', default=[])
+    parser.add_argument('--k', help='the number of nearest neighbours listed per label', default=10, type=int)
+    parser.add_argument('--suggestions', help='the number of spelling suggestions listed per out of vocabulary label',
+                        default=5, type=int)
+    parser.add_argument('--output', help='a tab separated file of label, kind, rank, word and score rows; \
+printed if not given', default=None, type=str)
+    args = parser.parse_args()
+
+    labels = list(dict.fromkeys(args.words))
+    if args.labels_dir is not None:
+        given = set(labels)
+        labels += [label for label in read_label_dir(args.labels_dir) if label not in given]
+    W, vocab = embedding_store.load_embeddings(args.vectors_file)
+    words = sorted(vocab, key=vocab.get)
+    in_vocab = [label for label in labels if label in vocab]
+    table = NeighborTable(args.index_dir, embedding_store.fingerprint(args.vectors_file), args.k)
+    found = dict(zip(in_vocab, table.lookup(W, [vocab[label] for label in in_vocab])))
+    table.save()
+    oov = [label for label in labels if label not in vocab]
+    index = open_ngram_index(args.index_dir, words, W) if oov else None
+    o = open(args.output, 'w') if args.output is not None else None
+    try:
+        for label in labels:
+            if label in found:
+                idx, scores = found[label]
+                kind, rows = 'neighbor', [(words[i], score) for i, score in zip(idx[:args.k], scores[:args.k])]
+            else:
+                kind, rows = 'suggestion', index.suggest(label, args.suggestions)
+            if o is not None:
+                write_neighbors(o, label, kind, rows)
+            elif kind == 'neighbor':
+                print(label + ': ' + ', '.join(word for word, _ in rows))
+            else:
+                print(label + ' (not in the vocabulary), did you mean: ' + ', '.join(word for word, _ in rows))
+    finally:
+        if o is not None:
+            o.close()
+    print(f"Looked up {len(in_vocab)} labels in the vocabulary, and suggested spellings for {len(oov)} others.")
+
+
+if __name__ == "__main__":
+    main()
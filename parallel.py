@@ -0,0 +1,60 @@
+# Crystal Butler
+# 2026/10/18
+# Spread independent label sets across a pool of worker processes.
+#
+# Where the operating system supports it, workers are started by forking, so large
+# read-only data loaded by the parent before the pool starts (such as the embedding
+# matrix) is shared with every worker rather than pickled and copied to each one.
+# Results come back in input order, so output matches a serial run, and an exception
+# raised while processing one set is reported without stopping the others.
+# When metrics are on (see metrics.py), each set is timed, and figures recorded in worker
+# processes are sent back and merged into the main process's metrics.
+
+import os
+import multiprocessing
+import traceback
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import metrics
+
+
+def _set_name(item):
+    """Name a set in the metrics by its file name, or its ID."""
+    return os.path.basename(item[0] if isinstance(item, tuple) else str(item))
+
+
+def _call(func, item):
+    try:
+        with metrics.track_set(_set_name(item)):
+            return func(item), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def _call_in_worker(func, item):
+    return _call(func, item) + (metrics.drain(),)
+
+
+def map_sets(func, items, workers=1, initializer=None, initargs=()):
+    """Apply func to each item, yielding (item, result, error) tuples in input order.
+    error is None on success, or the formatted traceback if func raised an exception.
+    With workers <= 1 everything runs in the current process. func, and initializer if
+    given, must be module level functions so that they can be sent to the workers."""
+    items = list(items)
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            result, error = _call(func, item)
+            yield item, result, error
+        return
+    context = None
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    chunksize = max(1, len(items) // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=initializer, initargs=initargs) as pool:
+        for item, (result, error, drained) in zip(items, pool.map(partial(_call_in_worker, func), items,
+                                                                  chunksize=chunksize)):
+            metrics.merge(drained)
+            yield item, result, error
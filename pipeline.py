@@ -0,0 +1,236 @@
+# Crystal Butler
+# 2026/10/18
+# Run the whole label set analysis from one entry point: score all pairs of labels,
+# cluster them, test for cluster coherence and weight the labels.
+#
+# This replaces running create_all_pairs.py, word_pair_distance.py, cluster_synonymy_scores.py
+# and sum_label_weights.py in sequence. Each set's labels, similarity matrix, linkage matrix,
+# clustering statistics and label weights are kept in memory from start to finish, so none
+# of the intermediate pair, score or label files are written. The input is a directory of
+# label lists, with one label per line and one file per stimulus, as for create_all_pairs.py.
+# Set IDs are taken from the beginning of each file name, up to the first "_" or ".".
+#
+# Only the final artifacts are written to output_dir:
+#   -- clustering statistics (to output_dir/Statistics/Pass or Fail)
+#   -- dendrograms (to output_dir/Dendrograms/Pass or Fail), or with --stats_only, linkage matrices
+#      for drawing them later with render_dendrograms.py (to output_dir/Linkage)
+#   -- cumulative label weights, in the sum_label_weights.py layout (to output_dir/Weights)
+#   -- labels not found in the vocabulary, if any (to output_dir/Errors)
+#
+# With --incremental, a manifest of the sets already analyzed is kept in output_dir (see manifest.py),
+# and label lists that haven't changed since they were last analyzed with the same embeddings,
+# --dendro_cutoff, --stats_only, --unique and --large_sets are skipped.
+# With --precision, vectors are held in memory as float16, or as int8 with a scale per row.
+# With --filter_vocab, only the vectors for the labels in the lists being analyzed are loaded.
+# With --unique, each set is scored and clustered from its distinct labels and the number of times
+# each appears (see duplicates.py), which gives the same statistics, weights and dendrograms
+# while only scoring and clustering the distinct labels.
+# With --large_sets, sets with more labels than that are clustered without any pairwise arrays
+# (see large_sets.py): memory grows with the number of distinct labels rather than its square,
+# and the results agree with the usual ones up to rounding. Clustering this way is slower, so it's
+# best kept to sets that wouldn't otherwise fit in memory.
+# With --metrics, time spent in each step, pairs scored, out of vocabulary labels and sets passed
+# and failed are recorded per run and per set (see metrics.py); --profile runs cProfile.
+# With --ensemble, sets are scored with several embedding models at once (see ensemble.py), over the
+# words every model has: each set's similarity matrices for all models come from one batched matrix
+# multiply, and --combine takes their mean or maximum for clustering and weighting, or with each,
+# results are written for every model separately, to a directory named after it in output_dir.
+# wordlists_dir may instead be a label table, with a row for each response (see label_table.py).
+# The results are then written as three tables in output_dir, in the --table_format given:
+# sets, with each set's clustering statistics, weights, with its ranked label weights, and oov,
+# with its labels not found in the vocabulary. No dendrograms or linkage matrices are written.
+# Sets are read a batch at a time, so memory use doesn't grow with the size of the table.
+# The analysis itself is in analysis.py, which other programs can import to analyze sets in process.
+
+import os
+import argparse
+import functools
+import embedding_store
+import clustering
+import analysis
+import ensemble
+import label_table
+import parallel
+import manifest
+import metrics
+
+# The number of sets read from a label table at a time.
+TABLE_BATCH_SETS = 1000
+
+
+def make_input_list(wordlists_dir):
+    label_files = []
+    for entry in sorted(os.listdir(wordlists_dir)):
+        if os.path.isfile(os.path.join(wordlists_dir, entry)) and not entry.startswith('.'):
+            label_files.append(entry)
+    return label_files
+
+
+def load_embeddings(vectors_files, words=None, workers=None, precision=None, combine='mean'):
+    """Load a vectors file, or with several, every model aligned to the words they share (see ensemble.py)."""
+    if len(vectors_files) == 1:
+        return embedding_store.load_embeddings(vectors_files[0], words, workers, precision)
+    return ensemble.load_ensemble(vectors_files, words, workers, precision, 'mean' if combine == 'each' else combine)
+
+
+def model_dirs(output_dir, vectors_files):
+    """With --combine each, each model's results are written to a directory of its own in output_dir."""
+    return [os.path.join(output_dir, name) for name in ensemble.model_names(vectors_files)]
+
+
+def init_worker(vectors_files, precision=None, combine='mean'):
+    """Load the embeddings in a worker process that didn't inherit them from the parent process."""
+    global W, vocab
+    if 'W' not in globals():
+        W, vocab = load_embeddings(vectors_files, precision=precision, combine=combine)
+
+
+def analyze_set(ID, labels, dendro_cutoff=clustering.DENDRO_CUTOFF, unique=False, large_sets=None, combine='mean'):
+    """A set's results, or with combine each, a list of results for each model."""
+    if combine == 'each':
+        return analysis.analyze_model_sets(W, vocab, ID, labels, dendro_cutoff)
+    return analysis.analyze_label_set(W, vocab, ID, labels, dendro_cutoff, unique, large_sets)
+
+
+def process_label_file(filename, wordlists_dir, output_dirs, dendro_cutoff=clustering.DENDRO_CUTOFF, stats_only=False,
+                       unique=False, large_sets=None, combine='mean'):
+    """Analyze one label list, and write its results to output_dirs: the output directory, or with
+    combine each, each model's directory. Returns the files written."""
+    ID = filename.split(".")[0].split("_")[0]  # relies on file name beginning with ID_ or ID.
+    labels = analysis.read_label_list(os.path.join(wordlists_dir, filename))
+    result = analyze_set(ID, labels, dendro_cutoff, unique, large_sets, combine)
+    return [output for output_dir, model_result in zip(output_dirs, result if combine == 'each' else [result])
+            for output in analysis.write_results(model_result, output_dir, dendro_cutoff, stats_only)]
+
+
+def analyze_table_set(item, dendro_cutoff=clustering.DENDRO_CUTOFF, unique=False, large_sets=None, combine='mean'):
+    ID, labels = item
+    result = analyze_set(ID, labels, dendro_cutoff, unique, large_sets, combine)
+    # Linkage matrices aren't written to the results tables, so they aren't sent back from workers.
+    for model_result in (result if combine == 'each' else [result]):
+        model_result['linkage'] = None
+    return result
+
+
+def analyze_label_table(table_path, vectors_files, output_dirs, dendro_cutoff=clustering.DENDRO_CUTOFF, unique=False,
+                        large_sets=None, combine='mean', precision=None, filter_vocab=False, parse_workers=None,
+                        workers=1, table_format='csv', shard_rows=None, grouped=True):
+    """Analyze every set in a label table, a batch of sets at a time, writing the results tables to
+    output_dirs. Raises label_table.UngroupedSetsError if grouped and a set's rows aren't all
+    together, once the tables hold the sets before it and are closed."""
+    global W, vocab
+    words = label_table.table_words(table_path) if filter_vocab else None
+    with metrics.stage('load_embeddings'):
+        W, vocab = load_embeddings(vectors_files, words, parse_workers, precision, combine)
+    model_tables = [analysis.open_tables(output_dir, table_format, shard_rows) for output_dir in output_dirs]
+    analyze = functools.partial(analyze_table_set, dendro_cutoff=dendro_cutoff, unique=unique, large_sets=large_sets,
+                                combine=combine)
+    sets = label_table.iter_sets(table_path, grouped=grouped)
+    try:
+        for batch in label_table.batches(sets, TABLE_BATCH_SETS):
+            for (ID, _), result, error in parallel.map_sets(analyze, batch, workers, init_worker,
+                                                            (vectors_files, precision, combine)):
+                if error is not None:
+                    print(f"Unable to analyze set {ID}:\n{error}")
+                    continue
+                for tables, model_result in zip(model_tables, result if combine == 'each' else [result]):
+                    analysis.write_table_results(tables, model_result)
+    finally:
+        # Sets that aren't grouped are only found partway through the table, so the results so far are still closed.
+        for tables in model_tables:
+            for table in tables.values():
+                table.close()
+
+
+def main():
+    global W, vocab
+    parser = argparse.ArgumentParser()
+    parser.add_argument('vectors_file', help='a file of word-features vectors, or an embedding store directory', type=str)
+    parser.add_argument('wordlists_dir', help='directory where individual word lists by ID are stored', type=str)
+    parser.add_argument('output_dir', help='directory where statistics, dendrograms, weights and errors are written', type=str)
+    parser.add_argument('--dendro_cutoff', help='the cutoff value for agglomerative hierarchical clustering',
+                        default=clustering.DENDRO_CUTOFF, type=float)
+    parser.add_argument('--stats_only', help='save linkage matrices, but skip drawing dendrograms', action='store_true')
+    parser.add_argument('--workers', help='the number of processes used to analyze label sets in parallel', default=1, type=int)
+    parser.add_argument('--incremental', help='skip label lists that are unchanged since they were last analyzed into \
+output_dir', action='store_true')
+    parser.add_argument('--filter_vocab', help='load only the vectors for words in the label lists being analyzed',
+                        action='store_true')
+    parser.add_argument('--precision', help='the precision vectors are held at in memory; by default, the precision \
+of a store, or float64 for a text vectors file', default=None, choices=embedding_store.PRECISIONS)
+    parser.add_argument('--parse_workers', help='the number of processes used to parse a text vectors file; one per CPU \
+if not given', default=None, type=int)
+    parser.add_argument('--unique', help='score and cluster distinct labels only, weighted by how many times \
+they appear', action='store_true')
+    parser.add_argument('--large_sets', help='cluster sets with more than this many labels in bounded memory, from \
+their distinct labels', default=None, type=int)
+    parser.add_argument('--ensemble', help='more vectors files or stores, to score sets with alongside vectors_file, over \
+the words they all share', nargs='+', default=None, type=str)
+    parser.add_argument('--combine', help="how an ensemble's scores are combined: their mean or maximum, or each to \
+write results for each model separately", default='mean', choices=ensemble.COMBINE + ['each'])
+    parser.add_argument('--table_format', help='the format of the results tables written for a label table',
+                        default='csv', choices=label_table.FORMATS)
+    parser.add_argument('--shard_rows', help='split each results table into shards of this many rows', default=None, type=int)
+    parser.add_argument('--ungrouped', help="a label table's rows for each set aren't all together, so group them \
+through temporary files", action='store_true')
+    parser.add_argument('--metrics', help='a .json or .csv file where run metrics are written', default=None, type=str)
+    parser.add_argument('--profile', help='a file where cProfile stats for the run are written', default=None, type=str)
+    args = parser.parse_args()
+    if args.combine != 'mean' and not args.ensemble:
+        parser.error("--combine needs the vectors files of an --ensemble.")
+    if args.combine == 'each' and (args.unique or args.large_sets is not None):
+        parser.error("--combine each scores every label of a set, so it can't be used with --unique or --large_sets.")
+    vectors_files = [args.vectors_file] + (args.ensemble or [])
+    output_dirs = model_dirs(args.output_dir, vectors_files) if args.combine == 'each' else [args.output_dir]
+
+    metrics.start(args.metrics, args.profile)
+    if label_table.is_label_table(args.wordlists_dir):
+        if args.incremental:
+            parser.error("--incremental can't be used with a label table, since the results tables are rewritten.")
+        try:
+            analyze_label_table(args.wordlists_dir, vectors_files, output_dirs, args.dendro_cutoff, args.unique,
+                                args.large_sets, args.combine, args.precision, args.filter_vocab, args.parse_workers,
+                                args.workers, args.table_format, args.shard_rows, not args.ungrouped)
+        except label_table.UngroupedSetsError as e:
+            parser.error(f"{e} The results tables only hold the sets before it.")
+        return
+    if not os.path.isdir(args.wordlists_dir):
+        print("The word lists directory doesn't exist, or you input a file name rather than a directory name: exiting.")
+        return
+    for output_dir in output_dirs:
+        analysis.make_output_subdirs(output_dir, args.stats_only)
+    label_files = make_input_list(args.wordlists_dir)
+    run_manifest = None
+    if args.incremental:
+        run_manifest = manifest.Manifest(args.output_dir, "pipeline")
+        run_manifest.set_params({'vectors': ensemble.fingerprint(vectors_files, run_manifest.fingerprint),
+                                 'dendro_cutoff': args.dendro_cutoff, 'stats_only': args.stats_only,
+                                 'unique': args.unique, 'precision': args.precision, 'large_sets': args.large_sets,
+                                 'combine': args.combine})
+        input_hashes = {filename: manifest.hash_files([os.path.join(args.wordlists_dir, filename)])
+                        for filename in label_files}
+        remaining = [filename for filename in label_files if not run_manifest.is_current(filename, input_hashes[filename])]
+        print(f"{len(label_files) - len(remaining)} of {len(label_files)} label lists are unchanged, and will be skipped.")
+        label_files = remaining
+    if label_files:
+        words = None
+        if args.filter_vocab:
+            words = {label for filename in label_files
+                     for label in analysis.read_label_list(os.path.join(args.wordlists_dir, filename))}
+        with metrics.stage('load_embeddings'):
+            W, vocab = load_embeddings(vectors_files, words, args.parse_workers, args.precision, args.combine)
+    process = functools.partial(process_label_file, wordlists_dir=args.wordlists_dir, output_dirs=output_dirs,
+                                dendro_cutoff=args.dendro_cutoff, stats_only=args.stats_only, unique=args.unique,
+                                large_sets=args.large_sets, combine=args.combine)
+    for filename, outputs, error in parallel.map_sets(process, label_files, args.workers, init_worker,
+                                                      (vectors_files, args.precision, args.combine)):
+        if error is not None:
+            print(f"Unable to analyze {filename}:\n{error}")
+        elif run_manifest is not None:
+            run_manifest.record(filename, input_hashes[filename], outputs)
+    if run_manifest is not None:
+        run_manifest.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Crystal Butler
+# 2026/10/18
+# Report how much reduced precision vectors (see embedding_store.py) change the pipeline's results,
+# to choose the smallest precision that leaves them unchanged.
+#
+# The vectors are loaded once at float64, for the words in the synonymy benchmark and in a sample
+# of label lists, then converted to each precision in turn. For each precision, the report gives:
+#   -- the memory the full vocabulary takes at that precision
+#   -- the maximum and mean absolute drift of the benchmark pair scores from float64
+#   -- the maximum and mean absolute drift of the label sets' pair scores from float64
+#   -- how many sets change between pass and fail in the cluster coherence test, how many change
+#      between the Pass and Fail output directories, and the largest change in the percentage
+#      membership of the largest cluster
+# The reference is float64 only for a text vectors file; a store's vectors have already been rounded
+# to its own precision.
+
+import os
+import random
+import argparse
+import numpy as np
+import embedding_store
+import similarity
+import clustering
+
+def read_benchmark_pairs(scores_file):
+    import pandas as pd
+    # The file starts with a byte order mark.
+    table = pd.read_csv(scores_file, encoding='utf-8-sig')
+    return list(zip(table['Input.Word1'].astype(str).str.strip(), table['Input.Word2'].astype(str).str.strip()))
+
+
+def sample_label_lists(wordlists_dir, sample, seed):
+    """Read a random sample of the label lists in wordlists_dir, in file name order."""
+    label_files = sorted(entry for entry in os.listdir(wordlists_dir)
+                         if os.path.isfile(os.path.join(wordlists_dir, entry)) and not entry.startswith('.'))
+    if 0 < sample < len(label_files):
+        label_files = sorted(random.Random(seed).sample(label_files, sample))
+    label_sets = []
+    for filename in label_files:
+        with open(os.path.join(wordlists_dir, filename), 'r') as f:
+            label_sets.append([line.strip() for line in f if line.strip()])
+    return label_sets
+
+
+def pair_scores(W, vocab, pairs):
+    """Score the pairs with both words in the vocabulary, as similarity.pair_score() does."""
+    found = [(vocab[w1], vocab[w2]) for w1, w2 in pairs if w1 in vocab and w2 in vocab]
+    if not found:
+        return np.empty(0)
+    rows1, rows2 = zip(*found)
+    E1, E2 = np.asarray(W[list(rows1)], dtype=np.float64), np.asarray(W[list(rows2)], dtype=np.float64)
+    return np.einsum('ij,ij->i', E1, E2).astype(similarity.score_dtype(W.dtype)).astype(np.float64)
+
+
+def cluster_set(W, idx, dendro_cutoff=clustering.DENDRO_CUTOFF):
+    """Return a set's condensed scores and its largest cluster percentage, or None if it can't be clustered."""
+    scores = np.asarray(similarity.condensed_scores(similarity.similarity_matrix(W, idx)), dtype=np.float64)
+    try:
+        # Sets whose scores are all the same can't be normalized, so they aren't clustered.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            linkage_matrix = clustering.build_linkage_matrix(clustering.scores_to_distances(scores))
+    except ValueError:
+        return scores, None
+    _, pct = clustering.calculate_membership(linkage_matrix, dendro_cutoff)
+    return scores, pct
+
+
+def filed_as(pct):
+    return 'Pass' if pct >= clustering.PASS_DIR_PCT else 'Fail'
+
+
+def memory_mb(vocab_size, dim, precision):
+    """The memory the full vocabulary takes at a precision."""
+    if precision == 'int8':
+        return vocab_size * (dim + 4) / (1 << 20)
+    return vocab_size * dim * np.dtype(precision).itemsize / (1 << 20)
+
+
+def drift(reference, scores):
+    """The maximum and mean absolute difference between two arrays of scores."""
+    if not len(reference):
+        return np.nan, np.nan
+    difference = np.abs(scores - reference)
+    return float(np.max(difference)), float(np.mean(difference))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('vectors_file', help='a file of word-features vectors, or an embedding store directory', type=str)
+    parser.add_argument('--wordlists_dir', help='a directory of label lists, one label per line, to sample sets from',
+                        default=None, type=str)
+    parser.add_argument('--sample', help='the number of label lists sampled from wordlists_dir; all of them if 0',
+                        default=200, type=int)
+    parser.add_argument('--seed', help='the random seed for sampling label lists', default=0, type=int)
+    parser.add_argument('--precisions', help='a comma separated list of precisions to compare with float64',
+                        default='float32,float16,int8', type=str)
+    parser.add_argument('--scores_file', help='the synonymy benchmark word pairs',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'synonyms_dataset',
+                                             'synonymy_scores.csv'), type=str)
+    parser.add_argument('--dendro_cutoff', help='the cutoff value for agglomerative hierarchical clustering',
+                        default=clustering.DENDRO_CUTOFF, type=float)
+    parser.add_argument('--output', help='a tab separated file where the report is written', default=None, type=str)
+    args = parser.parse_args()
+
+    if not embedding_store.is_store(args.vectors_file):
+        reference_precision = 'float64'
+    else:
+        reference_precision = str(embedding_store.vectors_dtype(args.vectors_file))
+        print(f"{args.vectors_file} is a store, so scores are compared with its own {reference_precision} vectors.")
+    pairs = read_benchmark_pairs(args.scores_file)
+    label_sets = [] if args.wordlists_dir is None else sample_label_lists(args.wordlists_dir, args.sample, args.seed)
+    words = {w for pair in pairs for w in pair} | {label for labels in label_sets for label in labels}
+    W64, vocab = embedding_store.load_embeddings(args.vectors_file, words, precision='float64')
+    vocab_size = sum(1 for _ in embedding_store.iter_words(args.vectors_file))
+    set_idx = [similarity.label_indices(vocab, labels)[0] for labels in label_sets]
+    set_idx = [idx for idx in set_idx if len(idx) >= 2]
+    reference_pairs = pair_scores(W64, vocab, pairs)
+    reference_sets = [cluster_set(W64, idx, args.dendro_cutoff) for idx in set_idx]
+    rows = []
+    for precision in args.precisions.split(','):
+        W = embedding_store.to_precision(W64, precision.strip())
+        row = {'precision': precision.strip(), 'memory_mb': memory_mb(vocab_size, W64.shape[1], precision.strip())}
+        row['benchmark_max_drift'], row['benchmark_mean_drift'] = drift(reference_pairs, pair_scores(W, vocab, pairs))
+        results = [cluster_set(W, idx, args.dendro_cutoff) for idx in set_idx]
+        row['sets_max_drift'], row['sets_mean_drift'] = drift(
+            np.concatenate([np.empty(0)] + [scores for scores, _ in reference_sets]),
+            np.concatenate([np.empty(0)] + [scores for scores, _ in results]))
+        compared = [(reference, pct) for (_, reference), (_, pct) in zip(reference_sets, results)
+                    if reference is not None and pct is not None]
+        row['sets'] = len(compared)
+        row['pass_fail_changes'] = sum(clustering.classify_pass_fail(reference) != clustering.classify_pass_fail(pct)
+                                       for reference, pct in compared)
+        row['pass_dir_changes'] = sum(filed_as(reference) != filed_as(pct) for reference, pct in compared)
+        row['max_pct_change'] = max([abs(reference - pct) for reference, pct in compared], default=0.0)
+        rows.append(row)
+    import pandas as pd
+    report = pd.DataFrame(rows)
+    print(f"Compared with {reference_precision}, over {len(reference_pairs)} benchmark pairs and {len(set_idx)} label sets:")
+    print(report.to_string(index=False))
+    unchanged = [row for row in rows if row['pass_fail_changes'] == 0 and row['pass_dir_changes'] == 0]
+    if unchanged:
+        # Ranked by the memory for this vocabulary and dimension, since int8's scales cost more per row at small sizes.
+        smallest = min(unchanged, key=lambda row: row['memory_mb'])['precision']
+        print(f"The smallest precision with no pass or fail changes is {smallest}.")
+    if args.output is not None:
+        report.to_csv(args.output, sep='\t', index=False)
+
+
+if __name__ == "__main__":
+    main()
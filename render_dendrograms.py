@@ -0,0 +1,88 @@
+# Crystal Butler
+# 2026/10/18
+# Draw dendrograms from the linkage matrices saved by cluster_synonymy_scores.py or
+# pipeline.py when run with --stats_only.
+#
+# Rendering is by far the slowest part of clustering, and only a few of the dendrograms
+# are usually inspected, so this script draws just a chosen subset of the label sets:
+# those filed under Pass or Fail, a random sample of them, or a given list of set IDs.
+# Dendrograms are written to clustering_dir/Dendrograms/Pass or Fail, exactly as they
+# would have been by the clustering script.
+# With --metrics, rendering time is recorded per run and per set (see metrics.py).
+
+import os
+import argparse
+import functools
+import random
+import clustering
+import parallel
+import metrics
+
+def make_input_list(clustering_dir):
+    linkage_dir = os.path.join(clustering_dir, 'Linkage')
+    linkage_files = []
+    for entry in sorted(os.listdir(linkage_dir)):
+        if entry.endswith('.npz') and not entry.startswith('.'):
+            linkage_files.append(os.path.join(linkage_dir, entry))
+    return linkage_files
+
+
+def select_linkage_files(linkage_files, select='all', sample=None, seed=0, ids_file=None):
+    """Narrow the saved sets down to those listed in ids_file, filed under select, and a random
+    sample fraction of them."""
+    if ids_file is not None:
+        with open(ids_file, 'r') as f:
+            ids = set(line.strip() for line in f if line.strip())
+        linkage_files = [l for l in linkage_files if os.path.basename(l)[:-len('.npz')] in ids]
+    if select != 'all':
+        selected = []
+        for linkage_file in linkage_files:
+            _, _, _, pct = clustering.load_linkage(linkage_file)
+            if (pct >= clustering.PASS_DIR_PCT) == (select == 'pass'):
+                selected.append(linkage_file)
+        linkage_files = selected
+    if sample is not None:
+        count = int(round(sample * len(linkage_files)))
+        linkage_files = sorted(random.Random(seed).sample(linkage_files, count))
+    return linkage_files
+
+
+def render_dendrogram(linkage_file, clustering_dir):
+    linkage_matrix, labels_array, dendro_cutoff, pct = clustering.load_linkage(linkage_file)
+    dendro_name = os.path.basename(linkage_file)[:-len('.npz')]
+    dendro_file, _ = clustering.make_output_filenames(clustering_dir, pct, dendro_name)
+    clustering.plot_dendrogram(linkage_matrix, labels_array, dendro_name, dendro_cutoff, dendro_file)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('clustering_dir', help='full path to a clustering output directory containing a Linkage \
+subdirectory', type=str)
+    parser.add_argument('--select', help='draw dendrograms for sets filed under pass, fail or all', default='all',
+                        choices=['pass', 'fail', 'all'], type=str)
+    parser.add_argument('--sample', help='draw a random fraction of the selected sets, between 0 and 1', default=None, type=float)
+    parser.add_argument('--seed', help='random seed used with --sample', default=0, type=int)
+    parser.add_argument('--ids_file', help='a file of set IDs to draw, one per line', default=None, type=str)
+    parser.add_argument('--workers', help='the number of processes used to draw dendrograms in parallel', default=1, type=int)
+    parser.add_argument('--metrics', help='a .json or .csv file where run metrics are written', default=None, type=str)
+    parser.add_argument('--profile', help='a file where cProfile stats for the run are written', default=None, type=str)
+    args = parser.parse_args()
+
+    metrics.start(args.metrics, args.profile)
+    if not os.path.isdir(os.path.join(args.clustering_dir, 'Linkage')):
+        print("No Linkage directory found: run the clustering script with --stats_only first.")
+        return
+    for subdir in ['Dendrograms/Pass', 'Dendrograms/Fail']:
+        if not os.path.exists(os.path.join(args.clustering_dir, subdir)):
+            os.makedirs(os.path.join(args.clustering_dir, subdir))
+    linkage_files = select_linkage_files(make_input_list(args.clustering_dir), args.select, args.sample, args.seed,
+                                         args.ids_file)
+    print(f"Drawing {len(linkage_files)} dendrograms.")
+    render = functools.partial(render_dendrogram, clustering_dir=args.clustering_dir)
+    for linkage_file, _, error in parallel.map_sets(render, linkage_files, args.workers):
+        if error is not None:
+            print(f"Unable to draw a dendrogram from {linkage_file}:\n{error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# Crystal Butler
+# 2026/10/18
+# A compact binary container for per-set similarity scores, as an alternative to the
+# Label_Lists, Score_Lists, Label_and_Score_Lists and Errors text files written by
+# word_pair_distance.py.
+#
+# A container is a zip archive of .npy arrays, so it can also be opened with numpy.load.
+# Each label set contributes three arrays, named by set ID:
+#   -- <ID>/labels: the labels found in the vocabulary, in set order
+#   -- <ID>/scores: the condensed upper triangle of the set's similarity matrix, as float32
+#   -- <ID>/oov: the labels not found in the vocabulary, if any
+# Sets can be read back in any order, by ID, without reading the rest of the archive.
+# Large runs can be split into shards: a directory of containers holding up to a fixed
+# number of sets each, which is read as if it were a single container.
+# A container can be reopened to append more sets; if a set ID is written again, the
+# most recently written copy is the one that's read back.
+
+import os
+import zipfile
+import warnings
+import numpy as np
+
+# Constants, used to name container files and the arrays inside them.
+SUFFIX = ".npz"
+SHARD_NAME = "scores-{:05d}" + SUFFIX
+ARRAY_NAMES = ('labels', 'scores', 'oov')
+
+
+def is_score_store(path):
+    """A score container is a .npz file, or a directory of .npz shards."""
+    if os.path.isfile(path):
+        return path.endswith(SUFFIX)
+    if os.path.isdir(path):
+        return any(entry.endswith(SUFFIX) for entry in os.listdir(path))
+    return False
+
+
+class ScoreWriter:
+    """Append label sets to a score container. If shard_size is given, path is a directory,
+    and a new shard is started every shard_size sets. With append, sets are added to an
+    existing container, or in new shards after the existing ones, rather than replacing it."""
+
+    def __init__(self, path, shard_size=None, append=False):
+        self.path = path
+        self.shard_size = shard_size
+        self.shard = -1
+        self.count = 0
+        self.archive = None
+        if shard_size is not None:
+            if not os.path.exists(path):
+                os.makedirs(path)
+            elif append:
+                shards = [entry for entry in os.listdir(path) if entry.startswith('scores-') and entry.endswith(SUFFIX)]
+                self.shard = max([int(entry[len('scores-'):-len(SUFFIX)]) for entry in shards], default=-1)
+        else:
+            mode = 'a' if append and os.path.exists(path) else 'w'
+            self.archive = zipfile.ZipFile(path, mode, zipfile.ZIP_STORED, allowZip64=True)
+
+    def _next_shard(self):
+        if self.archive is not None:
+            self.archive.close()
+        self.shard += 1
+        self.archive = zipfile.ZipFile(os.path.join(self.path, SHARD_NAME.format(self.shard)), 'w',
+                                       zipfile.ZIP_STORED, allowZip64=True)
+
+    def write(self, ID, labels, scores, oov):
+        if self.shard_size is not None and self.count % self.shard_size == 0:
+            self._next_shard()
+        arrays = (np.asarray(labels, dtype=str), np.asarray(scores, dtype=np.float32), np.asarray(oov, dtype=str))
+        for name, array in zip(ARRAY_NAMES, arrays):
+            with warnings.catch_warnings():
+                warnings.filterwarnings('ignore', 'Duplicate name', UserWarning)
+                member = self.archive.open(ID + '/' + name + '.npy', 'w', force_zip64=True)
+            with member:
+                np.lib.format.write_array(member, array, allow_pickle=False)
+        self.count += 1
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ScoreReader:
+    """Random access, by set ID, to the sets in a score container or a directory of shards."""
+
+    def __init__(self, path):
+        if os.path.isdir(path):
+            paths = [os.path.join(path, entry) for entry in sorted(os.listdir(path)) if entry.endswith(SUFFIX)]
+        else:
+            paths = [path]
+        self.archives = [zipfile.ZipFile(p, 'r') for p in paths]
+        self.index = {}
+        for archive in self.archives:
+            for name in archive.namelist():
+                ID, array_name = name.rsplit('/', 1)
+                if array_name == 'labels.npy':
+                    self.index[ID] = archive
+
+    def ids(self):
+        return sorted(self.index)
+
+    def __contains__(self, ID):
+        return ID in self.index
+
+    def _read_array(self, ID, name):
+        with self.index[ID].open(ID + '/' + name + '.npy') as member:
+            return np.lib.format.read_array(member, allow_pickle=False)
+
+    def checksum(self, ID):
+        """Return a checksum of a set's arrays, from the CRCs stored in the archive, without reading them."""
+        archive = self.index[ID]
+        return "-".join("{:08x}".format(archive.getinfo(ID + '/' + name + '.npy').CRC) for name in ARRAY_NAMES)
+
+    def read(self, ID):
+        """Return the labels, condensed float32 scores and out of vocabulary labels for a set."""
+        return tuple(self._read_array(ID, name) for name in ARRAY_NAMES)
+
+    def close(self):
+        for archive in self.archives:
+            archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
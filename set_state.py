@@ -0,0 +1,130 @@
+# Crystal Butler
+# 2026/10/18
+# Saved analysis state for label sets that grow as new free responses arrive.
+#
+# Rather than regenerating all pairs and rescoring a whole set whenever a response is added,
+# a SetState keeps everything needed to bring the set's results up to date:
+#   -- the responses, in the order they arrived, and which of them are out of vocabulary
+#   -- the similarity matrix of the labels found in the vocabulary
+#   -- each label's total similarity with every other label, from which the label weights
+#      are ranked as in sum_label_weights.py
+# Appending k labels to a set of n scores only the k x n new pairs and the k x k pairs among
+# the new labels, and adds their scores to the totals. Clustering statistics are recomputed
+# from the saved matrix, which takes milliseconds for a set of a few hundred labels.
+# Results are the same as pipeline.py gives for the full label list, to within rounding.
+#
+# Each set's state is saved to its own .npz file, along with the fingerprint of the embeddings
+# that scored it; a set scored with other embeddings is rescored from its saved responses.
+
+import os
+import numpy as np
+import similarity
+import clustering
+import label_weights
+import metrics
+
+# Constant, used to name state files.
+SUFFIX = ".npz"
+
+
+def state_filename(state_dir, ID):
+    return os.path.join(state_dir, ID + SUFFIX)
+
+
+class SetState:
+    """The responses, similarity matrix and label weight totals of one label set."""
+
+    def __init__(self, ID, vectors=None):
+        self.ID = ID
+        self.vectors = vectors
+        self.responses = []
+        self.labels = []
+        self.oov = []
+        self.totals = np.empty(0)
+        # The similarity matrix is the top left n x n block of a larger buffer, so that
+        # appending labels doesn't copy it every time.
+        self._buffer = np.empty((0, 0))
+
+    @property
+    def S(self):
+        n = len(self.labels)
+        return self._buffer[:n, :n]
+
+    def _reserve(self, n, dtype):
+        if len(self._buffer) >= n and self._buffer.dtype == dtype:
+            return
+        buffer = np.empty((max(n, 2 * len(self._buffer)),) * 2, dtype=dtype)
+        m = len(self.labels)
+        buffer[:m, :m] = self._buffer[:m, :m]
+        self._buffer = buffer
+
+    def append(self, W, vocab, new_labels):
+        """Add labels to the set, scoring only the pairs that include a new label.
+        Returns the number of pairs scored."""
+        self.responses.extend(new_labels)
+        idx, oov_mask = similarity.label_indices(vocab, new_labels)
+        self.oov.extend(label for label, oov in zip(new_labels, oov_mask) if oov)
+        found = [label for label, oov in zip(new_labels, oov_mask) if not oov]
+        if not found:
+            return 0
+        n, k = len(self.labels), len(found)
+        old_idx = similarity.label_indices(vocab, self.labels)[0]
+        with metrics.stage('score'):
+            # The new labels' rows of the similarity matrix, against the old labels and then each other.
+            rows = similarity.similarity_block(W, idx, np.concatenate([old_idx, idx]))
+        self._reserve(n + k, rows.dtype)
+        self._buffer[n:n + k, :n + k] = rows
+        self._buffer[:n + k, n:n + k] = rows.T
+        block64 = rows.astype(np.float64)
+        with metrics.stage('weights'):
+            self.totals = np.concatenate([self.totals + block64[:, :n].sum(axis=0),
+                                          block64.sum(axis=1) - np.diag(block64[:, n:])])
+        self.labels.extend(found)
+        pairs = k * n + k * (k - 1) // 2
+        metrics.count('pairs_scored', pairs)
+        return pairs
+
+    def rescore(self, W, vocab, vectors):
+        """Score the saved responses again, with other embeddings."""
+        responses = self.responses
+        self.__init__(self.ID, vectors)
+        return self.append(W, vocab, responses)
+
+    def weights(self, top_k=None):
+        return label_weights.label_weights_from_totals(self.labels, self.totals, top_k)
+
+    def cluster(self, dendro_cutoff=clustering.DENDRO_CUTOFF):
+        """Cluster the set as pipeline.py does. Returns the linkage matrix, cophenetic coefficient,
+        cluster membership and largest cluster percentage, or None for sets with fewer than two labels."""
+        if len(self.labels) < 2:
+            return None
+        return clustering.cluster_scores(similarity.condensed_scores(np.asarray(self.S, dtype=np.float64)), dendro_cutoff)
+
+    def result(self, dendro_cutoff=clustering.DENDRO_CUTOFF):
+        """Return the set's results in the dictionary analysis.analyze_label_set() returns."""
+        result = {'ID': self.ID, 'labels': list(self.labels), 'oov': list(self.oov), 'weights': self.weights(),
+                  'linkage': None}
+        clustered = self.cluster(dendro_cutoff)
+        if clustered is not None:
+            result['linkage'], result['cophenetic'], result['membership'], result['pct'] = clustered
+        return result
+
+    def save(self, path):
+        """Write the state to path, replacing any earlier state only once it's completely written."""
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, vectors=np.asarray('' if self.vectors is None else self.vectors, dtype=str),
+                     responses=np.asarray(self.responses, dtype=str), labels=np.asarray(self.labels, dtype=str),
+                     oov=np.asarray(self.oov, dtype=str), S=self.S, totals=self.totals)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, ID):
+        with np.load(path) as saved:
+            state = cls(ID, str(saved['vectors']) or None)
+            state.responses = saved['responses'].tolist()
+            state.labels = saved['labels'].tolist()
+            state.oov = saved['oov'].tolist()
+            state.totals = saved['totals']
+            state._buffer = saved['S']
+        return state
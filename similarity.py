@@ -0,0 +1,154 @@
+# Crystal Butler
+# 2026/10/18
+# Batched cosine similarity scoring for whole label sets.
+#
+# Rather than scoring one word pair at a time, each set's labels are resolved to
+# embedding row indices once, and the full label x label cosine similarity matrix is
+# computed with a single gather and matrix multiply. The condensed upper triangle of
+# that matrix holds the scores in the same order as the all-pairs files written by
+# create_all_pairs.py: (0, 1), (0, 2), ..., (0, n-1), (1, 2), ..., (n-2, n-1).
+
+import math
+import numpy as np
+import similarity_cache
+
+
+def labels_from_pairs(pairs_file):
+    """Recover the ordered label list from an all-pairs file written by create_all_pairs.py.
+    A list of n labels produces n(n-1)/2 pair lines, the first n-1 of which pair the
+    first label with every other label."""
+    with open(pairs_file, 'r') as f:
+        pairs_count = sum(1 for line in f)
+    if pairs_count == 0:
+        return []
+    labels_count = int(round((1 + math.sqrt(1 + 8 * pairs_count)) / 2))
+    if (labels_count * (labels_count - 1)) // 2 != pairs_count:
+        raise ValueError(f"{pairs_file} has {pairs_count} lines, which is not a complete all-pairs list.")
+    labels = []
+    with open(pairs_file, 'r') as f:
+        for i, line in enumerate(f):
+            if i == labels_count - 1:
+                break
+            words = line.split()
+            if len(words) != 2:
+                raise ValueError(f"Need a word pair but got {words} from file {pairs_file}.")
+            if i == 0:
+                labels.append(words[0])
+            labels.append(words[1])
+    return labels
+
+
+def all_pairs(labels):
+    """Yield every pair of labels in a set, in the order create_all_pairs.py writes them.
+    Duplicate labels are kept, and paired as with any other label."""
+    for i in range(len(labels)):
+        for j in range(i + 1, len(labels)):
+            yield labels[i], labels[j]
+
+
+def label_indices(vocab, labels):
+    """Resolve labels to embedding row indices. Returns the row indices of labels found in
+    the vocabulary and a boolean mask marking the positions of out of vocabulary labels."""
+    oov_mask = np.array([label not in vocab for label in labels], dtype=bool)
+    idx = np.array([vocab[label] for label in labels if label in vocab], dtype=np.intp)
+    return idx, oov_mask
+
+
+def score_dtype(dtype):
+    """The dtype scores are kept at for vectors of dtype: float32, or float64 for float64 vectors.
+    Products are accumulated in float64 either way, so reduced precision vectors lose no more
+    accuracy in scoring than they did in storage."""
+    return np.promote_types(dtype, np.float32)
+
+
+def pair_score(W, vocab, word1, word2):
+    """Score one word pair, or return similarity_cache.OOV_SCORE if either word isn't in the vocabulary."""
+    if word1 not in vocab or word2 not in vocab:
+        return similarity_cache.OOV_SCORE
+    if hasattr(W, 'similarity_block'):
+        # Several models' scores are combined by the ensemble (see ensemble.py).
+        return W.similarity_block([vocab[word1]], [vocab[word2]])[0, 0]
+    # Cosine similarity is calculated as (vector1 • vector2) / (\\vector1\\ * \\vector2\\). But the magnitudes of
+    # our vectors have all been normalized to 1, so this reduces to a vector dot product.
+    # Reduced precision vectors are accumulated in float64, so scores don't depend on summation order.
+    vector1, vector2 = W[vocab[word1]], W[vocab[word2]]
+    return np.dot(vector1.astype(np.float64), vector2.astype(np.float64)).astype(score_dtype(vector1.dtype))
+
+
+def similarity_matrix(W, idx):
+    """Compute the cosine similarity matrix for the given rows of the normalized matrix W.
+    Reduced precision vectors are accumulated in float64, then rounded to score_dtype(),
+    so that each score is the same as pair_score() gives for the pair."""
+    if hasattr(W, 'similarity_matrix'):
+        return W.similarity_matrix(idx)
+    E = W[idx]
+    if E.dtype == np.float64:
+        return E @ E.T
+    E64 = E.astype(np.float64)
+    return (E64 @ E64.T).astype(score_dtype(E.dtype))
+
+
+def similarity_block(W, rows, cols):
+    """Compute the cosine similarities between the given rows of W and the given columns,
+    rounded as similarity_matrix() rounds them."""
+    if hasattr(W, 'similarity_block'):
+        return W.similarity_block(rows, cols)
+    E1, E2 = W[rows], W[cols]
+    if E1.dtype == np.float64:
+        return E1 @ E2.T
+    return (E1.astype(np.float64) @ E2.astype(np.float64).T).astype(score_dtype(E1.dtype))
+
+
+def condensed_scores(S):
+    """Serialize the upper triangle of a square similarity matrix, omitting the diagonal."""
+    return S[np.triu_indices(len(S), 1)]
+
+
+def score_label_set(W, vocab, labels, unique=False):
+    """Score all pairs of in-vocabulary labels in a set with one matrix multiply.
+    Returns the in-vocabulary labels, the out of vocabulary mask over the input labels
+    and the condensed similarity scores. With unique, only the distinct labels are scored,
+    and their scores are repeated for duplicates, which scores sets with many duplicate labels
+    in less time; scores may differ from the full matrix multiply in the last digit."""
+    idx, oov_mask = label_indices(vocab, labels)
+    in_labels = [label for label, oov in zip(labels, oov_mask) if not oov]
+    if unique:
+        unique_idx, inverse = np.unique(idx, return_inverse=True)
+        scores = condensed_scores(similarity_matrix(W, unique_idx)[np.ix_(inverse, inverse)])
+    else:
+        scores = condensed_scores(similarity_matrix(W, idx))
+    return in_labels, oov_mask, scores
+
+
+def score_label_set_cached(get_embeddings, labels, cache, dtype=np.float64):
+    """Score a label set as score_label_set() does, looking scores up in a SimilarityCache first.
+    Every unordered pair of distinct labels is looked up, along with each label paired with
+    itself, which tells whether the label is in the vocabulary. get_embeddings is a function
+    returning (W, vocab); it is only called if some pairs aren't cached, so a fully cached set
+    is scored without loading the embeddings at all. Scores are returned as dtype, which
+    should be the dtype of the embeddings, so that cached and computed scores print the same."""
+    unique = sorted(set(labels))
+    keys = [(a, b) for i, a in enumerate(unique) for b in unique[i:]]
+    found = cache.get_many(keys)
+    if len(found) < len(keys):
+        W, vocab = get_embeddings()
+        idx, oov_mask = label_indices(vocab, unique)
+        S = similarity_matrix(W, idx)
+        row = np.cumsum(~oov_mask) - 1
+        computed = {}
+        for i, a in enumerate(unique):
+            for j in range(i, len(unique)):
+                if (a, unique[j]) in found:
+                    continue
+                if oov_mask[i] or oov_mask[j]:
+                    computed[(a, unique[j])] = similarity_cache.OOV_SCORE
+                else:
+                    computed[(a, unique[j])] = S[row[i], row[j]]
+        cache.put_many(computed)
+        found.update(computed)
+    in_vocab = {a for a in unique if found[(a, a)] != similarity_cache.OOV_SCORE}
+    oov_mask = np.array([label not in in_vocab for label in labels], dtype=bool)
+    in_labels = [label for label in labels if label in in_vocab]
+    scores = np.array([found[similarity_cache.pair_key(in_labels[i], in_labels[j])]
+                       for i, j in zip(*np.triu_indices(len(in_labels), 1))], dtype=dtype)
+    return in_labels, oov_mask, scores
@@ -0,0 +1,154 @@
+# Crystal Butler
+# 2026/10/18
+# A persistent, size-bounded cache of word pair similarity scores.
+#
+# Facial expression label vocabularies are small and repeat heavily across stimuli, so
+# the same pairs are scored again and again, in every set and on every rerun. The cache
+# is an SQLite database keyed by a content hash (fingerprint) of the vectors file plus the
+# unordered word pair, so scores from different embeddings never mix, and a renamed or
+# copied vectors file still hits. The fingerprint includes the precision the vectors are
+# loaded at, since reduced precision vectors give slightly different scores. Words that
+# aren't in the vocabulary are cached with the -100 score used by similarity.pair_score().
+# A word paired with itself is cached too; it records whether the word is in the vocabulary,
+# and scores duplicate labels. NaN scores, from vectors with zero norm, are cached as well:
+# SQLite stores them as NULL, which is read back as NaN.
+# When the cache grows past max_entries, the least recently used pairs are evicted.
+# Lookups don't write to the database: the times pairs were last used and the hit and miss
+# counters are kept in memory, and written in one transaction by flush(), once per set, or by close().
+
+import os
+import time
+import sqlite3
+import embedding_store
+
+# Score cached for pairs with a word that isn't in the vocabulary.
+OOV_SCORE = -100
+DEFAULT_MAX_ENTRIES = 10000000
+# Maximum number of host parameters per SQLite query.
+QUERY_CHUNK = 500
+
+
+class SimilarityCache:
+    """Look up and store similarity scores for the embeddings in vectors_file."""
+
+    def __init__(self, cache_file, vectors_file, max_entries=DEFAULT_MAX_ENTRIES, precision=None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Last used times and counts not yet written by flush().
+        self.used = {}
+        self.unsaved_hits = 0
+        self.unsaved_misses = 0
+        self.connection = sqlite3.connect(cache_file, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS pairs (fingerprint TEXT, word1 TEXT, word2 TEXT, "
+                                    "score REAL, last_used REAL, PRIMARY KEY (fingerprint, word1, word2))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS pairs_last_used ON pairs (last_used)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS fingerprints (path TEXT PRIMARY KEY, size INTEGER, "
+                                    "mtime REAL, fingerprint TEXT)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+        self.fingerprint = self._fingerprint(vectors_file)
+        if precision is not None:
+            # Vectors loaded at a different precision give different scores.
+            self.fingerprint += ':' + precision
+        self.entries = self.connection.execute("SELECT COUNT(*) FROM pairs").fetchone()[0]
+
+    def _fingerprint(self, vectors_file):
+        """Hash the vectors file, or a store's files, unless they have already been hashed and none
+        has changed since. Each file is recorded with the fingerprint of them all."""
+        stats = [(stat_path, os.path.getsize(stat_path), os.path.getmtime(stat_path))
+                 for stat_path in embedding_store.fingerprint_paths(os.path.abspath(vectors_file))]
+        fingerprints = set()
+        for stat_path, size, mtime in stats:
+            row = self.connection.execute("SELECT size, mtime, fingerprint FROM fingerprints WHERE path = ?",
+                                          (stat_path,)).fetchone()
+            fingerprints.add(row[2] if row is not None and row[0] == size and row[1] == mtime else None)
+        if len(fingerprints) == 1 and None not in fingerprints:
+            return fingerprints.pop()
+        fingerprint = embedding_store.fingerprint(vectors_file)
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)",
+                                        [stat + (fingerprint,) for stat in stats])
+        return fingerprint
+
+    def get_many(self, pairs):
+        """Return a dictionary of cached scores for the given word pairs, keyed by (word1, word2)
+        with the words in sorted order. Pairs that aren't cached are left out."""
+        keys = sorted(set(pair_key(w1, w2) for w1, w2 in pairs))
+        found = {}
+        for start in range(0, len(keys), QUERY_CHUNK):
+            chunk = keys[start:start + QUERY_CHUNK]
+            query = ("SELECT word1, word2, score FROM pairs WHERE fingerprint = ? AND (word1, word2) IN (VALUES "
+                     + ", ".join(["(?, ?)"] * len(chunk)) + ")")
+            params = [self.fingerprint] + [w for key in chunk for w in key]
+            for word1, word2, score in self.connection.execute(query, params):
+                # SQLite stores NaN as NULL.
+                found[(word1, word2)] = float('nan') if score is None else score
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        self.unsaved_hits += len(found)
+        self.unsaved_misses += len(keys) - len(found)
+        now = time.time()
+        self.used.update((key, now) for key in found)
+        return found
+
+    def flush(self):
+        """Write the last used times of the pairs looked up, and the hit and miss counts, in one transaction.
+        Call it after each set, since worker processes may never call close()."""
+        if not self.used and not self.unsaved_hits and not self.unsaved_misses:
+            return
+        with self.connection:
+            self.connection.executemany("UPDATE pairs SET last_used = ? WHERE fingerprint = ? AND word1 = ? "
+                                        "AND word2 = ?", [(now, self.fingerprint) + key for key, now in self.used.items()])
+            for name, value in [('hits', self.unsaved_hits), ('misses', self.unsaved_misses)]:
+                self.connection.execute("INSERT OR IGNORE INTO counters VALUES (?, 0)", (name,))
+                self.connection.execute("UPDATE counters SET value = value + ? WHERE name = ?", (value, name))
+        self.used = {}
+        self.unsaved_hits = 0
+        self.unsaved_misses = 0
+
+    def get(self, word1, word2):
+        """Return the cached score for a word pair, or None if it isn't cached."""
+        return self.get_many([(word1, word2)]).get(pair_key(word1, word2))
+
+    def put_many(self, scores):
+        """Cache scores from a dictionary keyed by (word1, word2) pairs."""
+        now = time.time()
+        rows = [(self.fingerprint,) + pair_key(w1, w2) + (float(score), now) for (w1, w2), score in scores.items()]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO pairs VALUES (?, ?, ?, ?, ?)", rows)
+        self.entries += len(rows)
+        # Evict in batches, so that the table isn't counted after every insert.
+        if self.entries > self.max_entries * 1.1:
+            self.evict()
+
+    def put(self, word1, word2, score):
+        self.put_many({(word1, word2): score})
+
+    def evict(self):
+        """Remove the least recently used pairs, down to max_entries."""
+        self.flush()
+        self.entries = self.connection.execute("SELECT COUNT(*) FROM pairs").fetchone()[0]
+        excess = self.entries - self.max_entries
+        if excess > 0:
+            with self.connection:
+                self.connection.execute("DELETE FROM pairs WHERE rowid IN "
+                                        "(SELECT rowid FROM pairs ORDER BY last_used LIMIT ?)", (excess,))
+            self.entries -= excess
+
+    def counters(self):
+        """Return the lifetime hit and miss counts for this cache file, across all processes."""
+        self.flush()
+        saved = dict(self.connection.execute("SELECT name, value FROM counters").fetchall())
+        return saved.get('hits', 0), saved.get('misses', 0)
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+def pair_key(word1, word2):
+    """Pairs are unordered, so they're keyed with the words in sorted order."""
+    return (word1, word2) if word1 <= word2 else (word2, word1)
@@ -0,0 +1,244 @@
+# Crystal Butler
+# 2026/10/18
+# A long-running local similarity service. The embeddings are loaded once, and similarity
+# requests are then answered over HTTP, on a local TCP port or a Unix domain socket.
+# Start it with word_pair_distance.py --serve.
+#
+# Requests are POSTed as JSON, and answered in JSON:
+#   /pair   {"word1": "happy", "word2": "pleased"}     -> {"score": 0.73}
+#   /pairs  {"pairs": [["happy", "pleased"], ...]}     -> {"scores": [0.73, ...]}
+#   /set    {"labels": ["happy", "pleased", "sad"]}    -> {"labels": [...], "oov": [...], "scores": [...]}
+# Scores are null for pairs with a word that isn't in the vocabulary, and for NaN scores.
+# A /set request returns the condensed upper triangle of the set's similarity matrix, over the
+# labels found in the vocabulary, in the same order as the Score_Lists files written by
+# word_pair_distance.py. Words that aren't strings are answered with status 400 before they're
+# batched, and unexpected errors with status 500 and a message.
+# GET /health returns the vocabulary size.
+#
+# Each client connection is handled on its own thread. Pair requests arriving from
+# concurrent clients within a few milliseconds of each other are batched together and
+# scored with a single gather and row-wise dot product.
+
+import os
+import json
+import time
+import queue
+import socket
+import threading
+import http.client
+import numpy as np
+from socketserver import ThreadingMixIn, UnixStreamServer
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import similarity
+
+# How long the batcher waits for more pair requests, in seconds, and the most pairs it scores at once.
+BATCH_WINDOW = 0.002
+MAX_BATCH = 65536
+
+
+class PairBatcher:
+    """Collect pair scoring requests from many threads, and score them in batches on one thread."""
+
+    def __init__(self, W, vocab, window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.W = W
+        self.vocab = vocab
+        self.window = window
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def score(self, pairs):
+        """Return a list of scores for a list of (word1, word2) pairs, with None for out of vocabulary pairs."""
+        request = {'pairs': pairs, 'done': threading.Event()}
+        self.requests.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['scores']
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            count = len(batch[0]['pairs'])
+            deadline = time.monotonic() + self.window
+            while count < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                count += len(batch[-1]['pairs'])
+            self._score_batch(batch)
+
+    def _indices(self, pairs):
+        """Each pair's vocabulary rows, with -1 for words that aren't in the vocabulary."""
+        idx1 = np.array([self.vocab.get(w1, -1) for w1, _ in pairs], dtype=np.intp)
+        idx2 = np.array([self.vocab.get(w2, -1) for _, w2 in pairs], dtype=np.intp)
+        return idx1, idx2
+
+    def _score_batch(self, batch):
+        # Words are looked up request by request, so that one bad request doesn't fail the others.
+        scored = []
+        for request in batch:
+            try:
+                request['idx'] = self._indices(request['pairs'])
+                scored.append(request)
+            except Exception as e:
+                request['error'] = e
+        try:
+            idx1 = np.concatenate([np.empty(0, dtype=np.intp)] + [request['idx'][0] for request in scored])
+            idx2 = np.concatenate([np.empty(0, dtype=np.intp)] + [request['idx'][1] for request in scored])
+            found = (idx1 >= 0) & (idx2 >= 0)
+            E1, E2 = self.W[idx1[found]], self.W[idx2[found]]
+            # As in similarity.pair_score(), products are accumulated in float64.
+            dots = np.einsum('ij,ij->i', E1.astype(np.float64), E2.astype(np.float64)).astype(similarity.score_dtype(E1.dtype))
+            scores = np.full(len(idx1), None, dtype=object)
+            scores[found] = dots.tolist()
+            start = 0
+            for request in scored:
+                request['scores'] = scores[start:start + len(request['pairs'])].tolist()
+                start += len(request['pairs'])
+        except Exception as e:
+            for request in scored:
+                request['error'] = e
+        for request in batch:
+            request['done'].set()
+
+
+def word_pairs(pairs):
+    """Return a request's pairs as (word1, word2) tuples, raising ValueError unless every pair is two strings."""
+    if not isinstance(pairs, list):
+        raise ValueError("pairs must be a list of [word1, word2] pairs")
+    checked = []
+    for pair in pairs:
+        if not (isinstance(pair, (list, tuple)) and len(pair) == 2 and all(isinstance(w, str) for w in pair)):
+            raise ValueError(f"{pair!r} isn't a pair of words")
+        checked.append((pair[0], pair[1]))
+    return checked
+
+
+def json_safe(value):
+    """Replace NaN and infinite scores with None, so replies are valid JSON."""
+    if isinstance(value, float):
+        return value if np.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    return value
+
+
+class SimilarityRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._reply(200, {'vocab_size': len(self.server.vocab)})
+        else:
+            self._reply(404, {'error': f'unknown endpoint {self.path}'})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+            if self.path == '/pair':
+                score, = self.server.batcher.score(word_pairs([[payload['word1'], payload['word2']]]))
+                self._reply(200, {'score': score})
+            elif self.path == '/pairs':
+                scores = self.server.batcher.score(word_pairs(payload['pairs']))
+                self._reply(200, {'scores': scores})
+            elif self.path == '/set':
+                labels = list(payload['labels'])
+                in_labels, oov_mask, scores = similarity.score_label_set(self.server.W, self.server.vocab, labels)
+                oov = [label for label, oov in zip(labels, oov_mask) if oov]
+                self._reply(200, {'labels': in_labels, 'oov': oov, 'scores': scores.tolist()})
+            else:
+                self._reply(404, {'error': f'unknown endpoint {self.path}'})
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {'error': f'bad request: {e!r}'})
+        except Exception as e:
+            self._reply(500, {'error': f'server error: {e!r}'})
+
+    def _reply(self, status, body):
+        data = json.dumps(json_safe(body), allow_nan=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address.
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ThreadingSimilarityServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixSimilarityServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        UnixStreamServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+def make_server(W, vocab, host='127.0.0.1', port=8765, socket_path=None, verbose=False):
+    """Create a similarity server bound to a TCP port, or to a Unix socket if socket_path is given."""
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixSimilarityServer(socket_path, SimilarityRequestHandler)
+    else:
+        server = ThreadingSimilarityServer((host, port), SimilarityRequestHandler)
+    server.W = W
+    server.vocab = vocab
+    server.verbose = verbose
+    server.batcher = PairBatcher(W, vocab)
+    return server
+
+
+def serve(W, vocab, host='127.0.0.1', port=8765, socket_path=None, verbose=False):
+    """Answer similarity requests until interrupted."""
+    server = make_server(W, vocab, host, port, socket_path, verbose)
+    where = socket_path if socket_path is not None else f'http://{host}:{port}'
+    print(f"Serving similarity requests for {len(vocab)} words at {where}. Press Ctrl-C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, socket_path):
+        http.client.HTTPConnection.__init__(self, 'localhost')
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def query(endpoint, payload, host='127.0.0.1', port=8765, socket_path=None):
+    """Send one request to a running similarity server and return the decoded JSON reply."""
+    if socket_path is not None:
+        connection = UnixHTTPConnection(socket_path)
+    else:
+        connection = http.client.HTTPConnection(host, port)
+    try:
+        connection.request('POST', endpoint, json.dumps(payload), {'Content-Type': 'application/json'})
+        return json.loads(connection.getresponse().read().decode('utf-8'))
+    finally:
+        connection.close()
@@ -0,0 +1,200 @@
+# Crystal Butler
+# 2026/10/18
+# Keep label set results up to date as new free responses arrive, without rerunning the pipeline.
+#
+# Each set's responses, similarity matrix and label weight totals are kept in output_dir/State
+# (see set_state.py). New responses are read from --input, one per line as "<ID> <label>", or
+# "-" for standard input; a blank line, every --batch_lines lines and the end of the input each
+# bring the sets that received responses up to date. --input may also be a label table, with a
+# row for each response (see label_table.py), read --batch_lines rows at a time. New labels can
+# also be found by rereading a --wordlists_dir of label lists, as used by pipeline.py: labels
+# added to the end of a list since its state was saved are appended, and a list that was
+# otherwise edited is rescored.
+# For each new label, only its scores with the labels already in the set are computed, and
+# the set's label weights and clustering statistics are refreshed from the saved state.
+#
+# Results are written to output_dir in the same layout as pipeline.py:
+#   -- clustering statistics (to output_dir/Statistics/Pass or Fail)
+#   -- dendrograms (to output_dir/Dendrograms/Pass or Fail), or with --stats_only, linkage matrices
+#      for drawing them later with render_dendrograms.py (to output_dir/Linkage)
+#   -- cumulative label weights, in the sum_label_weights.py layout (to output_dir/Weights)
+#   -- labels not found in the vocabulary, if any (to output_dir/Errors)
+# A manifest of the files written for each set (see manifest.py) is kept in output_dir, so that
+# a set's statistics are moved when it changes between Pass and Fail.
+# With --refresh, every saved set's results are rewritten from its state, for example after
+# changing --dendro_cutoff, without scoring anything.
+# The embeddings are only loaded once there are labels to score; an embedding store (see
+# embedding_store.py) loads in moments, which suits frequent small updates.
+
+import os
+import sys
+import hashlib
+import argparse
+import embedding_store
+import clustering
+import analysis
+import label_table
+import set_state
+import manifest
+import metrics
+
+def make_output_subdirs(output_dir, stats_only=False):
+    analysis.make_output_subdirs(output_dir, stats_only)
+    if not os.path.exists(os.path.join(output_dir, 'State')):
+        os.makedirs(os.path.join(output_dir, 'State'))
+
+
+def read_responses(input_file, batch_lines):
+    """Yield lists of (ID, label) responses, ending each at a blank line, after batch_lines lines,
+    or at the end of the input. A label table is read batch_lines rows at a time."""
+    if input_file != '-' and label_table.is_label_table(input_file):
+        yield from label_table.batches(label_table.iter_rows(input_file), batch_lines)
+        return
+    f = sys.stdin if input_file == '-' else open(input_file, 'r')
+    batch = []
+    try:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 2:
+                batch.append((fields[0], fields[1]))
+            elif fields:
+                print(f"Skipping {line.strip()!r}: need a set ID and a single word label.")
+            if batch and (not fields or len(batch) >= batch_lines):
+                yield batch
+                batch = []
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    if batch:
+        yield batch
+
+
+def wordlist_updates(wordlists_dir, output_dir):
+    """Return the labels added to each label list in wordlists_dir since its state was saved,
+    and the IDs of lists that have changed in any other way, which need rescoring."""
+    updates, changed = {}, set()
+    for entry in sorted(os.listdir(wordlists_dir)):
+        if not os.path.isfile(os.path.join(wordlists_dir, entry)) or entry.startswith('.'):
+            continue
+        ID = entry.split(".")[0].split("_")[0]  # relies on file name beginning with ID_ or ID.
+        labels = analysis.read_label_list(os.path.join(wordlists_dir, entry))
+        state = load_state(ID, output_dir)
+        if labels[:len(state.responses)] != state.responses:
+            changed.add(ID)
+            updates[ID] = labels
+        elif len(labels) > len(state.responses):
+            updates[ID] = labels[len(state.responses):]
+    return updates, changed
+
+
+def load_state(ID, output_dir):
+    path = set_state.state_filename(os.path.join(output_dir, 'State'), ID)
+    if os.path.exists(path):
+        return set_state.SetState.load(path, ID)
+    return set_state.SetState(ID)
+
+
+def get_embeddings(vectors_file, precision=None):
+    """Load the embeddings the first time they're needed."""
+    global W, vocab
+    if 'W' not in globals():
+        with metrics.stage('load_embeddings'):
+            W, vocab = embedding_store.load_embeddings(vectors_file, precision=precision)
+    return W, vocab
+
+
+def update_set(state, new_labels, vectors, output_dir, vectors_file, precision=None, replace=False):
+    """Add new labels to a set, rescoring it first if it was scored with other embeddings,
+    or starting again from new_labels if replace is set. vectors is the fingerprint of the
+    embeddings in vectors_file, loaded at precision."""
+    if replace:
+        state = set_state.SetState(state.ID, vectors)
+    if state.vectors != vectors and state.responses:
+        print(f"Set {state.ID} was scored with other embeddings, so it will be rescored.")
+        state.rescore(*get_embeddings(vectors_file, precision), vectors)
+    state.vectors = vectors
+    if new_labels:
+        state.append(*get_embeddings(vectors_file, precision), new_labels)
+    state.save(set_state.state_filename(os.path.join(output_dir, 'State'), state.ID))
+    return state
+
+
+def write_results(state, output_dir, dendro_cutoff=clustering.DENDRO_CUTOFF, stats_only=False):
+    """Refresh a set's weights and clustering statistics, and return the list of files written."""
+    result = state.result(dendro_cutoff)
+    if result['linkage'] is not None:
+        metrics.count('sets_passed' if clustering.classify_pass_fail(result['pct']) == 'pass' else 'sets_failed')
+        print(f"Set {state.ID}: {len(state.responses)} responses, {result['pct']:.1f}% in the largest cluster, "
+              f"{clustering.classify_pass_fail(result['pct'])}.")
+    return analysis.write_results(result, output_dir, dendro_cutoff, stats_only)
+
+
+def state_hash(state):
+    return hashlib.sha1("\n".join(state.responses).encode('utf-8')).hexdigest()
+
+
+def apply_updates(updates, vectors, run_manifest, vectors_file, output_dir, dendro_cutoff=clustering.DENDRO_CUTOFF,
+                  stats_only=False, precision=None, replace=()):
+    """Bring each set with new labels up to date, and rewrite its results."""
+    for ID, new_labels in updates.items():
+        with metrics.track_set(ID):
+            try:
+                state = update_set(load_state(ID, output_dir), new_labels, vectors, output_dir, vectors_file, precision,
+                                   ID in replace)
+                run_manifest.record(ID, state_hash(state), write_results(state, output_dir, dendro_cutoff, stats_only))
+            except Exception as e:
+                print(f"Unable to update set {ID}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('vectors_file', help='a file of word-features vectors, or an embedding store directory', type=str)
+    parser.add_argument('output_dir', help='directory where set states, statistics, dendrograms, weights and errors are \
+written', type=str)
+    parser.add_argument('--input', help='a file of new responses, one "<ID> <label>" per line, - for standard input, \
+or a label table',
+                        default=None, type=str)
+    parser.add_argument('--wordlists_dir', help='directory of label lists by ID, to append any labels added since the last run',
+                        default=None, type=str)
+    parser.add_argument('--batch_lines', help='the most input lines read before the sets they update are refreshed',
+                        default=1000, type=int)
+    parser.add_argument('--refresh', help='rewrite the results of every saved set', action='store_true')
+    parser.add_argument('--dendro_cutoff', help='the cutoff value for agglomerative hierarchical clustering',
+                        default=clustering.DENDRO_CUTOFF, type=float)
+    parser.add_argument('--stats_only', help='save linkage matrices, but skip drawing dendrograms', action='store_true')
+    parser.add_argument('--precision', help='the precision vectors are held at in memory; by default, the precision \
+of a store, or float64 for a text vectors file', default=None, choices=embedding_store.PRECISIONS)
+    parser.add_argument('--metrics', help='a .json or .csv file where run metrics are written', default=None, type=str)
+    parser.add_argument('--profile', help='a file where cProfile stats for the run are written', default=None, type=str)
+    args = parser.parse_args()
+
+    metrics.start(args.metrics, args.profile)
+    if args.input is None and args.wordlists_dir is None and not args.refresh:
+        print("Give new responses with --input or --wordlists_dir, or --refresh the saved sets: exiting.")
+        return
+    make_output_subdirs(args.output_dir, args.stats_only)
+    run_manifest = manifest.Manifest(args.output_dir, "stream_labels")
+    run_manifest.set_params({'dendro_cutoff': args.dendro_cutoff, 'stats_only': args.stats_only})
+    vectors = run_manifest.fingerprint(args.vectors_file) + ':' + str(args.precision)
+    options = {'vectors_file': args.vectors_file, 'output_dir': args.output_dir, 'dendro_cutoff': args.dendro_cutoff,
+               'stats_only': args.stats_only, 'precision': args.precision}
+    if args.refresh:
+        state_dir = os.path.join(args.output_dir, 'State')
+        saved = sorted(entry[:-len(set_state.SUFFIX)] for entry in os.listdir(state_dir)
+                       if entry.endswith(set_state.SUFFIX))
+        apply_updates({ID: [] for ID in saved}, vectors, run_manifest, **options)
+    if args.wordlists_dir is not None:
+        updates, changed = wordlist_updates(args.wordlists_dir, args.output_dir)
+        print(f"{len(updates)} label lists have new labels, {len(changed)} of which were edited and will be rescored.")
+        apply_updates(updates, vectors, run_manifest, replace=changed, **options)
+    if args.input is not None:
+        for batch in read_responses(args.input, args.batch_lines):
+            updates = {}
+            for ID, label in batch:
+                updates.setdefault(ID, []).append(label)
+            apply_updates(updates, vectors, run_manifest, **options)
+    run_manifest.close()
+
+
+if __name__ == "__main__":
+    main()
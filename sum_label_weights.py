@@ -3,35 +3,48 @@
 # Take lists of scored label pairs as generated by word_pair_distance.py,
 # and output lists of (label, total weight) pairs.
 # Weights are simply the sum of similarity scores for each label.
+# scored_labels_dir may also be a binary score container written by word_pair_distance.py
+# with --output_format binary, in which case weights are summed from each set's scores
+# without parsing any text.
+# With --labels_dir, scored_labels_dir is instead a Score_Lists directory written by word_pair_distance.py,
+# and labels_dir the matching Label_Lists directory. Each set's scores are read into its similarity
+# matrix, and weights are summed over the matrix rows with NumPy, rather than by sorting
+# every (label, weight) pair. The weights are the same, up to the rounding of a different summation order.
+# With --top_k, only the top k most heavily weighted labels of each set are written.
+# With --table_format, the weights of sets in a binary score container are written as rows of a
+# single table, sums_dir/weights, in that format (see label_table.py), rather than as a file per set;
+# --shard_rows splits the table into shards.
+# With --metrics, the time spent reading and weighting is recorded per run and per set (see metrics.py).
+# With --incremental, a manifest of the sets already summed is kept in sums_dir (see
+# manifest.py), and sets that haven't changed since they were last summed are skipped.
 
 import os
 import argparse
-
-# Read in options.
-parser = argparse.ArgumentParser()
-parser.add_argument('scored_labels_dir', help='directory where list of scored word pairs are stored', type=str)
-parser.add_argument('sums_dir', help='directory in which to store summed label weight lists after\
- processing scored_labels_dir',
-                    type=str)
-args = parser.parse_args()
+import numpy as np
+from scipy.spatial.distance import squareform
+import score_store
+import label_table
+import label_weights
+import manifest
+import metrics
 
 # Constants, used to format output file names.
 ZERO_PAD = 4
 SUFFIX = ".txt"
 
 
-def make_output_subdirs():
-    if not os.path.exists(args.sums_dir):
-        os.makedirs(args.sums_dir)
+def make_output_subdirs(sums_dir):
+    if not os.path.exists(sums_dir):
+        os.makedirs(sums_dir)
 
 
 # Create a sorted list of (label, weight) pairs from (label, label, weight) triplets.
-def create_weights_list(file):
+def create_weights_list(file, scored_labels_dir):
     filename = os.fsdecode(file)
     if filename.startswith('.'):
         return None, None
     out_name = filename.split(".")[0]
-    in_file = os.path.join(args.scored_labels_dir, filename)
+    in_file = os.path.join(scored_labels_dir, filename)
     list1 = []
     list2 = []
     with open(in_file, 'r') as f:
@@ -45,8 +58,8 @@ def create_weights_list(file):
 
 
 # Take a sorted list of (label, weight) pairs and sum over labels.
-def sum_weights(out_name, weights_list):
-    out_file = os.path.join(args.sums_dir, out_name + ".weights" + SUFFIX)
+def sum_weights(out_name, weights_list, sums_dir, top_k=None):
+    out_file = os.path.join(sums_dir, out_name + ".weights" + SUFFIX)
     w_sum = 0.0
     w_arr = []
     for i in range(len(weights_list)):
@@ -60,15 +73,148 @@ def sum_weights(out_name, weights_list):
             w_arr.append([label_curr, w_sum])
             w_sum = 0.0
     w_arr.sort(key=lambda w: w[1], reverse=True)
+    w_arr = w_arr[:top_k]
     with open(out_file, 'w') as o:
         for w in w_arr:
             o.write("{}\t{}\n".format(w[0].ljust(20), str(w[1]).ljust(20)))
+    return out_file
 
 
-if __name__ == "__main__":
-    make_output_subdirs()
-    read_directory = os.fsencode(args.scored_labels_dir)
+# Sum weights for every set in a binary score container, skipping sets the manifest says are unchanged.
+def sum_stored_weights(scored_labels_dir, sums_dir, top_k=None, run_manifest=None):
+    with score_store.ScoreReader(scored_labels_dir) as reader:
+        for ID in reader.ids():
+            if run_manifest is not None and run_manifest.is_current(ID, reader.checksum(ID)):
+                continue
+            with metrics.track_set(ID):
+                with metrics.stage('read'):
+                    labels, scores, _ = reader.read(ID)
+                with metrics.stage('weights'):
+                    w_arr = label_weights.label_weights(labels, squareform(scores.astype(np.float64), checks=False),
+                                                        top_k)
+                    out_file = os.path.join(sums_dir, ID + ".weights" + SUFFIX)
+                    label_weights.write_weights(out_file, w_arr)
+            if run_manifest is not None:
+                run_manifest.record(ID, reader.checksum(ID), [out_file])
+
+
+# Sum weights for every set in a binary score container, writing them all to the weights table.
+def sum_stored_weights_table(scored_labels_dir, sums_dir, top_k=None, table_format='csv', shard_rows=None):
+    with score_store.ScoreReader(scored_labels_dir) as reader, \
+            label_table.TableWriter(os.path.join(sums_dir, 'weights'), label_weights.WEIGHTS_COLUMNS,
+                                    table_format, shard_rows) as table:
+        for ID in reader.ids():
+            with metrics.track_set(ID):
+                with metrics.stage('read'):
+                    labels, scores, _ = reader.read(ID)
+                with metrics.stage('weights'):
+                    w_arr = label_weights.label_weights(labels, squareform(scores.astype(np.float64), checks=False),
+                                                        top_k)
+                    table.write_rows(label_weights.weights_rows(ID, w_arr))
+
+
+# Read one set's labels and condensed scores from its Label_Lists and Score_Lists files.
+def read_score_lists(scores_file, labels_file):
+    with open(labels_file, 'r') as f:
+        labels = [line.rstrip('\n') for line in f if line.strip()]
+    with open(scores_file, 'r') as f:
+        scores = np.array(f.read().split(), dtype=np.float64)
+    return labels, scores
+
+
+# Sum weights over the rows of each set's similarity matrix, built from Score_Lists and Label_Lists files.
+def sum_matrix_weights(scored_labels_dir, labels_dir, sums_dir, top_k=None, run_manifest=None):
+    labels_files = {}
+    for filename in os.listdir(labels_dir):
+        if not filename.startswith('.'):
+            labels_files[filename.split(".")[0]] = os.path.join(labels_dir, filename)
+    for filename in sorted(os.listdir(scored_labels_dir)):
+        if filename.startswith('.'):
+            continue
+        out_name = filename.split(".")[0]
+        if out_name not in labels_files:
+            print(f"There is no labels file for {filename}: skipping.")
+            continue
+        scores_file = os.path.join(scored_labels_dir, filename)
+        if run_manifest is not None:
+            input_hash = manifest.hash_files([scores_file, labels_files[out_name]])
+            if run_manifest.is_current(filename, input_hash):
+                continue
+        with metrics.track_set(filename):
+            with metrics.stage('read'):
+                labels, scores = read_score_lists(scores_file, labels_files[out_name])
+            if len(scores) != len(labels) * (len(labels) - 1) // 2:
+                print(f"The number of values in {filename} is {len(scores)}, but it should be "
+                      f"{len(labels) * (len(labels) - 1) // 2}: skipping.")
+                continue
+            with metrics.stage('weights'):
+                out_file = os.path.join(sums_dir, out_name + ".weights" + SUFFIX)
+                label_weights.write_weights(out_file, label_weights.label_weights(
+                    labels, squareform(scores, checks=False), top_k))
+        if run_manifest is not None:
+            run_manifest.record(filename, input_hash, [out_file])
+
+
+# Sum weights for every file of scored label pairs in scored_labels_dir.
+def sum_text_weights(scored_labels_dir, sums_dir, top_k=None, run_manifest=None):
+    read_directory = os.fsencode(scored_labels_dir)
     for file in os.listdir(read_directory):
-        out_name, weights_list = create_weights_list(file)
-        if (weights_list is not None):
-            sum_weights(out_name, weights_list)
+        filename = os.fsdecode(file)
+        if run_manifest is not None and not filename.startswith('.'):
+            input_hash = manifest.hash_files([os.path.join(scored_labels_dir, filename)])
+            if run_manifest.is_current(filename, input_hash):
+                continue
+        with metrics.track_set(filename):
+            with metrics.stage('read'):
+                out_name, weights_list = create_weights_list(file, scored_labels_dir)
+            if (weights_list is not None):
+                with metrics.stage('weights'):
+                    out_file = sum_weights(out_name, weights_list, sums_dir, top_k)
+        if (weights_list is not None) and run_manifest is not None:
+            run_manifest.record(filename, input_hash, [out_file])
+
+
+def main():
+    # Read in options.
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scored_labels_dir', help='directory where list of scored word pairs are stored, \
+or a binary score container', type=str)
+    parser.add_argument('sums_dir', help='directory in which to store summed label weight lists after\
+ processing scored_labels_dir',
+                        type=str)
+    parser.add_argument('--labels_dir', help='a Label_Lists directory matching scored_labels_dir, which is then a \
+Score_Lists directory', default=None, type=str)
+    parser.add_argument('--top_k', help='the number of most heavily weighted labels to write per set; by default, all',
+                        default=None, type=int)
+    parser.add_argument('--incremental', help='skip sets that are unchanged since they were last summed into sums_dir',
+                        action='store_true')
+    parser.add_argument('--table_format', help='write the weights of sets in a binary score container as a single \
+table in this format', default=None, choices=label_table.FORMATS)
+    parser.add_argument('--shard_rows', help='split the weights table into shards of this many rows', default=None, type=int)
+    parser.add_argument('--metrics', help='a .json or .csv file where run metrics are written', default=None, type=str)
+    parser.add_argument('--profile', help='a file where cProfile stats for the run are written', default=None, type=str)
+    args = parser.parse_args()
+
+    metrics.start(args.metrics, args.profile)
+    if args.table_format is not None and not score_store.is_score_store(args.scored_labels_dir):
+        parser.error("--table_format needs scored_labels_dir to be a binary score container.")
+    if args.table_format is not None and args.incremental:
+        parser.error("--incremental can't be used with --table_format, since the weights table is rewritten.")
+    make_output_subdirs(args.sums_dir)
+    if args.table_format is not None:
+        sum_stored_weights_table(args.scored_labels_dir, args.sums_dir, args.top_k, args.table_format, args.shard_rows)
+        return
+    run_manifest = None
+    if args.incremental:
+        run_manifest = manifest.Manifest(args.sums_dir, "sum_label_weights")
+        run_manifest.set_params({'top_k': args.top_k, 'matrix': args.labels_dir is not None})
+    if args.labels_dir is not None:
+        sum_matrix_weights(args.scored_labels_dir, args.labels_dir, args.sums_dir, args.top_k, run_manifest)
+    elif score_store.is_score_store(args.scored_labels_dir):
+        sum_stored_weights(args.scored_labels_dir, args.sums_dir, args.top_k, run_manifest)
+    else:
+        sum_text_weights(args.scored_labels_dir, args.sums_dir, args.top_k, run_manifest)
+
+
+if __name__ == "__main__":
+    main()
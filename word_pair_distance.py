@@ -12,177 +12,575 @@
 #   -- labels successfully processed by the script (to args.output_dir/Label_Lists)
 #   -- relatedness scores only (to args.output_dir/Score_Lists)
 # The third and fourth files are required for performing clustering.
+# vectors_file may also be a binary embedding store created by embedding_store.py,
+# which loads much faster than a text vectors file.
+# With --vocab_file, only the vectors for the words listed in it are loaded, and other words are
+# out of vocabulary. With --filter_vocab, only the vectors for the words in the pairs files being
+# scored are loaded, which gives the same scores in much less time and memory.
+# With --precision, vectors are held in memory as float16, or as int8 with a scale per row,
+# to fit more scoring processes side by side (see embedding_store.py and precision_report.py).
+# With --batched, each pairs file is scored as a whole set: labels are resolved to vector
+# rows once, and all scores come from a single matrix multiply. Labels that are out of
+# vocabulary are dropped from the set, and their pairs are written to the Errors file.
+# With --unique, only a set's distinct labels are scored, and their scores are repeated for
+# duplicate labels; scores are the same, up to rounding in the last digit.
+# With --output_format binary, sets are scored in batches as above, but instead of the four
+# text files per set, all sets are written to a single binary score container (see
+# score_store.py), at output_dir/scores.npz, or as shards in output_dir/Scores with --shard_size.
+# --source_dir may instead be a label table, with a row for each response (see label_table.py),
+# which is scored a batch of sets at a time into a binary score container, without writing pairs files.
+# With --cache_file, scores are looked up in a persistent similarity cache (see similarity_cache.py)
+# before being computed, and the embeddings are only loaded if some pair isn't already cached.
+# Without --source_dir, pairs of words are read interactively and scored one at a time; leave
+# the second word blank to list the first word's nearest neighbours instead, and words that
+# aren't in the vocabulary get spelling suggestions (see neighbors.py, and --index_dir). Or
+# with --serve, the embeddings are loaded once and similarity requests are answered over
+# HTTP until interrupted (see similarity_server.py).
+# With --ensemble, pairs are scored with several embedding models at once, over the words they all
+# share, and each pair's scores are combined by their mean or maximum (--combine; see ensemble.py).
+# With --incremental, a manifest of the pairs files already scored is kept in output_dir (see
+# manifest.py), and files that haven't changed since they were last scored with the same
+# embeddings and options are skipped. Binary containers are appended to rather than replaced;
+# since a container is only complete once it's closed, use --shard_size so that an interrupted
+# run can't damage the sets already written.
+# With --metrics, time spent loading embeddings, scoring and writing, pairs scored and out
+# of vocabulary pairs are recorded per run and per set (see metrics.py); --profile runs cProfile.
+# The command line is only read by main(). Other programs can import PairScorer to score word pairs and
+# label sets in process, with the options above passed as arguments.
 
 import os
 import shutil
 import argparse
+import functools
 import math
 import numpy as np
+import embedding_store
+import similarity
+import parallel
+import score_store
+import label_table
+import ensemble
+import similarity_cache
+import manifest
+import metrics
+import neighbors
 np.seterr(divide='ignore', invalid='ignore')  # fix runtime error when dividing by zero
 
-parser = argparse.ArgumentParser()
-parser.add_argument('vectors_file', help='a file of word-features vectors', type=str)
-parser.add_argument('--vocab_file', help='a file of vocabulary words; if not given, one will be generated \
-from vectors_file', default=None, type=str)
-parser.add_argument('--source_dir',
-                    help="an optional directory containing lists of word pairs to score;\
-                     requires a value for output_dir",
-                    default=None, type=str)
-parser.add_argument('--output_dir', help="a directory to write relatedness value files to", default=None, type=str)
-args = parser.parse_args()
-
-if (args.output_dir is not None):
-    # Set up directories for our output files, if need be.
-    if not os.path.exists(args.output_dir + "/Errors"):
-        os.makedirs(args.output_dir + "/Errors")
-    err = args.output_dir + "/Errors/"
-    if not os.path.exists(args.output_dir + "/Label_Lists"):
-        os.makedirs(args.output_dir + "/Label_Lists")
-    lab = args.output_dir + "/Label_Lists/"
-    if not os.path.exists(args.output_dir + "/Label_and_Score_Lists"):
-        os.makedirs(args.output_dir + "/Label_and_Score_Lists")
-    labscr = args.output_dir + "/Label_and_Score_Lists/"
-    if not os.path.exists(args.output_dir + "/Score_Lists"):
-        os.makedirs(args.output_dir + "/Score_Lists")
-    scr = args.output_dir + "/Score_Lists/"
-
-
-def generate():
-    if args.vocab_file is not None:
-        # Parse the optionally provided vocabulary file.
-        with open(args.vocab_file, 'r') as f:
-            words = [x.rstrip().split(' ')[0] for x in f.readlines()]
-    # Semantic vectors (or word embeddings) are the result of training a ML model to represent word relatedness.
-    with open(args.vectors_file, 'r', encoding="utf-8", errors='ignore') as f:
-        # The pre-trained semantic vectors will go into a Python dictionary.
-        # Dictionaries are key:value indexed; lookup is done via hash function and should be O(1) time complexity.
-        # But the dictionary is just an intermediate. Lookups will be done against a numpy ndarray, constructed later.
-        vectors = {}
-        # The "words" list is an intermediate. The dictionary used in processing is constructed later.
-        words = []
-        vals = []
-        for line in f:
-            # Populate the dictionary with word feature lists, indexed by word.
-            vals = line.rstrip().split(' ')
-            # The vocabulary file gets created here, if one wasn't provided on script invocation.
-            if args.vocab_file is None:
-                words.append(vals[0])
-            vectors[vals[0]] = [float(x) for x in vals[1:]]
-        vector_dim = len(vals) - 1  # Number of features in a semantic vector, minus the vocab word at the beginning.
-        vocab_size = len(words)
-
-    # Create word:numbered index dictionary from the "words" list, to be used for vector lookups.
-    vocab = {w: idx for idx, w in enumerate(words)}
-
-    # Create a numpy ndarray of semantic vectors. The ndarray is indexed by row number, while we need to index by word.
-    # But we'll be using the O(1) lookup time from our vocab dictionary to translate from input word to row number.
-    W = np.zeros((vocab_size, vector_dim))
-    for word, v in vectors.items():
-        if word == '<unk>':
-            continue
-        W[vocab[word], :] = v
+# The number of sets read from a label table at a time.
+TABLE_BATCH_SETS = 1000
 
-    # Normalize each word vector to unit variance.
-    W_norm = np.zeros(W.shape)
-    d = (np.sum(W ** 2, 1) ** (0.5))
-    W_norm = (W.T / d).T
-    return (W_norm, vocab)
 
+class PairScorer:
+    """Score word pairs and label sets against the embeddings in vectors_file, or an ensemble of
+    vectors files. The embeddings are only loaded when some pair needs computing, and with cache_file,
+    scores are looked up in a persistent similarity cache first (see similarity_cache.py)."""
 
-def distance(W, vocab, input_term1, input_term2):
-    if input_term1 not in vocab or input_term2 not in vocab:
-        # Magic number to indicate that some word wasn't in the vocabulary.
-        return -100
+    def __init__(self, vectors_file, words=None, precision=None, parse_workers=None, ensemble_files=None,
+                 combine='mean', cache_file=None, cache_size=similarity_cache.DEFAULT_MAX_ENTRIES, unique=False):
+        self.vectors_file = vectors_file
+        self.words = words
+        self.precision = precision
+        self.parse_workers = parse_workers
+        self.ensemble_files = ensemble_files
+        self.combine = combine
+        self.cache_file = cache_file
+        self.cache_size = cache_size
+        self.unique = unique
+        self.W = self.vocab = None
+        self.cache = self.cache_dtype = None
 
-    # Cosine similarity is calculated as (vector1 • vector2) / (\\vector1\\ * \\vector2\\). But the magnitudes of
-    # our vectors have all been normalized to 1, so this reduces to a vector dot product.
-    distance = np.dot(W[vocab[input_term1]], W[vocab[input_term2]])
-    return distance
+    def __getstate__(self):
+        # Worker processes that aren't forked load their own embeddings, and open their own cache.
+        state = dict(self.__dict__)
+        state.update({'W': None, 'vocab': None, 'cache': None, 'cache_dtype': None})
+        return state
 
+    def embeddings(self):
+        """Load the embeddings the first time they're needed in this process. Forked worker processes
+        share the parent's copy if it was loaded before they started."""
+        # Semantic vectors (or word embeddings) are the result of training a ML model to represent word relatedness.
+        # Text vectors files are parsed in parallel chunks; binary stores are memory mapped rather than parsed.
+        # With words, only the vectors for the words needed are loaded.
+        if self.W is None:
+            with metrics.stage('load_embeddings'):
+                if self.ensemble_files:
+                    self.W, self.vocab = ensemble.load_ensemble([self.vectors_file] + self.ensemble_files, self.words,
+                                                                self.parse_workers, self.precision, self.combine)
+                else:
+                    self.W, self.vocab = embedding_store.load_embeddings(self.vectors_file, self.words,
+                                                                         self.parse_workers, self.precision)
+        return self.W, self.vocab
 
-if __name__ == "__main__":
-    W, vocab = generate()
+    def get_cache(self):
+        """Open the similarity cache once per process, or return None if no cache file was given."""
+        if self.cache_file is None:
+            return None
+        if self.cache is None:
+            self.cache = similarity_cache.SimilarityCache(self.cache_file, self.vectors_file, self.cache_size,
+                                                          self.precision)
+            self.cache_dtype = similarity.score_dtype(embedding_store.vectors_dtype(self.vectors_file, self.precision))
+        return self.cache
+
+    def score_pair(self, input_term1, input_term2):
+        """Score one word pair, using the similarity cache if there is one."""
+        if self.get_cache() is None:
+            return similarity.pair_score(*self.embeddings(), input_term1, input_term2)
+        relatedness = self.cache.get(input_term1, input_term2)
+        if relatedness is None:
+            relatedness = similarity.pair_score(*self.embeddings(), input_term1, input_term2)
+            self.cache.put(input_term1, input_term2, relatedness)
+            return relatedness
+        return -100 if relatedness == -100 else self.cache_dtype.type(relatedness)
+
+    def score_set(self, labels):
+        """Score all pairs in a label set, using the similarity cache if there is one."""
+        if self.get_cache() is None:
+            W, vocab = self.embeddings()
+            with metrics.stage('score'):
+                in_labels, oov_mask, scores = similarity.score_label_set(W, vocab, labels, self.unique)
+        else:
+            with metrics.stage('score'):
+                in_labels, oov_mask, scores = similarity.score_label_set_cached(self.embeddings, labels, self.cache,
+                                                                                self.cache_dtype)
+        metrics.count('pairs_scored', len(scores))
+        metrics.count('oov_pairs', len(labels) * (len(labels) - 1) // 2 - len(scores))
+        return in_labels, oov_mask, scores
+
+    def flush_cache(self):
+        """Write the similarity cache's usage for a set in one transaction, rather than on every lookup."""
+        if self.get_cache() is not None:
+            self.cache.flush()
+
+    def close(self):
+        """Print the similarity cache's lifetime totals, and close it."""
+        if self.get_cache() is not None:
+            hits, misses = self.cache.counters()
+            print(f"Similarity cache lifetime totals: {hits} hits, {misses} misses.")
+            self.cache.close()
+
+
+# The PairScorer of this process, shared with worker processes by init_worker().
+scorer = None
+
+
+def init_worker(parent_scorer, load_embeddings=True):
+    """Take the parent process's scorer in a worker process, loading the embeddings if the parent
+    hadn't already, before any sets are scored."""
+    global scorer
+    scorer = parent_scorer
+    if load_embeddings:
+        scorer.embeddings()
+
+
+def read_vocab_file(vocab_file):
+    """Read the first word on each line of a vocabulary file, so word count files work as well."""
+    with open(vocab_file, 'r', encoding="utf-8", errors='ignore') as f:
+        return [line.split()[0] for line in f if line.strip()]
+
+
+def pairs_words(in_files):
+    """Return the set of words in a list of pairs files."""
+    words = set()
+    for in_file in in_files:
+        with open(in_file, 'r') as f:
+            words.update(f.read().split())
+    return words
+
+
+def make_output_subdirs(output_dir):
+    """Set up directories for our output files, if need be, and return the prefixes of the
+    Errors, Label_Lists, Score_Lists and Label_and_Score_Lists file paths."""
+    dirs = []
+    for subdir in ["Errors", "Label_Lists", "Score_Lists", "Label_and_Score_Lists"]:
+        if not os.path.exists(output_dir + "/" + subdir):
+            os.makedirs(output_dir + "/" + subdir)
+        dirs.append(output_dir + "/" + subdir + "/")
+    return tuple(dirs)
+
+
+def output_files(ID, out_dirs):
+    """The text files written for a set."""
+    err, lab, scr, labscr = out_dirs
+    return [err + ID + ".errors.txt", lab + ID + ".labels.txt", scr + ID + ".scores.txt", labscr + ID + ".txt"]
+
+
+def print_neighbors(scorer, word, index_dir=None, k=10):
+    """Print a word's nearest neighbours, or spelling suggestions if it isn't in the vocabulary."""
+    global neighbor_table, ngram_index
+    if scorer.ensemble_files:
+        print("Nearest neighbours and spelling suggestions are only given for a single vectors_file.")
+        return
+    W, vocab = scorer.embeddings()
+    if word in vocab:
+        if 'neighbor_table' not in globals():
+            neighbor_table = neighbors.NeighborTable(index_dir, embedding_store.fingerprint(scorer.vectors_file), k)
+        (idx, scores), = neighbor_table.lookup(W, [vocab[word]])
+        neighbor_table.save()
+        words = {row: w for w, row in vocab.items()}
+        print("The nearest neighbours of %s are:" % word)
+        for i, score in zip(idx[:k], scores[:k]):
+            print("  %s%f" % (words[i].ljust(20), score))
+        return
+    if 'ngram_index' not in globals():
+        ngram_index = neighbors.open_ngram_index(index_dir, sorted(vocab, key=vocab.get), W)
+    suggestions = ngram_index.suggest(word)
+    if suggestions:
+        print("%s isn't in the vocabulary. Did you mean: %s?" % (word, ', '.join(w for w, _ in suggestions)))
+    else:
+        print("%s isn't in the vocabulary, and no similar spellings were found." % word)
+
+
+def score_file_batched(scorer, in_file, ID, out_dirs):
+    """Score a file of all pairs as one label set, writing the same four output files
+    as the line by line scoring loop."""
+    with metrics.stage('read'):
+        labels = similarity.labels_from_pairs(in_file)
+    in_labels, oov_mask, scores = scorer.score_set(labels)
+    with metrics.stage('write'):
+        write_set_files(out_dirs, ID, labels, in_labels, oov_mask, scores)
+
+
+def write_set_files(out_dirs, ID, labels, in_labels, oov_mask, scores):
+    err, lab, scr, labscr = out_dirs
+    with open(err + ID + ".errors.txt", 'w') as f_err:
+        if oov_mask.any():
+            rows, cols = np.triu_indices(len(labels), 1)
+            for i, j in zip(rows, cols):
+                if oov_mask[i] or oov_mask[j]:
+                    f_err.write("%s%s%s\n" % (labels[i].ljust(20), labels[j].ljust(20), -100))
+    with open(lab + ID + ".labels.txt", 'w') as f_lab:
+        for label in in_labels:
+            f_lab.write("%s\n" % (label))
+    rows, cols = np.triu_indices(len(in_labels), 1)
+    with open(scr + ID + ".scores.txt", 'w') as f_scr, open(labscr + ID + ".txt", 'w') as f_labscr:
+        for i, j, relatedness in zip(rows, cols, scores):
+            f_labscr.write("%s%s%s\n" % (in_labels[i].ljust(20), in_labels[j].ljust(20), relatedness))
+            f_scr.write("%s\n" % (relatedness))
+
+
+def score_file(scorer, in_file, ID, out_dirs):
+    """Score a file of word pairs one line at a time."""
+    # Get all our needed files open for business.
+    err, lab, scr, labscr = out_dirs
+    f_in = open(in_file, 'r')
+    f_err = open(err + ID + ".errors.txt", 'w')
+    f_lab = open(lab + ID + ".labels.txt", 'w')
+    f_scr = open(scr + ID + ".scores.txt", 'w')
+    f_labscr = open(labscr + ID + ".txt", 'w')
+
+    # Calculate n-1 for original number of labels used to generate the all-pairs list.
+    cnt = 0
+    for cnt, l in enumerate(f_in):
+        pass
+    n_minus = math.floor(math.sqrt(cnt * 2))
+    f_in.seek(0)
+
+    # Calculate relatedness scores.
+    linecnt = n_minus
+    for line in f_in:
+        # Keeping track of when to write to the labels file.
+        if (linecnt == 0):
+            n_minus -= 1
+            linecnt = n_minus
+        array = []
+        # Get the relatedness score, and write to the appropriate file(s).
+        for word in line.split():
+            array.append(word)
+        try:
+            input_term1 = array[0]
+            input_term2 = array[1]
+            relatedness = scorer.score_pair(input_term1, input_term2)
+            if relatedness == -100:
+                # One of the words wasn't in the vocabulary, so write to the error file.
+                metrics.count('oov_pairs')
+                f_err.write("%s%s%s\n" % (input_term1.ljust(20), input_term2.ljust(20), relatedness))
+            else:
+                metrics.count('pairs_scored')
+                f_labscr.write("%s%s%s\n" % (input_term1.ljust(20), input_term2.ljust(20), relatedness))
+                f_scr.write("%s\n" % (relatedness))
+                if (linecnt == 1):
+                    f_lab.write("%s\n" % (array[0]))
+                if ((linecnt == 1) and (n_minus == 1)):
+                    f_lab.write("%s\n" % (array[1]))
+            linecnt -= 1
+        except:
+            print('Need a word pair but got:')
+            for w in array:
+                print(w)
+            print(f'from file {os.path.basename(in_file)}')
+    # Close up shop for this round of processing.
+    f_labscr.close()
+    f_scr.close()
+    f_lab.close()
+    f_err.close()
+    f_in.close()
+
+
+def score_table_set(task):
+    """Score one set read from a label table, returning its scores for the parent process to write."""
+    ID, labels = task
+    in_labels, oov_mask, scores = scorer.score_set(labels)
+    scorer.flush_cache()
+    return in_labels, scores, [label for label, oov in zip(labels, oov_mask) if oov]
+
+
+def score_pairs_file(task, out_dirs=None, batched=False):
+    """Score one pairs file with this process's scorer. Without out_dirs, the scores are returned for
+    the parent process to write to a binary container; otherwise, the four text files are written."""
+    in_file, ID = task
+    if out_dirs is None:
+        # Binary containers are written by the parent process, so the scores are returned.
+        labels = similarity.labels_from_pairs(in_file)
+        in_labels, oov_mask, scores = scorer.score_set(labels)
+        scorer.flush_cache()
+        return in_labels, scores, [label for label, oov in zip(labels, oov_mask) if oov]
+    if batched:
+        score_file_batched(scorer, in_file, ID, out_dirs)
+    else:
+        # Scoring, reading and writing are interleaved line by line, so they're timed as one stage.
+        with metrics.stage('score_lines'):
+            score_file(scorer, in_file, ID, out_dirs)
+    scorer.flush_cache()
+
+
+def manifest_params(run_manifest, scorer, batched=False, output_format='text', vocab_file=None):
+    """The options that change the scores written."""
+    return {'vectors': ensemble.fingerprint([scorer.vectors_file] + (scorer.ensemble_files or []),
+                                            run_manifest.fingerprint),
+            'combine': scorer.combine, 'batched': batched,
+            'output_format': output_format,
+            'vocab': None if vocab_file is None else manifest.hash_files([vocab_file]),
+            'precision': scorer.precision}
+
+
+def container_path(output_dir, shard_size=None):
+    """The binary score container written to output_dir, or its directory of shards."""
+    if shard_size is None:
+        return os.path.join(output_dir, "scores" + score_store.SUFFIX)
+    return os.path.join(output_dir, "Scores")
+
+
+def score_label_table(scorer, source_dir, output_dir, shard_size=None, workers=1, filter_vocab=False, grouped=True,
+                      run_manifest=None):
+    """Score every set in a label table into a binary score container, reading a batch of sets at a time.
+    Raises ValueError if grouped and a set's rows aren't all together, once the sets before it are written."""
+    container = container_path(output_dir, shard_size)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    if filter_vocab:
+        scorer.words = label_table.table_words(source_dir)
+    if scorer.cache_file is None:
+        # Without a cache, every pair is computed, so load the embeddings before any workers start.
+        scorer.embeddings()
+    written, skipped = [], 0
+    with score_store.ScoreWriter(container, shard_size, append=run_manifest is not None) as writer:
+        sets = label_table.iter_sets(source_dir, grouped=grouped)
+        for batch in label_table.batches(sets, TABLE_BATCH_SETS):
+            if run_manifest is not None:
+                input_hashes = {ID: manifest.hash_params(labels) for ID, labels in batch}
+                remaining = [task for task in batch if not run_manifest.is_current(task[0], input_hashes[task[0]])]
+                skipped += len(batch) - len(remaining)
+                batch = remaining
+            for (ID, _), result, error in parallel.map_sets(score_table_set, batch, workers, init_worker,
+                                                            (scorer, scorer.cache_file is None)):
+                if error is not None:
+                    print(f"Unable to score set {ID}:\n{error}")
+                    continue
+                with metrics.stage('write'):
+                    writer.write(ID, *result)
+                if run_manifest is not None:
+                    written.append((ID, input_hashes[ID]))
+    if run_manifest is not None:
+        print(f"{skipped} sets are unchanged, and were skipped.")
+        # Container writes are only complete once the writer is closed, so sets are recorded after it is.
+        for ID, input_hash in written:
+            run_manifest.record(ID, input_hash, [container])
+
+
+def score_pairs_dir(scorer, source_dir, output_dir, output_format='text', batched=False, shard_size=None, workers=1,
+                    filter_vocab=False, run_manifest=None):
+    """Score every pairs file in source_dir, writing text files per set or a binary score container to output_dir."""
+    tasks = []
+    for subdir, dirs, files in os.walk(source_dir):
+        for file in files:
+            # Check to see whether the ID list generated in create_all_pairs.py is in the input directory.
+            # If it is, move it.
+            if (file == "ID_list.txt"):
+                shutil.copyfile((subdir + "/" + file), (output_dir + file))
+                os.remove(subdir + "/" + file)
+
+            ID = file.rstrip().split("_")[0]  # relies on file name beginning with ID_
+
+            # On Mac, automatically generated .DS_Store files will cause an error, so ignore hidden files.
+            if not ((file.startswith('.')) or (file == "ID_list.txt")):
+                tasks.append((subdir + '/' + file, ID))
+    writer = None
+    out_dirs = None
+    if output_format == 'binary':
+        container = container_path(output_dir, shard_size)
+    else:
+        out_dirs = make_output_subdirs(output_dir)
+    written = []
+    if run_manifest is not None:
+        input_hashes = {task: manifest.hash_files([task[0]]) for task in tasks}
+        remaining = [task for task in tasks if not run_manifest.is_current(task[1], input_hashes[task])]
+        print(f"{len(tasks) - len(remaining)} of {len(tasks)} pairs files are unchanged, and will be skipped.")
+        tasks = remaining
+    if output_format == 'binary' and tasks:
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        writer = score_store.ScoreWriter(container, shard_size, append=run_manifest is not None)
+    if filter_vocab:
+        scorer.words = pairs_words([in_file for in_file, _ in tasks])
+    if scorer.cache_file is None and tasks:
+        # Without a cache, every pair is computed, so load the embeddings before any workers start.
+        scorer.embeddings()
+    # Sets are scored independently, so they can be spread across worker processes.
+    score_func = functools.partial(score_pairs_file, out_dirs=out_dirs, batched=batched)
+    for task, result, error in parallel.map_sets(score_func, tasks, workers, init_worker,
+                                                 (scorer, scorer.cache_file is None)):
+        in_file, ID = task
+        if error is not None:
+            print(f"Unable to score {in_file}:\n{error}")
+            continue
+        if writer is not None:
+            with metrics.stage('write'):
+                writer.write(ID, *result)
+        if run_manifest is not None:
+            # Container writes are only complete once the writer is closed, so binary sets
+            # are recorded after it is.
+            if writer is None:
+                run_manifest.record(ID, input_hashes[task], output_files(ID, out_dirs))
+            else:
+                written.append(task)
+    if writer is not None:
+        writer.close()
+    if run_manifest is not None:
+        for task in written:
+            run_manifest.record(task[1], input_hashes[task], [container])
+
+
+def score_interactively(scorer, index_dir=None, k=10):
+    """Get pairs of words from the command line and print relatedness scores to standard out."""
+    while True:
+        input_term1 = input("\nEnter the first of two words (type EXIT to quit): ")
+        if input_term1 == 'EXIT':
+            break
+        input_term2 = input("Enter the second of two words (leave blank to list the first word's nearest \
+neighbours, type EXIT to quit): ")
+        if input_term2 == 'EXIT':
+            break
+        elif not input_term2.strip():
+            print_neighbors(scorer, input_term1.strip(), index_dir, k)
+        else:
+            relatedness = scorer.score_pair(input_term1, input_term2)
+            if relatedness == -100:
+                print("Oops! One of your words wasn't in the vocabulary.")
+                for word in [input_term1, input_term2]:
+                    if word not in scorer.embeddings()[1]:
+                        print_neighbors(scorer, word, index_dir, k)
+            else:
+                print("From -1 to 1, the similarity of %s and %s is %f." % (input_term1, input_term2, relatedness))
+
+
+def main():
+    global scorer
+    parser = argparse.ArgumentParser()
+    parser.add_argument('vectors_file', help='a file of word-features vectors, or a directory containing \
+an embedding store created by embedding_store.py', type=str)
+    parser.add_argument('--vocab_file', help='a file of vocabulary words, one per line; only these words are loaded \
+from vectors_file, and all others are out of vocabulary. If not given, every word in vectors_file is loaded', default=None, type=str)
+    parser.add_argument('--filter_vocab', help="load only the vectors for words in the pairs files in --source_dir",
+                        action='store_true')
+    parser.add_argument('--precision', help="the precision vectors are held at in memory; by default, a store's own \
+precision, or float64 for a text vectors file", default=None, choices=embedding_store.PRECISIONS)
+    parser.add_argument('--parse_workers', help="the number of processes used to parse a text vectors file; one per \
+CPU if not given", default=None, type=int)
+    parser.add_argument('--source_dir',
+                        help="an optional directory containing lists of word pairs to score;\
+                     requires a value for output_dir",
+                        default=None, type=str)
+    parser.add_argument('--output_dir', help="a directory to write relatedness value files to", default=None, type=str)
+    parser.add_argument('--batched', help="score each file of word pairs as a set, using one matrix multiply per set",
+                        action='store_true')
+    parser.add_argument('--unique', help="with --batched or binary output, score each distinct label in a set once, \
+and repeat its scores for duplicate labels", action='store_true')
+    parser.add_argument('--workers', help="the number of processes used to score files of word pairs in parallel",
+                        default=1, type=int)
+    parser.add_argument('--output_format', help="write text files per set, or one binary score container per run",
+                        default='text', choices=['text', 'binary'], type=str)
+    parser.add_argument('--shard_size', help="with binary output, the number of sets per container shard; \
+by default all sets go in one container", default=None, type=int)
+    parser.add_argument('--cache_file', help="a similarity cache database, created if it doesn't exist", default=None,
+                        type=str)
+    parser.add_argument('--cache_size', help="the maximum number of word pairs kept in the similarity cache",
+                        default=similarity_cache.DEFAULT_MAX_ENTRIES, type=int)
+    parser.add_argument('--serve', help="instead of reading pairs of words interactively, serve similarity requests \
+over HTTP", action='store_true')
+    parser.add_argument('--host', help="the host address to serve on", default='127.0.0.1', type=str)
+    parser.add_argument('--port', help="the port to serve on", default=8765, type=int)
+    parser.add_argument('--socket', help="a Unix socket path to serve on, instead of a TCP port", default=None,
+                        type=str)
+    parser.add_argument('--index_dir', help="a directory where the nearest neighbour and spelling indexes used by the \
+interactive loop are kept; if not given, they're built in memory", default=None, type=str)
+    parser.add_argument('--neighbors', help="the number of nearest neighbours listed in the interactive loop",
+                        default=10, type=int)
+    parser.add_argument('--metrics', help="a .json or .csv file where run metrics are written", default=None, type=str)
+    parser.add_argument('--profile', help="a file where cProfile stats for the run are written", default=None, type=str)
+    parser.add_argument('--incremental', help="skip pairs files that are unchanged since they were last scored into \
+output_dir", action='store_true')
+    parser.add_argument('--ensemble', help="more vectors files or stores, to score pairs with alongside vectors_file, \
+over the words they all share", nargs='+', default=None, type=str)
+    parser.add_argument('--combine', help="how an ensemble's scores for each pair are combined", default='mean',
+                        choices=ensemble.COMBINE)
+    parser.add_argument('--ungrouped', help="a label table's rows for each set aren't all together, so group them \
+through temporary files", action='store_true')
+    args = parser.parse_args()
+    if args.source_dir is not None and label_table.is_label_table(args.source_dir) and args.output_format != 'binary':
+        parser.error("A label table in --source_dir is scored into a binary score container; pass --output_format binary.")
+    if args.ensemble and (args.cache_file is not None or args.serve):
+        parser.error("--ensemble can't be used with --cache_file or --serve, which score with vectors_file alone.")
+    if args.vocab_file is not None and args.cache_file is not None:
+        parser.error("--vocab_file can't be used with --cache_file, since pairs with words left out would be cached as \
+out of vocabulary.")
+
+    metrics.start(args.metrics, args.profile)
+    # With --vocab_file, only the vectors for the words listed are loaded; --filter_vocab sets the words
+    # once the pairs files or label table to be scored are known.
+    scorer = PairScorer(args.vectors_file, None if args.vocab_file is None else read_vocab_file(args.vocab_file),
+                        args.precision, args.parse_workers, args.ensemble, args.combine, args.cache_file,
+                        args.cache_size, args.unique)
+    filter_vocab = args.filter_vocab and args.vocab_file is None
     if args.source_dir is not None and args.output_dir is not None:
         # We are reading from one or more files containing word pair lists, and writing
         # pairwise relatedness scores to an output file.
-        if os.path.isdir(args.source_dir):
-            for subdir, dirs, files in os.walk(args.source_dir):
-                for file in files:
-                    # Check to see whether the ID list generated in create_all_pairs.py is in the input directory.
-                    # If it is, move it.
-                    if (file == "ID_list.txt"):
-                        shutil.copyfile((subdir + "/" + file), (args.output_dir + file))
-                        os.remove(subdir + "/" + file)
-
-                    ID = file.rstrip().split("_")[0]  # relies on file name beginning with ID_
-
-                    # On Mac, automatically generated .DS_Store files will cause an error, so ignore hidden files.
-                    if not ((file.startswith('.')) or (file == "ID_list.txt")):
-                        # Get all our needed files open for business.
-                        f_in = open(subdir + '/' + file, 'r')
-                        f_err = open(err + ID + ".errors.txt", 'w')
-                        f_lab = open(lab + ID + ".labels.txt", 'w')
-                        f_scr = open(scr + ID + ".scores.txt", 'w')
-                        f_labscr = open(labscr + ID + ".txt", 'w')
-
-                        # Calculate n-1 for original number of labels used to generate the all-pairs list.
-                        cnt = 0
-                        for cnt, l in enumerate(f_in):
-                            pass
-                        n_minus = math.floor(math.sqrt(cnt * 2))
-                        f_in.seek(0)
-
-                        # Calculate relatedness scores.
-                        linecnt = n_minus
-                        for line in f_in:
-                            # Keeping track of when to write to the labels file.
-                            if (linecnt == 0):
-                                n_minus -= 1
-                                linecnt = n_minus
-                            array = []
-                            # Get the relatedness score, and write to the appropriate file(s).
-                            for word in line.split():
-                                array.append(word)
-                            try:
-                                input_term1 = array[0]
-                                input_term2 = array[1]
-                                relatedness = distance(W, vocab, input_term1, input_term2)
-                                if relatedness == -100:
-                                    # One of the words wasn't in the vocabulary, so write to the error file.
-                                    f_err.write("%s%s%s\n" % (input_term1.ljust(20), input_term2.ljust(20), relatedness))
-                                else:
-                                    f_labscr.write("%s%s%s\n" % (input_term1.ljust(20), input_term2.ljust(20), relatedness))
-                                    f_scr.write("%s\n" % (relatedness))
-                                    if (linecnt == 1):
-                                        f_lab.write("%s\n" % (array[0]))
-                                    if ((linecnt == 1) and (n_minus == 1)):
-                                        f_lab.write("%s\n" % (array[1]))
-                                linecnt -= 1
-                            except:
-                                print('Need a word pair but got:')
-                                for w in array:
-                                    print(w)
-                                print(f'from file {file}')
-                        # Close up shop for this round of processing.
-                        f_labscr.close()
-                        f_scr.close()
-                        f_lab.close()
-                        f_err.close()
-                        f_in.close()
+        run_manifest = None
+        if args.incremental and (label_table.is_label_table(args.source_dir) or os.path.isdir(args.source_dir)):
+            run_manifest = manifest.Manifest(args.output_dir, "word_pair_distance")
+            run_manifest.set_params(manifest_params(run_manifest, scorer, args.batched, args.output_format,
+                                                    args.vocab_file))
+        if label_table.is_label_table(args.source_dir):
+            try:
+                score_label_table(scorer, args.source_dir, args.output_dir, args.shard_size, args.workers,
+                                  filter_vocab, not args.ungrouped, run_manifest)
+            except label_table.UngroupedSetsError as e:
+                # Sets that aren't grouped are only found partway through the table; the container is still closed.
+                parser.error(f"{e} The score container only holds the sets before it.")
+        elif os.path.isdir(args.source_dir):
+            score_pairs_dir(scorer, args.source_dir, args.output_dir, args.output_format, args.batched, args.shard_size,
+                            args.workers, filter_vocab, run_manifest)
         else:
             print("The source directory is empty, or you input a file name rather than a directory name: exiting.")
+        if run_manifest is not None:
+            run_manifest.close()
+    elif args.serve:
+        # Keep the embeddings loaded, and answer similarity requests from other programs.
+        import similarity_server
+        similarity_server.serve(*scorer.embeddings(), host=args.host, port=args.port, socket_path=args.socket)
     else:
-        # Get pairs of words from the command line and print relatedness scores to standard out.
-        while True:
-            input_term1 = input("\nEnter the first of two words (type EXIT to quit): ")
-            if input_term1 == 'EXIT':
-                break
-            input_term2 = input("Enter the second of two words (type EXIT to quit): ")
-            if input_term2 == 'EXIT':
-                break
-            else:
-                relatedness = distance(W, vocab, input_term1, input_term2)
-                if relatedness == -100:
-                    print("Oops! One of your words wasn't in the vocabulary.")
-                else:
-                    print("From -1 to 1, the similarity of %s and %s is %f." % (input_term1, input_term2, relatedness))
+        score_interactively(scorer, args.index_dir, args.neighbors)
+    scorer.close()
+
+
+if __name__ == "__main__":
+    main()